@@ -16,23 +16,24 @@ sys.path.insert(0, src_dir)
 # CORRECTED IMPORTS
 from app.db.session import SessionLocal, engine
 from app.db import models
+from app.modules.search import fulltext
 
 def cleanup_database():
     """Remove all data from the database."""
     print("🧹 Cleaning up database...")
     db = SessionLocal()
     try:
-        # Delete all data from tables in correct order (respecting foreign keys)
+        # Delete all data from every table, children before parents so foreign keys hold
         print("Deleting data from tables...")
-        db.execute(text("DELETE FROM notifications"))      # New table
-        db.execute(text("DELETE FROM learned_heuristics")) # New table
-        db.execute(text("DELETE FROM audit_logs"))
-        db.execute(text("DELETE FROM invoices"))
-        db.execute(text("DELETE FROM goods_receipt_notes"))
-        db.execute(text("DELETE FROM purchase_orders"))
-        db.execute(text("DELETE FROM jobs"))
-        db.execute(text("DELETE FROM vendor_settings")) 
-        db.execute(text("DELETE FROM automation_rules")) # New table
+        tables = models.Base.metadata.sorted_tables
+        if engine.dialect.name == "postgresql":
+            table_names = ", ".join(f'"{table.name}"' for table in tables)
+            db.execute(text(f"TRUNCATE TABLE {table_names} RESTART IDENTITY CASCADE"))
+        else:
+            for table in reversed(tables):
+                db.execute(table.delete())
+        fulltext.ensure_search_index(engine)
+        fulltext.clear_index(db)                         # Full-text search index
         
         db.commit()
         print("✅ Database cleaned successfully!")
@@ -62,6 +63,12 @@ def reset_database():
         # This will create all tables including the new ones
         models.Base.metadata.create_all(bind=engine)
         print("✅ Recreated all tables.")
+
+        # The full-text index is not part of the ORM metadata, so empty it separately
+        fulltext.ensure_search_index(engine)
+        with SessionLocal() as db:
+            fulltext.clear_index(db)
+            db.commit()
         
     except Exception as e:
         print(f"❌ Error resetting database: {e}")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Starts a throwaway local PostgreSQL server without Docker, for running the backend
+(or ad-hoc tests) against Postgres instead of SQLite.
+
+Uses the optional `pgserver` package (pip install pgserver), which bundles the Postgres
+binaries, or falls back to `initdb`/`pg_ctl` found on PATH.
+
+Usage:
+    python scripts/local_postgres.py             # start and print the DATABASE_URL
+    python scripts/local_postgres.py --stop      # stop the server
+    export DATABASE_URL=$(python scripts/local_postgres.py --url-only)
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PGDATA = os.environ.get("LOCAL_PGDATA", os.path.join(project_root, ".pgdata"))
+DATABASE_NAME = "ap_agent"
+DEFAULT_PORT = 55432
+
+
+def _free_port(preferred: int) -> int:
+    with socket.socket() as s:
+        if s.connect_ex(("127.0.0.1", preferred)) != 0:
+            return preferred
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_with_pgserver() -> str:
+    import pgserver
+    # cleanup_mode=None keeps the server running after this script exits
+    server = pgserver.get_server(PGDATA, cleanup_mode=None)
+    existing = server.psql(f"SELECT 1 FROM pg_database WHERE datname = '{DATABASE_NAME}';")
+    if "(0 rows)" in existing:
+        server.psql(f"CREATE DATABASE {DATABASE_NAME};")
+    # pgserver hands out a libpq URI; SQLAlchemy needs the postgresql+psycopg2 scheme
+    return server.get_uri(DATABASE_NAME).replace("postgresql://", "postgresql+psycopg2://", 1)
+
+
+def _start_with_pg_ctl() -> str:
+    port_file = os.path.join(PGDATA, "port")
+    if not os.path.exists(os.path.join(PGDATA, "PG_VERSION")):
+        subprocess.run(["initdb", "-D", PGDATA, "-U", "postgres", "--auth=trust"],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(port_file, "w") as f:
+            f.write(str(_free_port(DEFAULT_PORT)))
+    with open(port_file) as f:
+        port = int(f.read())
+
+    status = subprocess.run(["pg_ctl", "-D", PGDATA, "status"], stdout=subprocess.DEVNULL)
+    if status.returncode != 0:
+        subprocess.run(["pg_ctl", "-D", PGDATA, "-l", os.path.join(PGDATA, "server.log"),
+                        "-o", f"-p {port} -k {PGDATA}", "-w", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    exists = subprocess.run(["psql", "-h", PGDATA, "-p", str(port), "-U", "postgres", "-tAc",
+                             f"SELECT 1 FROM pg_database WHERE datname = '{DATABASE_NAME}'"],
+                            check=True, capture_output=True, text=True).stdout.strip()
+    if not exists:
+        subprocess.run(["createdb", "-h", PGDATA, "-p", str(port), "-U", "postgres", DATABASE_NAME], check=True)
+    return f"postgresql+psycopg2://postgres@localhost:{port}/{DATABASE_NAME}"
+
+
+def start() -> str:
+    try:
+        return _start_with_pgserver()
+    except ImportError:
+        pass
+    if shutil.which("pg_ctl") and shutil.which("initdb"):
+        return _start_with_pg_ctl()
+    sys.exit("❌ No local Postgres available: run `pip install pgserver` or install the PostgreSQL server binaries.")
+
+
+def stop():
+    if not os.path.exists(os.path.join(PGDATA, "PG_VERSION")):
+        print("No local Postgres data directory found.")
+        return
+    try:
+        import pgserver
+        pgserver.get_server(PGDATA, cleanup_mode="stop").cleanup()
+    except ImportError:
+        subprocess.run(["pg_ctl", "-D", PGDATA, "-m", "fast", "stop"], check=False)
+    print("🛑 Local Postgres stopped.")
+
+
+if __name__ == "__main__":
+    if "--stop" in sys.argv:
+        stop()
+    else:
+        url = start()
+        if "--url-only" in sys.argv:
+            print(url)
+        else:
+            print(f"🐘 Local Postgres running (data in {PGDATA}).")
+            print(f"export DATABASE_URL=\"{url}\"")
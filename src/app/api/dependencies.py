@@ -1,5 +1,5 @@
 # src/app/api/dependencies.py
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 
 def get_db():
     """
@@ -9,4 +9,14 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """
+    FastAPI dependency that provides an AsyncSession, for `async def` endpoints.
+    Existing sync helpers can run against it via `await db.run_sync(fn, ...)`,
+    which hands `fn` a regular Session whose I/O is awaited on the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -7,9 +7,19 @@ from pydantic import BaseModel
 
 from app.api.dependencies import get_db
 from app.db import models, schemas
+from app.db.functions import days_between
+from app.core import cache, config_cache, scheduler
+from app.modules.automation import rules
 
 router = APIRouter()
 
+
+def _validate_rule_conditions(conditions):
+    try:
+        rules.validate_conditions(conditions)
+    except rules.RuleCompileError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule conditions: {e}")
+
 # --- NEW SCHEMA for Vendor Performance ---
 class VendorPerformanceSummary(schemas.VendorSetting):
     total_invoices: int
@@ -26,12 +36,14 @@ def get_vendor_performance_summary(db: Session = Depends(get_db)):
     vendor_names = [s.vendor_name for s in settings]
     
     # Pre-calculate stats for all vendors with settings
+    # Lifetime stats, so read through the history view that includes archived invoices
+    Invoice = models.InvoiceHistory
     invoice_stats = db.query(
-        models.Invoice.vendor_name,
-        func.count(models.Invoice.id).label('total_invoices'),
-        (cast(func.sum(case((models.Invoice.status == models.DocumentStatus.needs_review, 1), else_=0)), Float) / cast(func.count(models.Invoice.id), Float) * 100).label('exception_rate'),
-        func.avg(func.julianday(models.Invoice.paid_date) - func.julianday(models.Invoice.invoice_date)).label('avg_payment_days')
-    ).filter(models.Invoice.vendor_name.in_(vendor_names)).group_by(models.Invoice.vendor_name).all()
+        Invoice.vendor_name,
+        func.count(Invoice.id).label('total_invoices'),
+        (cast(func.sum(case((Invoice.status == models.DocumentStatus.needs_review, 1), else_=0)), Float) / cast(func.count(Invoice.id), Float) * 100).label('exception_rate'),
+        func.avg(days_between(Invoice.paid_date, Invoice.invoice_date)).label('avg_payment_days')
+    ).filter(Invoice.vendor_name.in_(vendor_names)).group_by(Invoice.vendor_name).all()
 
     stats_map = {row.vendor_name: row for row in invoice_stats}
     
@@ -96,6 +108,7 @@ def get_all_automation_rules(db: Session = Depends(get_db)):
 @router.post("/automation-rules", response_model=schemas.AutomationRule, status_code=status.HTTP_201_CREATED)
 def create_new_automation_rule(rule_data: schemas.AutomationRuleCreate, db: Session = Depends(get_db)):
     """Creates a new automation rule."""
+    _validate_rule_conditions(rule_data.conditions)
     new_rule = models.AutomationRule(**rule_data.model_dump())
     db.add(new_rule)
     db.commit()
@@ -108,7 +121,8 @@ def update_automation_rule(rule_id: int, rule_data: schemas.AutomationRuleCreate
     rule = db.query(models.AutomationRule).filter(models.AutomationRule.id == rule_id).first()
     if not rule:
         raise HTTPException(status_code=404, detail="Automation rule not found")
-        
+    _validate_rule_conditions(rule_data.conditions)
+
     update_data = rule_data.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(rule, key, value)
@@ -126,4 +140,27 @@ def delete_automation_rule(rule_id: int, db: Session = Depends(get_db)):
         
     db.delete(rule)
     db.commit()
-    return 
\ No newline at end of file
+    return 
+# --- Scheduler status ---
+@router.get("/scheduler")
+def get_scheduler_status(job_name: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """Returns the shared schedule of recurring jobs and their most recent runs."""
+    jobs = db.query(models.ScheduledJob).order_by(models.ScheduledJob.name).all()
+    runs = scheduler.recent_runs(db, job_name, min(max(limit, 1), 500))
+    return {
+        "jobs": [{
+            "name": job.name, "next_run_at": job.next_run_at, "locked_by": job.locked_by,
+            "locked_until": job.locked_until, "last_started_at": job.last_started_at,
+            "last_finished_at": job.last_finished_at, "last_status": job.last_status,
+        } for job in jobs],
+        "runs": [{
+            "id": run.id, "job_name": run.job_name, "worker": run.worker, "started_at": run.started_at,
+            "finished_at": run.finished_at, "duration_ms": run.duration_ms, "status": run.status, "error": run.error,
+        } for run in runs],
+    }
+
+# --- Cache metrics ---
+@router.get("/caches")
+def get_cache_metrics():
+    """Hit/miss/eviction counters of this worker's caches and cached configuration sections."""
+    return {"caches": cache.metrics(), "config_sections": config_cache.cache_info()}
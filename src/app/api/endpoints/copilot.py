@@ -1,20 +1,71 @@
 # src/app/api/endpoints/copilot.py
-from fastapi import APIRouter, Depends, Body
+import asyncio
+from fastapi import APIRouter, Body, Request
+from fastapi.responses import StreamingResponse
 from typing import Dict
 
+from app.config import settings
+from app.core import events
 from app.db import schemas
 from app.modules.copilot import agent
 
 router = APIRouter()
 
 @router.post("/chat")
-def chat_with_copilot(request: schemas.ChatRequest = Body(...)) -> Dict:
+async def chat_with_copilot(request: schemas.ChatRequest = Body(...)) -> Dict:
     """
     Main endpoint for interacting with the Supervity Copilot.
     Receives a user message and optional context, and returns a structured
     response for the UI.
     """
-    return agent.invoke_agent(
+    return await agent.invoke_agent(
         user_message=request.message,
         current_invoice_id=request.current_invoice_id
-    ) 
\ No newline at end of file
+    )
+
+@router.post("/chat/stream", summary="Streaming Copilot Chat")
+async def stream_chat_with_copilot(request: Request, chat: schemas.ChatRequest = Body(...)):
+    """
+    Same as /chat, but streamed as Server-Sent Events while the answer is produced:
+    `token` events carry model text as it arrives, `tool_call.started` and
+    `tool_call.finished` bracket tool execution, and a single `final` event carries
+    the responseText/uiAction/data payload that /chat would return. Stops working on
+    the answer if the client disconnects.
+    """
+    agent_events = agent.stream_agent(chat.message, chat.current_invoice_id)
+
+    async def event_source():
+        next_event = None
+        try:
+            while True:
+                if next_event is None:
+                    next_event = asyncio.ensure_future(agent_events.__anext__())
+                # Tool calls and model latency can leave the stream idle; keep proxies from closing it
+                done, _ = await asyncio.wait({next_event}, timeout=settings.event_stream_heartbeat_s)
+                if await request.is_disconnected():
+                    break
+                if not done:
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    event_data = next_event.result()
+                except StopAsyncIteration:
+                    break
+                next_event = None
+                yield events.format_sse(event_data)
+        finally:
+            if next_event is not None and not next_event.done():
+                next_event.cancel()
+                # Let the generator unwind from the cancellation before closing it
+                try:
+                    await next_event
+                except BaseException:
+                    pass
+            await agent_events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,13 +1,18 @@
 # src/app/api/endpoints/dashboard.py
 from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, Query as SQLQuery
-from sqlalchemy import func, case, desc, cast, Float
+from sqlalchemy import func, case, desc, cast, Float, select
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 from collections import Counter
 
-from app.api.dependencies import get_db
+from app.api.dependencies import get_async_db
+from app.core import kpi_rollups
 from app.db import models, schemas
+from app.db.functions import days_between, utc_now
+from app.utils.pagination import invoice_summary_options
 
 router = APIRouter()
 
@@ -22,33 +27,51 @@ def _get_date_filtered_query(db: Session, model, start_date: Optional[date] = No
     return query
 
 # --- UPDATED ENDPOINTS ---
+# The dashboard endpoints are async: the sync query code below runs through
+# AsyncSession.run_sync, so a slow aggregate does not tie up a threadpool worker.
+# run_sync executes its Python on the event loop, so only query code belongs in it;
+# heavier post-processing is handed to the threadpool.
 
 @router.get("/summary", summary="Get Basic Summary")
-def get_dashboard_summary(
-    db: Session = Depends(get_db),
+async def get_dashboard_summary(
+    db: AsyncSession = Depends(get_async_db),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None)
 ):
     """Provides high-level KPI numbers for the main dashboard view, filterable by date."""
-    base_query = _get_date_filtered_query(db, models.Invoice, start_date, end_date)
-
-    total_value_exceptions = base_query.filter(
-        models.Invoice.status == models.DocumentStatus.needs_review,
-        models.Invoice.grand_total.isnot(None)
-    ).with_entities(func.sum(models.Invoice.grand_total)).scalar() or 0.0
+    return await db.run_sync(compute_dashboard_summary, start_date, end_date)
+
+def compute_dashboard_summary(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    # Counted over InvoiceHistory (hot + archived), the same base as the KPIs below.
+    # Invoice counts come from the daily rollups; a scan is only needed before they are first built
+    totals = kpi_rollups.status_totals(db, start_date, end_date)
+    if totals is not None:
+        total_invoices = sum(count for count, _ in totals.values())
+        requires_review, total_value_exceptions = totals.get(models.DocumentStatus.needs_review, (0, 0.0))
+        pending_match = totals.get(models.DocumentStatus.matching, (0, 0.0))[0]
+    else:
+        History = models.InvoiceHistory
+        base_query = _get_date_filtered_query(db, History, start_date, end_date)
+        total_invoices = base_query.count()
+        requires_review = base_query.filter(History.status == models.DocumentStatus.needs_review).count()
+        pending_match = base_query.filter(History.status == models.DocumentStatus.matching).count()
+        total_value_exceptions = base_query.filter(
+            History.status == models.DocumentStatus.needs_review,
+            History.grand_total.isnot(None)
+        ).with_entities(func.sum(History.grand_total)).scalar() or 0.0
 
     # Get kpis for the same period to calculate touchless count
-    kpis = get_advanced_kpis(db, start_date, end_date)
+    kpis = compute_advanced_kpis(db, start_date, end_date)
     op_eff = kpis.get("operational_efficiency", {})
     touchless_rate = op_eff.get("touchless_invoice_rate_percent", 0)
     total_processed = op_eff.get("total_processed_invoices", 0)
     auto_approved_count = round((touchless_rate / 100) * total_processed)
 
     summary = {
-        "total_invoices": base_query.count(),
-        "requires_review": base_query.filter(models.Invoice.status == models.DocumentStatus.needs_review).count(),
+        "total_invoices": total_invoices,
+        "requires_review": requires_review,
         "auto_approved": auto_approved_count,
-        "pending_match": base_query.filter(models.Invoice.status == models.DocumentStatus.matching).count(),
+        "pending_match": pending_match,
         # POs and GRNs are not date-filtered as they are master data
         "total_pos": db.query(models.PurchaseOrder).count(),
         "total_grns": db.query(models.GoodsReceiptNote).count(),
@@ -57,23 +80,30 @@ def get_dashboard_summary(
     return summary
 
 @router.get("/kpis", summary="Get Advanced Business KPIs")
-def get_advanced_kpis(
-    db: Session = Depends(get_db),
+async def get_advanced_kpis(
+    db: AsyncSession = Depends(get_async_db),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None)
 ):
     """Provides a comprehensive set of Key Performance Indicators, filterable by date."""
-    base_query = _get_date_filtered_query(db, models.Invoice, start_date, end_date)
+    return await db.run_sync(compute_advanced_kpis, start_date, end_date)
+
+def compute_advanced_kpis(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    """
+    Sync KPI calculation, shared by the endpoints above and the copilot tools.
+    Reads through InvoiceHistory so periods that include archived invoices still count them.
+    """
+    base_query = _get_date_filtered_query(db, models.InvoiceHistory, start_date, end_date)
 
     # --- Current Period Calculations ---
-    discounts_captured = base_query.filter(models.Invoice.status == models.DocumentStatus.paid, models.Invoice.paid_date <= models.Invoice.discount_due_date, models.Invoice.discount_amount.isnot(None)).with_entities(func.sum(models.Invoice.discount_amount)).scalar() or 0.0
+    discounts_captured = base_query.filter(models.InvoiceHistory.status == models.DocumentStatus.paid, models.InvoiceHistory.paid_date <= models.InvoiceHistory.discount_due_date, models.InvoiceHistory.discount_amount.isnot(None)).with_entities(func.sum(models.InvoiceHistory.discount_amount)).scalar() or 0.0
     
-    total_processed_invoices = base_query.filter(models.Invoice.status.in_([models.DocumentStatus.matched, models.DocumentStatus.paid, models.DocumentStatus.needs_review])).count()
-    invoices_in_review = base_query.filter(models.Invoice.status == models.DocumentStatus.needs_review).count()
+    total_processed_invoices = base_query.filter(models.InvoiceHistory.status.in_([models.DocumentStatus.matched, models.DocumentStatus.paid, models.DocumentStatus.needs_review])).count()
+    invoices_in_review = base_query.filter(models.InvoiceHistory.status == models.DocumentStatus.needs_review).count()
     touchless_invoices = total_processed_invoices - invoices_in_review
     touchless_rate_percent = (touchless_invoices / total_processed_invoices * 100) if total_processed_invoices > 0 else 0.0
     
-    avg_exception_age_hours_result = base_query.filter(models.Invoice.status == models.DocumentStatus.needs_review).with_entities(func.avg(func.julianday('now') - func.julianday(models.Invoice.updated_at)) * 24).scalar()
+    avg_exception_age_hours_result = base_query.filter(models.InvoiceHistory.status == models.DocumentStatus.needs_review).with_entities(func.avg(days_between(utc_now(), models.InvoiceHistory.updated_at)) * 24).scalar()
     avg_exception_age_hours = avg_exception_age_hours_result or 0
 
     # --- Previous Period Calculations for Trend ---
@@ -83,16 +113,16 @@ def get_advanced_kpis(
         prev_end_date = start_date - timedelta(days=1)
         prev_start_date = prev_end_date - duration
         
-        prev_base_query = _get_date_filtered_query(db, models.Invoice, prev_start_date, prev_end_date)
-        prev_total_processed = prev_base_query.filter(models.Invoice.status.in_([models.DocumentStatus.matched, models.DocumentStatus.paid, models.DocumentStatus.needs_review])).count()
-        prev_in_review = prev_base_query.filter(models.Invoice.status == models.DocumentStatus.needs_review).count()
+        prev_base_query = _get_date_filtered_query(db, models.InvoiceHistory, prev_start_date, prev_end_date)
+        prev_total_processed = prev_base_query.filter(models.InvoiceHistory.status.in_([models.DocumentStatus.matched, models.DocumentStatus.paid, models.DocumentStatus.needs_review])).count()
+        prev_in_review = prev_base_query.filter(models.InvoiceHistory.status == models.DocumentStatus.needs_review).count()
         prev_touchless = prev_total_processed - prev_in_review
         prev_touchless_rate = (prev_touchless / prev_total_processed * 100) if prev_total_processed > 0 else 0.0
     else:
         prev_touchless_rate = 0 # No trend if no date range
 
     # --- Vendor Performance (always on the selected period) ---
-    vendor_exception_query = base_query.with_entities(models.Invoice.vendor_name, (cast(func.sum(case((models.Invoice.status == models.DocumentStatus.needs_review, 1), else_=0)), Float) / cast(func.count(models.Invoice.id), Float) * 100).label('exception_rate')).group_by(models.Invoice.vendor_name).order_by(desc('exception_rate')).limit(5).all()
+    vendor_exception_query = base_query.with_entities(models.InvoiceHistory.vendor_name, (cast(func.sum(case((models.InvoiceHistory.status == models.DocumentStatus.needs_review, 1), else_=0)), Float) / cast(func.count(models.InvoiceHistory.id), Float) * 100).label('exception_rate')).group_by(models.InvoiceHistory.vendor_name).order_by(desc('exception_rate')).limit(5).all()
     top_vendors_by_exception = { vendor: f"{rate:.1f}%" for vendor, rate in vendor_exception_query if vendor and rate is not None }
 
     return {
@@ -126,8 +156,8 @@ def _map_trace_to_category(step_name: str, review_category: str) -> Optional[str
     return None
 
 @router.get("/exceptions", summary="Get Exception Summary")
-def get_exception_summary(
-    db: Session = Depends(get_db),
+async def get_exception_summary(
+    db: AsyncSession = Depends(get_async_db),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None)
 ):
@@ -135,26 +165,32 @@ def get_exception_summary(
     Provides a detailed summary of invoice exceptions by parsing the match trace
     for a more granular chart, filterable by date.
     """
+    # Only the query runs on the event loop; parsing the match traces goes to the threadpool
+    rows = await db.run_sync(_exception_rows, start_date, end_date)
+    return await run_in_threadpool(_summarize_exceptions, rows)
+
+def _exception_rows(db: Session, start_date: Optional[date], end_date: Optional[date]) -> List[tuple]:
     base_query = _get_date_filtered_query(db, models.Invoice, start_date, end_date)
-    invoices_in_review = base_query.filter(
+    return base_query.filter(
         models.Invoice.status == models.DocumentStatus.needs_review
-    ).all()
-    
+    ).with_entities(models.Invoice.match_trace, models.Invoice.review_category).all()
+
+def _summarize_exceptions(rows: List[tuple]) -> List[dict]:
     exception_counts = Counter()
     
-    for inv in invoices_in_review:
+    for match_trace, review_category in rows:
         found_specific_error = False
-        if inv.match_trace:
-            for step in inv.match_trace:
+        if match_trace:
+            for step in match_trace:
                 if step.get("status") == "FAIL":
-                    category = _map_trace_to_category(step.get("step", ""), inv.review_category)
+                    category = _map_trace_to_category(step.get("step", ""), review_category)
                     if category:
                         exception_counts[category] += 1
                         found_specific_error = True
         
         # Fallback for invoices that might not have a detailed trace but are in review
-        if not found_specific_error and inv.review_category:
-            fallback_category = inv.review_category.replace('_', ' ').title()
+        if not found_specific_error and review_category:
+            fallback_category = review_category.replace('_', ' ').title()
             exception_counts[fallback_category] += 1
             
     # Format for recharts: [{"name": "Category", "count": 5}, ...]
@@ -164,14 +200,13 @@ def get_exception_summary(
     return [{"name": name, "count": count} for name, count in sorted_exceptions]
 
 @router.get("/cost-roi", summary="Get Cost and ROI Metrics")
-def get_cost_roi_metrics(
-    db: Session = Depends(get_db),
+async def get_cost_roi_metrics(
+    db: AsyncSession = Depends(get_async_db),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None)
 ):
     """Calculates estimated cost savings and ROI for the AP automation, filterable by date."""
-    base_query = _get_date_filtered_query(db, models.Invoice, start_date, end_date)
-    kpis = get_advanced_kpis(db, start_date, end_date) # Reuse KPI logic for consistency
+    kpis = await db.run_sync(compute_advanced_kpis, start_date, end_date) # Reuse KPI logic for consistency
     
     COST_PER_INVOICE = 0.05
     HOURLY_RATE_AP_CLERK = 40.00
@@ -189,11 +224,14 @@ def get_cost_roi_metrics(
     return { "total_return_for_period": total_return, "total_cost_for_period": agent_expense }
 
 @router.get("/action-queue", response_model=List[schemas.InvoiceSummary])
-def get_action_queue(db: Session = Depends(get_db)):
+async def get_action_queue(db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves the top 5 invoices that require immediate attention,
     prioritized by the oldest update time in 'needs_review' status.
     """
-    return db.query(models.Invoice).filter(
-        models.Invoice.status == models.DocumentStatus.needs_review
-    ).order_by(models.Invoice.updated_at.asc()).limit(5).all() 
\ No newline at end of file
+    result = await db.scalars(
+        select(models.Invoice).options(invoice_summary_options())
+        .where(models.Invoice.status == models.DocumentStatus.needs_review)
+        .order_by(models.Invoice.updated_at.asc()).limit(5)
+    )
+    return result.all()
@@ -1,19 +1,22 @@
 # src/app/api/endpoints/documents.py
-from fastapi import APIRouter, Depends, BackgroundTasks, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, BackgroundTasks, UploadFile, File, HTTPException, Response, Query as QueryParam
 from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session, Query
-from typing import List, Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional
 import os
-import io
-import csv
 import glob
 
-from app.api.dependencies import get_db
+from app.api.dependencies import get_async_db, get_db
 from app.db import models, schemas
 from app.core import background_tasks as tasks_service
 # ADD THIS IMPORT
 from app.modules.matching import engine as matching_engine
+from app.modules.ingestion import lines as document_lines
 from app.utils.auditing import log_audit_event
+from app.utils import pagination, exporting
+from app.modules.search import compiler as search_compiler, fulltext
 from sqlalchemy.orm import joinedload
 
 router = APIRouter()
@@ -113,150 +116,155 @@ async def sync_sample_data(
     return job
 
 @router.get("/jobs/{job_id}", response_model=schemas.Job)
-def get_job_status(job_id: int, db: Session = Depends(get_db)):
+async def get_job_status(job_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Allows the frontend to poll for the status of a processing job.
     """
-    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    job = await db.get(models.Job, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job ID not found")
     return job
 
 @router.get("/jobs", response_model=List[schemas.Job])
-def get_all_jobs(limit: int = 20, db: Session = Depends(get_db)):
+async def get_all_jobs(limit: int = 20, db: AsyncSession = Depends(get_async_db)):
     """
     Allows the frontend to get a list of recent processing jobs.
     """
-    return db.query(models.Job).order_by(models.Job.created_at.desc()).limit(limit).all()
+    result = await db.scalars(select(models.Job).order_by(models.Job.created_at.desc()).limit(limit))
+    return result.all()
 
 @router.post("/search", response_model=List[schemas.Invoice])
-def search_invoices_flexible(request: schemas.SearchRequest, db: Session = Depends(get_db)):
+def search_invoices_flexible(request: schemas.SearchRequest, response: Response, db: Session = Depends(get_db)):
     """
     Searches for invoices with a dynamic set of filters and sorting options.
+    Supports keyset pagination through `limit`/`cursor` in the request body.
     """
-    query: Query = db.query(models.Invoice)  # Add type hint for clarity
-    
-    for condition in request.filters:
-        column = getattr(models.Invoice, condition.field, None)
-        if column is None:
-            # Skip invalid field names to avoid errors
-            continue
-
-        if condition.operator == 'is' or condition.operator == 'equals':
-            query = query.filter(column == condition.value)
-        elif condition.operator == 'contains':
-            # Use case-insensitive LIKE for string fields
-            query = query.filter(column.ilike(f"%{condition.value}%"))
-        elif condition.operator == 'gt':
-            query = query.filter(column > condition.value)
-        elif condition.operator == 'lt':
-            query = query.filter(column < condition.value)
-        elif condition.operator == 'gte':
-            query = query.filter(column >= condition.value)
-        elif condition.operator == 'lte':
-            query = query.filter(column <= condition.value)
-        elif condition.operator == 'not_equals':
-            query = query.filter(column != condition.value)
-        elif condition.operator == 'in':
-            # For checking if value is in a list
-            if isinstance(condition.value, list):
-                query = query.filter(column.in_(condition.value))
-        elif condition.operator == 'not_in':
-            # For checking if value is not in a list
-            if isinstance(condition.value, list):
-                query = query.filter(~column.in_(condition.value))
-        elif condition.operator == 'is_null':
-            query = query.filter(column.is_(None))
-        elif condition.operator == 'is_not_null':
-            query = query.filter(column.isnot(None))
-        # Add more operators as needed
-
-    # --- ADD SORTING LOGIC ---
-    sort_column = getattr(models.Invoice, request.sort_by, models.Invoice.invoice_date)
-    if request.sort_order == 'asc':
-        query = query.order_by(sort_column.asc())
-    else:
-        query = query.order_by(sort_column.desc())
-        
-    return query.all()  # Remove limit, frontend will handle pagination if needed
+    try:
+        compiled = search_compiler.compile_search_request(request)
+    except search_compiler.SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return pagination.paginate_response(
+        db, response, compiled.statement.options(pagination.invoice_options()),
+        compiled.sort_column, compiled.descending,
+        request.cursor, request.limit, request.include_total
+    )
+
+
+@router.get("/search/text", response_model=List[schemas.TextSearchResult])
+def search_documents_text(
+    q: str = QueryParam(..., min_length=1),
+    doc_type: Optional[List[str]] = QueryParam(None, description="Restrict to 'invoice', 'purchase_order' and/or 'grn'."),
+    limit: int = QueryParam(fulltext.DEFAULT_RESULT_LIMIT, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranked full-text search across invoices, POs and GRNs: document numbers, vendor
+    names, notes and line-item descriptions/SKUs. The last word matches as a prefix.
+    """
+    if not fulltext.is_available():
+        raise HTTPException(status_code=501, detail="Full-text search is not available on this database.")
+    try:
+        return fulltext.search(db, q, doc_types=doc_type, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/search/views", response_model=List[schemas.SavedView])
+def get_saved_views(db: Session = Depends(get_db)):
+    """Lists the saved invoice search views."""
+    return db.query(models.SavedView).order_by(models.SavedView.name).all()
+
+
+@router.post("/search/views", response_model=schemas.SavedView, status_code=201)
+def create_saved_view(view: schemas.SavedViewCreate, db: Session = Depends(get_db)):
+    """Saves a named search. Filters are validated with the same compiler the search uses."""
+    try:
+        search_compiler.compile_search(view.filters, view.sort_by, view.sort_order)
+    except search_compiler.SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if db.query(models.SavedView).filter_by(name=view.name).first():
+        raise HTTPException(status_code=409, detail=f"A saved view named '{view.name}' already exists.")
+
+    db_view = models.SavedView(
+        name=view.name,
+        filters=[condition.model_dump() for condition in view.filters],
+        sort_by=view.sort_by,
+        sort_order=view.sort_order,
+    )
+    db.add(db_view)
+    db.commit()
+    db.refresh(db_view)
+    return db_view
+
+
+@router.delete("/search/views/{view_id}", status_code=204)
+def delete_saved_view(view_id: int, db: Session = Depends(get_db)):
+    db_view = db.query(models.SavedView).filter_by(id=view_id).first()
+    if not db_view:
+        raise HTTPException(status_code=404, detail="Saved view not found")
+    db.delete(db_view)
+    db.commit()
+    return Response(status_code=204)
+
+
+@router.get("/search/views/{view_id}/invoices", response_model=List[schemas.Invoice])
+def run_saved_view(
+    view_id: int,
+    response: Response,
+    limit: Optional[int] = QueryParam(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Runs a saved view. Supports the same keyset pagination as /search."""
+    db_view = db.query(models.SavedView).filter_by(id=view_id).first()
+    if not db_view:
+        raise HTTPException(status_code=404, detail="Saved view not found")
+
+    try:
+        filters = [schemas.FilterCondition(**condition) for condition in (db_view.filters or [])]
+        compiled = search_compiler.compile_search(filters, db_view.sort_by, db_view.sort_order)
+    except search_compiler.SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=f"Saved view '{db_view.name}' is no longer valid: {e}")
+
+    return pagination.paginate_response(
+        db, response, compiled.statement.options(pagination.invoice_options()),
+        compiled.sort_column, compiled.descending, cursor, limit, include_total
+    )
 
 
-# ADD THIS NEW ENDPOINT
 @router.post("/export-csv")
-def export_invoices_to_csv(request: schemas.SearchRequest, db: Session = Depends(get_db)):
+def export_invoices_to_csv(
+    request: schemas.SearchRequest,
+    format: str = QueryParam("csv", pattern="^(csv|parquet)$"),
+    explode_line_items: bool = False
+):
     """
-    Exports invoices to a CSV file based on the provided search filters.
+    Exports invoices matching the provided search filters as a streamed download.
+    Rows are fetched and encoded in chunks, so exports of any size use bounded memory.
+    `format=parquet` produces a columnar Parquet file (requires pyarrow), and
+    `explode_line_items=true` writes one row per invoice line item.
     """
-    # Reuse the same search logic to get the filtered invoices
-    query: Query = db.query(models.Invoice)
-    
-    for condition in request.filters:
-        column = getattr(models.Invoice, condition.field, None)
-        if column is None:
-            continue
-
-        if condition.operator == 'is' or condition.operator == 'equals':
-            query = query.filter(column == condition.value)
-        elif condition.operator == 'contains':
-            query = query.filter(column.ilike(f"%{condition.value}%"))
-        elif condition.operator == 'gt':
-            query = query.filter(column > condition.value)
-        elif condition.operator == 'lt':
-            query = query.filter(column < condition.value)
-        elif condition.operator == 'gte':
-            query = query.filter(column >= condition.value)
-        elif condition.operator == 'lte':
-            query = query.filter(column <= condition.value)
-        elif condition.operator == 'not_equals':
-            query = query.filter(column != condition.value)
-        elif condition.operator == 'in':
-            if isinstance(condition.value, list):
-                query = query.filter(column.in_(condition.value))
-        elif condition.operator == 'not_in':
-            if isinstance(condition.value, list):
-                query = query.filter(~column.in_(condition.value))
-        elif condition.operator == 'is_null':
-            query = query.filter(column.is_(None))
-        elif condition.operator == 'is_not_null':
-            query = query.filter(column.isnot(None))
-
-    # Apply sorting
-    sort_column = getattr(models.Invoice, request.sort_by, models.Invoice.invoice_date)
-    if request.sort_order == 'asc':
-        query = query.order_by(sort_column.asc())
-    else:
-        query = query.order_by(sort_column.desc())
-    
-    invoices = query.all()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Write header
-    header = [
-        'invoice_id', 'vendor_name', 'invoice_date', 'due_date', 'status',
-        'subtotal', 'tax', 'grand_total', 'related_po_numbers'
-    ]
-    writer.writerow(header)
-
-    # Write rows
-    for inv in invoices:
-        writer.writerow([
-            inv.invoice_id,
-            inv.vendor_name,
-            inv.invoice_date,
-            inv.due_date,
-            inv.status.value,
-            inv.subtotal,
-            inv.tax,
-            inv.grand_total,
-            ", ".join(inv.related_po_numbers) if inv.related_po_numbers else ""
-        ])
-
-    output.seek(0)
-    
+    if format == "parquet" and not exporting.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export is not available: the 'pyarrow' package is not installed.")
+
+    # Same compiler as /search, so exports match what the user sees in the explorer
+    try:
+        stmt = search_compiler.compile_search_request(request).ordered()
+    except search_compiler.SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "parquet":
+        return StreamingResponse(
+            exporting.stream_invoices_parquet(stmt, explode_line_items),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": "attachment; filename=invoice_export.parquet"}
+        )
+
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+        exporting.stream_invoices_csv(stmt, explode_line_items),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=invoice_export.csv"}
     )
@@ -266,12 +274,12 @@ def export_invoices_to_csv(request: schemas.SearchRequest, db: Session = Depends
 def update_purchase_order(
     po_db_id: int, 
     changes: Dict[str, Any],
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
-    Updates a Purchase Order's details and triggers a re-match for all
-    related invoices. Includes server-side validation and detailed auditing.
+    Updates a Purchase Order's details. The resulting purchase_order.edited event
+    re-matches the related open invoices in the background. Includes server-side
+    validation and detailed auditing.
     """
     po = db.query(models.PurchaseOrder).options(
         joinedload(models.PurchaseOrder.invoices)
@@ -314,7 +322,7 @@ def update_purchase_order(
             if key in po.raw_data_payload:
                 po.raw_data_payload[key] = value
 
-    invoices_to_rematch = po.invoices
+    invoices_to_rematch = [inv for inv in po.invoices if inv.status in matching_engine.REMATCH_STATUSES]
     
     # Create a simple diff summary for the audit log
     summary_parts = []
@@ -335,22 +343,53 @@ def update_purchase_order(
             user='AP Team',
             action='PO Updated, Triggering Rematch',
             summary=f"PO {po.po_number} was updated. {update_summary}",
-            details={'po_number': po.po_number, 'changes': changes}
+            details={'po_number': po.po_number, 'changes': changes},
+            invoice_id_str=inv.invoice_id
         )
+    if 'line_items' in changes:
+        document_lines.sync_document(db, po)
+    fulltext.index_document(db, po)
     
-    db.commit() # Commit PO changes and audit logs together
-    
-    # Trigger background re-match for all affected invoices
-    for inv in invoices_to_rematch:
-        print(f"Queueing invoice ID {inv.id} for re-matching due to PO update.")
-        # Pass only the ID to the background task
-        background_tasks.add_task(matching_engine.run_match_for_invoice, db, inv.id)
+    # Commit PO changes, audit logs and the purchase_order.edited event together;
+    # the event's handler re-matches the invoices
+    db.commit()
 
     db.refresh(po)
     # Return a success message. The frontend will poll for the new status.
     return {"message": "Purchase Order updated. Rematching related invoices in the background."}
 
 
+@router.get("/line-items", response_model=List[schemas.DocumentLine])
+def get_line_item_history(
+    sku: Optional[str] = None,
+    description: Optional[str] = None,
+    vendor_name: Optional[str] = None,
+    doc_type: Optional[str] = QueryParam(None, pattern="^(invoice|purchase_order|grn)$"),
+    limit: int = QueryParam(200, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Looks up line items by SKU or exact description across invoices, POs and GRNs,
+    newest document first. Useful for price history and SKU lookups.
+    """
+    if not sku and not description:
+        raise HTTPException(status_code=400, detail="Provide a 'sku' or a 'description' to look up.")
+
+    query = db.query(models.DocumentLine)
+    if sku:
+        query = query.filter(models.DocumentLine.sku == sku)
+    if description:
+        query = query.filter(models.DocumentLine.description == description)
+    if vendor_name:
+        query = query.filter(models.DocumentLine.vendor_name == vendor_name)
+    if doc_type:
+        query = query.filter(models.DocumentLine.doc_type == doc_type)
+
+    return query.order_by(
+        models.DocumentLine.doc_date.desc(), models.DocumentLine.id.desc()
+    ).limit(limit).all()
+
+
 @router.get("/jobs/{job_id}/invoices", response_model=List[schemas.Invoice])
 def get_invoices_for_job(job_id: int, db: Session = Depends(get_db)):
     """
@@ -0,0 +1,50 @@
+# src/app/api/endpoints/events.py
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.core import events
+
+router = APIRouter()
+
+
+@router.get("/stream", summary="Server-Sent Event Stream")
+async def stream_events(request: Request, topics: Optional[List[str]] = Query(None)):
+    """
+    Streams job progress, invoice status changes, match completions and new
+    notifications as Server-Sent Events, so the UI does not have to poll. Optional
+    `topics` (jobs, invoices, notifications) narrow the stream. If a client falls too
+    far behind it receives a `resync` event and should refetch what it displays.
+    Holds no database connection.
+    """
+    unknown = set(topics or []) - set(events.TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topic(s): {sorted(unknown)}. Valid topics are: {list(events.TOPICS)}")
+
+    subscription = events.bus.subscribe(topics)
+
+    async def event_source():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event_data = await asyncio.wait_for(subscription.get(), timeout=settings.event_stream_heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield events.format_sse(event_data)
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield events.format_sse(events.make_event("stream.resync", {}))
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,17 +1,21 @@
 # src/app/api/endpoints/invoices.py
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-import math
 
-from app.api.dependencies import get_db
+from app.api.dependencies import get_async_db, get_db
 from app.db import models, schemas
-from app.utils import data_formatting
 # ADD THIS NEW IMPORT
 from app.modules.matching import comparison as comparison_service
+from app.modules.dossier import service as dossier_service
 from app.modules.matching import engine as matching_engine
+from app.modules.workflow import transitions
 from app.utils.auditing import log_audit_event
+from app.utils import pagination
+from app.modules.search import fulltext
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -32,23 +36,36 @@ class BatchUpdateStatusRequest(BaseModel):
 class BatchMarkAsPaidRequest(BaseModel):
     invoice_ids: List[int]
 
+class BatchDossierRequest(BaseModel):
+    invoice_ids: List[str]  # Invoice string IDs, in queue order
+
 @router.get("/", response_model=List[schemas.InvoiceSummary])
-def get_invoices(status: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_invoices(
+    response: Response,
+    status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Gets a list of invoices, filterable by status.
-    Uses a lightweight summary schema for efficiency.
+    Uses a lightweight summary schema for efficiency and only loads its columns.
+    Pass `limit` to page through results; the next page's cursor is returned in
+    the X-Next-Cursor header and an optional total in X-Total-Count.
     """
-    query = db.query(models.Invoice)
+    stmt = select(models.Invoice).options(pagination.invoice_summary_options())
     if status:
         try:
             # Handle empty status string from frontend calls
             if status.strip():
                 status_enum = models.DocumentStatus(status)
-                query = query.filter(models.Invoice.status == status_enum)
+                stmt = stmt.where(models.Invoice.status == status_enum)
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid status value: {status}")
-            
-    return query.order_by(models.Invoice.invoice_date.desc()).all()
+
+    return await db.run_sync(pagination.paginate_response, response, stmt, models.Invoice.invoice_date,
+                             True, cursor, limit, include_total)
 
 
 @router.get("/{invoice_id}/details")
@@ -57,25 +74,16 @@ def get_invoice_details(invoice_id: str, db: Session = Depends(get_db)):
     Retrieves all linked information for a single invoice.
     This is a raw data endpoint, for a more user-friendly version use /dossier.
     """
-    invoice = db.query(models.Invoice).filter(models.Invoice.invoice_id == invoice_id).first()
-    if not invoice:
+    dossier = dossier_service.get_dossier(db, invoice_id)
+    if dossier is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    po = None
-    # Find PO through GRN first
-    if invoice.grn and invoice.grn.po:
-        po = invoice.grn.po
-    # Fallback to direct PO link on invoice if no GRN link
-    elif invoice.po_number:
-        po = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.po_number == invoice.po_number).first()
-
-
-    response = {
-        "invoice": schemas.Invoice.from_orm(invoice),
-        "grn": schemas.GoodsReceiptNote.from_orm(invoice.grn) if invoice.grn else None,
-        "po": schemas.PurchaseOrder.from_orm(po) if po else None
+    documents = dossier["documents"]
+    return {
+        "invoice": documents["invoice"]["data"],
+        "grn": documents["grn"]["data"],
+        "po": documents["po"]["data"],
     }
-    return response
 
 @router.post("/{invoice_id}/update-status")
 def update_invoice_status_endpoint(
@@ -107,24 +115,23 @@ def update_invoice_status_endpoint(
     if new_status_enum == models.DocumentStatus.paid:
         invoice.paid_date = datetime.utcnow().date()
     
-    # THE LEARNING TRIGGER: If an invoice that needed review is now approved, learn from it.
-    if old_status == models.DocumentStatus.needs_review and new_status_enum == models.DocumentStatus.matched:
-        print(f"🧠 Learning from manual approval of invoice {invoice.invoice_id}...")
-        _learn_from_manual_approval(db, invoice)
-    
+    # Approvals of invoices that needed review are learned from once the
+    # invoice.status_changed event is dispatched (see app.core.domain_events)
+
     # Create an audit log entry
-    audit_log = models.AuditLog(
-        entity_type='Invoice',
-        entity_id=invoice.invoice_id,
-        user='System', # In a real app, this would be the logged-in user
-        action='Status Changed',
-        details={'from': old_status.value, 'to': new_status_enum.value, 'reason': request.reason}
+    log_audit_event(
+        db, invoice.id,
+        'System', # In a real app, this would be the logged-in user
+        'Status Changed',
+        details={'from': old_status.value, 'to': new_status_enum.value, 'reason': request.reason},
+        invoice_id_str=invoice.invoice_id
     )
-    db.add(audit_log)
 
     db.commit()
     return {"message": f"Invoice {invoice_id} status updated to '{request.new_status}' successfully."}
 
+# The dossier and comparison endpoints stay sync: building them is CPU-heavy Python
+# (formatting, fuzzy matching) that must run in the threadpool, not on the event loop.
 @router.get("/{invoice_id}/dossier")
 def get_invoice_dossier(invoice_id: str, db: Session = Depends(get_db)):
     """
@@ -132,90 +139,32 @@ def get_invoice_dossier(invoice_id: str, db: Session = Depends(get_db)):
     related documents (PO, GRN), their raw data, and file paths for display.
     This is the primary endpoint for viewing a document and its context.
     """
-    invoice = db.query(models.Invoice).filter(models.Invoice.invoice_id == invoice_id).first()
-    if not invoice:
+    formatted_dossier = dossier_service.get_dossier(db, invoice_id)
+    if formatted_dossier is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
-
-    # The formatting logic is now more complex and lives in the data_formatting utility
-    formatted_dossier = data_formatting.format_full_dossier(invoice, db)
-    
     return formatted_dossier
 
-def _learn_from_manual_approval(db: Session, invoice: models.Invoice):
+@router.post("/dossiers/batch")
+def get_invoice_dossiers(request: BatchDossierRequest, db: Session = Depends(get_db)):
     """
-    Analyzes a manually approved invoice to create or update a LearnedHeuristic.
-    This now reads from the match_trace field.
+    Returns the dossiers of several invoices at once, so the workbench can prefetch
+    the next invoices in its queue. Unknown IDs are listed under `not_found`.
     """
-    # We only learn from invoices that have a match trace
-    if not invoice.match_trace or not invoice.vendor_name:
-        return
-
-    # Find the first failed step in the trace to learn from
-    first_failure = next((step for step in invoice.match_trace if step.get("status") == "FAIL"), None)
-
-    if not first_failure:
-        return # No failure to learn from
-    
-    failure_details = first_failure.get("details", {})
-    failure_step = first_failure.get("step", "")
-    
-    learned_condition = {}
-    exception_type = "" # We'll derive this from the step name
-
-    if "Price Match" in failure_step:
-        exception_type = "PriceMismatchException"
-        invoice_price = failure_details.get("invoice_price", 0)
-        po_price = failure_details.get("po_price", 0)
-        if po_price > 0:
-            variance = abs(invoice_price - po_price) / po_price * 100
-            learned_condition = {"max_variance_percent": math.ceil(variance)}
-    elif "Quantity Match" in failure_step:
-        exception_type = "QuantityMismatchException"
-        invoice_qty = failure_details.get("invoice_qty", 0)
-        # Check if it was compared to GRN or PO
-        grn_qty = failure_details.get("grn_qty")
-        po_qty = failure_details.get("po_qty")
-        if grn_qty is not None:
-             learned_condition = {"max_quantity_diff": abs(invoice_qty - grn_qty)}
-        elif po_qty is not None:
-             learned_condition = {"max_quantity_diff": abs(invoice_qty - po_qty)}
-
-    if not exception_type or not learned_condition:
-        return # Could not determine a learnable condition
-
-    # Check if a similar heuristic already exists
-    heuristic = db.query(models.LearnedHeuristic).filter_by(
-        vendor_name=invoice.vendor_name,
-        exception_type=exception_type,
-        learned_condition=learned_condition
-    ).first()
-
-    if heuristic:
-        # If it exists, strengthen it
-        heuristic.trigger_count += 1
-        # Confidence formula: approaches 1 as trigger_count increases
-        heuristic.confidence_score = 1.0 - (1.0 / (heuristic.trigger_count + 1))
-        print(f"✅ Strengthened heuristic for {invoice.vendor_name}: {exception_type}. New confidence: {heuristic.confidence_score:.2f}")
-    else:
-        # If not, create a new one
-        new_heuristic = models.LearnedHeuristic(
-            vendor_name=invoice.vendor_name,
-            exception_type=exception_type,
-            learned_condition=learned_condition,
-            resolution_action=models.DocumentStatus.matched.value,
-            trigger_count=1,
-            confidence_score=0.5 # Start with a moderate confidence for a new rule
-        )
-        db.add(new_heuristic)
-        print(f"✅ Created new heuristic for {invoice.vendor_name}: {exception_type}")
-
+    if len(request.invoice_ids) > dossier_service.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {dossier_service.MAX_BATCH_SIZE} invoices can be fetched per request.")
+    dossiers = dossier_service.get_dossiers(db, request.invoice_ids)
+    return {
+        "dossiers": dossiers,
+        "not_found": [invoice_id for invoice_id in request.invoice_ids if invoice_id not in dossiers],
+    }
 
 # ADD THIS ENTIRE NEW ENDPOINT AT THE END OF THE FILE
 @router.get("/{invoice_db_id}/comparison-data")
 def get_invoice_comparison_data(invoice_db_id: int, db: Session = Depends(get_db)):
     """
     Retrieves and prepares all data needed for the interactive workbench
-    comparison view for a single invoice.
+    comparison view for a single invoice. Served from the snapshot stored by the
+    matching engine; rebuilt only if the invoice or its documents changed since.
     """
     data = comparison_service.prepare_comparison_data(db, invoice_db_id)
     if "error" in data:
@@ -244,6 +193,7 @@ def update_invoice_notes(
         "Reference Notes Updated", 
         summary=f"Notes updated: '{request.notes[:50]}{'...' if len(request.notes) > 50 else ''}'"
     )
+    fulltext.index_document(db, invoice)
     
     db.commit()
     
@@ -292,33 +242,18 @@ def batch_update_invoice_status(
     except ValueError:
         raise HTTPException(status_code=400, detail=f"Invalid status value: {request.new_status}")
 
-    query = db.query(models.Invoice).filter(models.Invoice.id.in_(request.invoice_ids))
-    
-    updated_count = 0
-    for invoice in query.all():
-        old_status = invoice.status
-        invoice.status = new_status_enum
-        
-        # Set paid_date when moving to 'paid' status
-        if new_status_enum == models.DocumentStatus.paid:
-            invoice.paid_date = datetime.utcnow().date()
-        
-        # Log each change
-        audit_log = models.AuditLog(
-            entity_type='Invoice',
-            entity_id=invoice.invoice_id,
-            user='System',  # Should be replaced with actual user from auth
-            action='Status Changed (Bulk)',
-            details={'from': old_status.value, 'to': new_status_enum.value, 'reason': request.reason}
-        )
-        db.add(audit_log)
-        updated_count += 1
-    
+    # One guarded UPDATE per chunk; sets paid_date for 'paid'
+    result = transitions.transition_invoices(
+        db, request.invoice_ids, new_status_enum,
+        user='System',  # Should be replaced with actual user from auth
+        action='Status Changed (Bulk)', reason=request.reason
+    )
     db.commit()
 
     return {
-        "message": f"Successfully updated {updated_count} of {len(request.invoice_ids)} invoices to '{request.new_status}'.",
-        "updated_count": updated_count
+        "message": f"Successfully updated {result.updated_count} of {len(request.invoice_ids)} invoices to '{request.new_status}'.",
+        "updated_count": result.updated_count,
+        "outcomes": result.outcomes
     }
 
 @router.post("/batch-mark-as-paid")
@@ -330,40 +265,40 @@ def batch_mark_as_paid(
     if not request.invoice_ids:
         raise HTTPException(status_code=400, detail="No invoice IDs provided.")
     
-    query = db.query(models.Invoice).filter(
-        models.Invoice.id.in_(request.invoice_ids),
-        models.Invoice.status == models.DocumentStatus.pending_payment
+    result = transitions.transition_invoices(
+        db, request.invoice_ids, models.DocumentStatus.paid,
+        allowed_from=[models.DocumentStatus.pending_payment],
+        user='System', action='Payment Confirmed (Bulk)',
+        returning=[models.Invoice.payment_batch_id],
+        audit_details=lambda row: {'batch_id': row["payment_batch_id"]}
     )
-    
-    updated_count = 0
-    for invoice in query.all():
-        invoice.status = models.DocumentStatus.paid
-        invoice.paid_date = datetime.utcnow().date()
-        
-        audit_log = models.AuditLog(
-            entity_type='Invoice', entity_id=invoice.invoice_id, user='System',
-            action='Payment Confirmed (Bulk)', details={'batch_id': invoice.payment_batch_id}
-        )
-        db.add(audit_log)
-        updated_count += 1
-    
     db.commit()
 
-    if updated_count == 0:
+    if result.updated_count == 0:
         raise HTTPException(status_code=404, detail="No valid invoices in 'pending_payment' status were found for the given IDs.")
 
     return {
-        "message": f"Successfully marked {updated_count} invoice(s) as paid.",
-        "updated_count": updated_count
+        "message": f"Successfully marked {result.updated_count} invoice(s) as paid.",
+        "updated_count": result.updated_count,
+        "outcomes": result.outcomes
     }
 
 @router.get("/by-category", response_model=List[schemas.InvoiceSummary])
-def get_invoices_by_category(category: str, db: Session = Depends(get_db)):
-    """Retrieves all invoices in review for a specific category."""
-    return db.query(models.Invoice).filter(
+async def get_invoices_by_category(
+    category: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Retrieves invoices in review for a specific category, optionally paginated."""
+    stmt = select(models.Invoice).options(pagination.invoice_summary_options()).where(
         models.Invoice.status == models.DocumentStatus.needs_review,
         models.Invoice.review_category == category
-    ).order_by(models.Invoice.invoice_date.desc()).all()
+    )
+    return await db.run_sync(pagination.paginate_response, response, stmt, models.Invoice.invoice_date,
+                             True, cursor, limit, include_total)
 
 @router.post("/batch-rematch", status_code=202)
 def batch_rematch_invoices(
@@ -387,7 +322,8 @@ def batch_rematch_invoices(
             user="AP Team", 
             action="Manual Rematch Triggered", 
             summary="Rematch triggered from Invoice Explorer.",
-            details={"source": "Invoice Explorer"}
+            details={"source": "Invoice Explorer"},
+            invoice_id_str=inv.invoice_id
         )
         background_tasks.add_task(matching_engine.run_match_for_invoice, db, inv.id)
         rematched_count += 1
@@ -400,12 +336,20 @@ def batch_rematch_invoices(
     }
 
 @router.get("/by-string-id/{invoice_id_str:path}", response_model=schemas.InvoiceSummary)
-def get_invoice_by_string_id(invoice_id_str: str, db: Session = Depends(get_db)):
+async def get_invoice_by_string_id(invoice_id_str: str, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves a single invoice's summary data using its string-based ID.
     The ":path" converter allows the ID to contain slashes.
     """
-    invoice = db.query(models.Invoice).filter(models.Invoice.invoice_id == invoice_id_str).first()
+    invoice = await db.scalar(
+        select(models.Invoice).options(pagination.invoice_summary_options())
+        .where(models.Invoice.invoice_id == invoice_id_str).limit(1)
+    )
+    if not invoice:
+        # Closed invoices past the archive horizon live in the cold tier
+        invoice = await db.scalar(
+            select(models.ArchivedInvoice).where(models.ArchivedInvoice.invoice_id == invoice_id_str).limit(1)
+        )
     if not invoice:
         raise HTTPException(status_code=404, detail=f"Invoice with ID '{invoice_id_str}' not found.")
     return invoice
\ No newline at end of file
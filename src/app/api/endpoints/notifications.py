@@ -1,21 +1,33 @@
 # src/app/api/endpoints/notifications.py
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 
-from app.api.dependencies import get_db
+from app.api.dependencies import get_async_db, get_db
 from app.db import models, schemas
 
 router = APIRouter()
 
+def _unread_notifications_stmt():
+    return select(models.Notification).where(models.Notification.is_read == 0).order_by(models.Notification.created_at.desc())
+
+
 @router.get("/", response_model=List[schemas.Notification], summary="Get All Notifications")
-def get_notifications(db: Session = Depends(get_db)):
+async def get_notifications(db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves all unread, high-priority notifications generated by the
     proactive intelligence engine.
     """
-    return db.query(models.Notification).filter(models.Notification.is_read == 0).order_by(models.Notification.created_at.desc()).all()
+    result = await db.scalars(_unread_notifications_stmt())
+    return result.all()
+
+
+def fetch_unread_notifications(db: Session) -> List[models.Notification]:
+    """Sync variant of the list above, for callers holding a regular Session (e.g. copilot tools)."""
+    return db.scalars(_unread_notifications_stmt()).all()
 
 
 @router.post("/{notification_id}/mark-read", summary="Mark a Notification as Read")
@@ -1,13 +1,14 @@
 # src/app/api/endpoints/payments.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
 from app.api.dependencies import get_db
 from app.db import models, schemas
-from app.utils.auditing import log_audit_event
+from app.modules.workflow import transitions
+from app.utils import pagination
 
 router = APIRouter()
 
@@ -15,11 +16,18 @@ class CreatePaymentBatchRequest(BaseModel):
     invoice_ids: List[int] # List of invoice database IDs
 
 @router.get("/payable", response_model=List[schemas.InvoiceSummary])
-def get_payable_invoices(db: Session = Depends(get_db)):
-    """Retrieves all invoices with status 'matched'."""
-    return db.query(models.Invoice).filter(
+def get_payable_invoices(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Retrieves invoices with status 'matched', earliest due date first, optionally paginated."""
+    query = db.query(models.Invoice).options(pagination.invoice_summary_options()).filter(
         models.Invoice.status == models.DocumentStatus.matched
-    ).order_by(models.Invoice.due_date.asc()).all()
+    )
+    return pagination.paginate_response(db, response, query, models.Invoice.due_date, False, cursor, limit, include_total)
 
 @router.post("/batches", status_code=201)
 def create_payment_batch(
@@ -33,35 +41,27 @@ def create_payment_batch(
     if not request.invoice_ids:
         raise HTTPException(status_code=400, detail="No invoice IDs provided.")
 
-    invoices = db.query(models.Invoice).filter(
-        models.Invoice.id.in_(request.invoice_ids),
-        models.Invoice.status == models.DocumentStatus.matched
-    ).all()
-
-    if len(invoices) != len(request.invoice_ids):
-        raise HTTPException(status_code=400, detail="One or more invoices were not in 'matched' status or did not exist.")
-
-    if not invoices:
-        raise HTTPException(status_code=400, detail="No valid invoices found to create a batch.")
-
     batch_id = f"PAY-BATCH-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    total_amount = 0
-    
-    for inv in invoices:
-        inv.status = models.DocumentStatus.pending_payment
-        inv.payment_batch_id = batch_id
-        total_amount += inv.grand_total or 0
-        
-        log_audit_event(
-            db=db, invoice_db_id=inv.id, user='System',
-            action='Added to Payment Batch', details={"batch_id": batch_id}
-        )
+    # Guarded bulk move matched -> pending_payment; all-or-nothing like before
+    result = transitions.transition_invoices(
+        db, request.invoice_ids, models.DocumentStatus.pending_payment,
+        allowed_from=[models.DocumentStatus.matched],
+        user='System', action='Added to Payment Batch',
+        values={"payment_batch_id": batch_id},
+        returning=[models.Invoice.grand_total],
+        audit_details=lambda row: {"batch_id": batch_id}
+    )
+
+    if result.updated_count != len(set(request.invoice_ids)):
+        db.rollback()
+        rejected = sorted(invoice_id for invoice_id, outcome in result.outcomes.items() if outcome != transitions.UPDATED)
+        raise HTTPException(status_code=400, detail=f"One or more invoices were not in 'matched' status or did not exist: {rejected}")
 
     db.commit()
 
     return {
         "message": f"Payment batch {batch_id} created successfully.",
         "batch_id": batch_id,
-        "processed_invoice_count": len(invoices),
-        "total_amount": total_amount,
+        "processed_invoice_count": result.updated_count,
+        "total_amount": sum(row["grand_total"] or 0 for row in result.rows),
     } 
\ No newline at end of file
@@ -1,12 +1,14 @@
 # src/app/api/endpoints/collaboration.py
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 
 from app.api.dependencies import get_db
 from app.db import models, schemas
 from app.utils.auditing import log_audit_event
+from app.utils import pagination
+from app.core import audit_archive
 
 router = APIRouter()
 
@@ -66,9 +68,19 @@ def request_internal_response(
     return {"message": "Internal review requested and status updated."}
 
 @router.get("/invoices/{invoice_db_id}/comments", response_model=List[schemas.Comment])
-def get_invoice_comments(invoice_db_id: int, db: Session = Depends(get_db)):
-    """Retrieves all comments for a specific invoice."""
-    return db.query(models.Comment).filter(models.Comment.invoice_id == invoice_db_id).order_by(models.Comment.created_at.asc()).all()
+def get_invoice_comments(
+    invoice_db_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Retrieves the comments for a specific invoice, oldest first.
+    Pass `limit` to page through them; the next cursor is in the X-Next-Cursor header.
+    """
+    query = db.query(models.Comment).filter(models.Comment.invoice_id == invoice_db_id)
+    return pagination.paginate_response(db, response, query, models.Comment.created_at, False, cursor, limit)
 
 @router.post("/invoices/{invoice_db_id}/comments", response_model=schemas.Comment)
 def add_invoice_comment(
@@ -94,6 +106,21 @@ def add_invoice_comment(
     return db_comment
 
 @router.get("/invoices/{invoice_db_id}/audit-log", response_model=List[schemas.AuditLog])
-def get_invoice_audit_log(invoice_db_id: int, db: Session = Depends(get_db)):
-    """Retrieves the audit log for a specific invoice."""
-    return db.query(models.AuditLog).filter(models.AuditLog.invoice_db_id == invoice_db_id).order_by(models.AuditLog.timestamp.desc()).all() 
\ No newline at end of file
+def get_invoice_audit_log(
+    invoice_db_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Retrieves the audit log for a specific invoice, newest first, including entries
+    that have been moved to the audit archive. Pass `limit` to page through it; the
+    next cursor is in the X-Next-Cursor header.
+    """
+    try:
+        entries, next_cursor = audit_archive.invoice_timeline(db, invoice_db_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_page_headers(response, next_cursor)
+    return entries 
\ No newline at end of file
@@ -0,0 +1,305 @@
+# src/app/core/audit_archive.py
+"""
+Rolling archive for the audit log.
+
+The audit_logs table gains several rows per invoice on every match and bulk action.
+Entries older than `audit_hot_retention_days` are moved, oldest first, into compressed
+JSON-lines segment files (zstd if the `zstandard` package is installed, gzip
+otherwise). Each segment is registered in audit_archive_segments, and
+audit_archive_index records which invoices it covers, so an invoice's full timeline
+can still be served: hot rows from the table first, then archived entries.
+
+Within a segment, the entries of each index group (invoice and entity) are written as
+a compressed frame of their own, and the index records the frame's byte range. Serving
+an invoice's archived history reads only its frames, however large the segment.
+Segments written before frames were recorded are scanned once per invoice and cached.
+"""
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import cache
+from app.db import bulk, models
+from app.utils import pagination
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Columns copied into each archived JSON line
+_ENTRY_COLUMNS = ("id", "timestamp", "user", "entity_type", "entity_id", "action", "summary", "details", "invoice_db_id")
+_DELETE_CHUNK = 5000
+
+# Per-invoice entries of segments without frame offsets, keyed by (segment id, invoice);
+# segments never change once written
+_unframed_entries = cache.Cache("audit_archive_unframed", max_entries=256)
+
+
+def _default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _open_for_read(path: str, codec: str):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"Audit segment {path} is zstd-compressed; install `zstandard` to read it.")
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    # Concatenated gzip members / zstd frames still decompress as one stream
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(frame: bytes, path: str, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"Audit segment {path} is zstd-compressed; install `zstandard` to read it.")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+def _to_entry(row) -> Dict[str, Any]:
+    entry = dict(zip(_ENTRY_COLUMNS, row))
+    if entry["timestamp"] is not None:
+        entry["timestamp"] = entry["timestamp"].isoformat()
+    return entry
+
+
+def _from_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    if entry.get("timestamp"):
+        entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+    return entry
+
+
+def _segment_path(first: Dict[str, Any], last: Dict[str, Any], codec: str) -> str:
+    stamp = (first["timestamp"] or "undated")[:7].replace("-", "/")
+    suffix = "zst" if codec == "zstd" else "gz"
+    # ID ranges of invoice-scoped segments can overlap, so add a random tag
+    name = f"audit-{first['id']:012d}-{last['id']:012d}-{uuid.uuid4().hex[:8]}.jsonl.{suffix}"
+    return os.path.join(settings.audit_archive_dir, stamp, name)
+
+
+_GroupKey = Tuple[Optional[int], Optional[str]]
+
+
+def _group_key(entry: Dict[str, Any]) -> _GroupKey:
+    return entry["invoice_db_id"], entry["entity_id"]
+
+
+def _group_entries(entries: List[Dict[str, Any]]) -> Dict[_GroupKey, List[Dict[str, Any]]]:
+    groups: Dict[_GroupKey, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        groups.setdefault(_group_key(entry), []).append(entry)
+    return groups
+
+
+def _write_segment(groups: Dict[_GroupKey, List[Dict[str, Any]]], first: Dict[str, Any],
+                   last: Dict[str, Any], codec: str) -> Tuple[str, Dict[_GroupKey, Tuple[int, int]]]:
+    """Writes each group as its own compressed frame. Returns the path and each group's (offset, length)."""
+    path = _segment_path(first, last, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frames: Dict[_GroupKey, Tuple[int, int]] = {}
+    # Write to a temp file and rename, so a crash never leaves a truncated segment behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for key, group in groups.items():
+            lines = "".join(json.dumps(entry, default=str, separators=(",", ":")) + "\n" for entry in group)
+            frame = _compress(lines.encode("utf-8"), codec)
+            frames[key] = (f.tell(), len(frame))
+            f.write(frame)
+    os.replace(tmp_path, path)
+    return path, frames
+
+
+def _index_rows(segment_id: int, groups: Dict[_GroupKey, List[Dict[str, Any]]],
+                frames: Dict[_GroupKey, Tuple[int, int]]) -> List[Dict[str, Any]]:
+    rows = []
+    for key, group in groups.items():
+        timestamps = [datetime.fromisoformat(entry["timestamp"]) for entry in group if entry["timestamp"]]
+        byte_offset, byte_length = frames[key]
+        rows.append({"segment_id": segment_id, "invoice_db_id": key[0], "entity_id": key[1],
+                     "entry_count": len(group), "min_timestamp": min(timestamps, default=None),
+                     "max_timestamp": max(timestamps, default=None),
+                     "byte_offset": byte_offset, "byte_length": byte_length})
+    return rows
+
+
+def move_to_segment(db: Session, criteria, limit: Optional[int] = None,
+                    codec: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """
+    Writes the audit entries matching `criteria` (oldest first, at most `limit`) to a
+    new segment, registers it and deletes the rows, all in the caller's transaction.
+    Returns (entries moved, segment path). The caller commits; if it rolls back
+    instead it should remove the returned file.
+    """
+    codec = codec or _default_codec()
+    columns = [getattr(models.AuditLog, name) for name in _ENTRY_COLUMNS]
+    stmt = select(*columns).where(criteria).order_by(models.AuditLog.timestamp, models.AuditLog.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = db.execute(stmt).all()
+    if not rows:
+        return 0, None
+
+    entries = [_to_entry(row) for row in rows]
+    groups = _group_entries(entries)
+    path, frames = _write_segment(groups, entries[0], entries[-1], codec)
+    try:
+        timestamps = [row.timestamp for row in rows if row.timestamp is not None]
+        segment = models.AuditArchiveSegment(
+            path=path, codec=codec, row_count=len(entries),
+            min_timestamp=min(timestamps, default=None), max_timestamp=max(timestamps, default=None),
+        )
+        db.add(segment)
+        db.flush()
+        bulk.bulk_insert(db, models.AuditArchiveIndex, _index_rows(segment.id, groups, frames))
+        ids = [entry["id"] for entry in entries]
+        for start in range(0, len(ids), _DELETE_CHUNK):
+            db.execute(
+                delete(models.AuditLog).where(models.AuditLog.id.in_(ids[start:start + _DELETE_CHUNK]))
+                .execution_options(synchronize_session=False)
+            )
+    except Exception:
+        os.remove(path)
+        raise
+    return len(entries), path
+
+
+def _archive_one_segment(db: Session, cutoff: datetime, codec: str) -> int:
+    path = None
+    try:
+        moved, path = move_to_segment(db, models.AuditLog.timestamp < cutoff,
+                                      settings.audit_archive_segment_rows, codec)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # The rows are still in the hot table; drop the orphaned file
+        if path and os.path.exists(path):
+            os.remove(path)
+        raise
+    return moved
+
+
+def archive_old_entries(db: Session, retention_days: Optional[int] = None) -> int:
+    """
+    Moves audit entries older than the retention horizon into archive segments, one
+    segment (and one commit) at a time. Returns the number of entries archived.
+    """
+    if retention_days is None:
+        retention_days = settings.audit_hot_retention_days
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    codec = _default_codec()
+
+    archived = 0
+    while True:
+        moved = _archive_one_segment(db, cutoff, codec)
+        archived += moved
+        if moved < settings.audit_archive_segment_rows:
+            break
+    if archived:
+        print(f"🗄️ Archived {archived} audit log entries older than {retention_days} day(s).")
+    return archived
+
+
+def _read_segment(segment: models.AuditArchiveSegment) -> Iterator[Dict[str, Any]]:
+    with _open_for_read(segment.path, segment.codec) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_frame(segment: models.AuditArchiveSegment, byte_offset: int, byte_length: int) -> List[Dict[str, Any]]:
+    with open(segment.path, "rb") as f:
+        f.seek(byte_offset)
+        frame = f.read(byte_length)
+    text = _decompress(frame, segment.path, segment.codec).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _unframed_invoice_entries(segment: models.AuditArchiveSegment, invoice_db_id: int) -> List[Dict[str, Any]]:
+    return _unframed_entries.get_or_load(
+        (segment.id, invoice_db_id),
+        lambda: [e for e in _read_segment(segment) if e.get("invoice_db_id") == invoice_db_id],
+    )
+
+
+def archived_entries_for_invoice(db: Session, invoice_db_id: int) -> List[Dict[str, Any]]:
+    """All archived entries for an invoice, newest first. Reads only the invoice's frames."""
+    ArchiveIndex = models.AuditArchiveIndex
+    located = db.query(models.AuditArchiveSegment, ArchiveIndex.byte_offset, ArchiveIndex.byte_length).join(
+        ArchiveIndex, ArchiveIndex.segment_id == models.AuditArchiveSegment.id
+    ).filter(ArchiveIndex.invoice_db_id == invoice_db_id).order_by(
+        models.AuditArchiveSegment.id, ArchiveIndex.byte_offset
+    ).all()
+
+    entries = []
+    scanned = set()
+    for segment, byte_offset, byte_length in located:
+        try:
+            if byte_offset is not None:
+                raw = _read_frame(segment, byte_offset, byte_length)
+            elif segment.id not in scanned:
+                scanned.add(segment.id)
+                raw = _unframed_invoice_entries(segment, invoice_db_id)
+            else:
+                continue
+            # Cached lists are shared, so convert copies
+            entries.extend(_from_entry(dict(e)) for e in raw)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Warning: Could not read audit archive segment {segment.path}: {e}")
+    entries.sort(key=lambda e: (e["timestamp"] or datetime.min, e["id"]), reverse=True)
+    return entries
+
+
+def _hot_entry(log: models.AuditLog) -> Dict[str, Any]:
+    return {name: getattr(log, name) for name in _ENTRY_COLUMNS}
+
+
+def _timeline_key(entry: Dict[str, Any]) -> Tuple[datetime, int]:
+    # The order apply_keyset gives the hot rows: newest first, entries without a timestamp last
+    return entry["timestamp"] or datetime.min, entry["id"]
+
+
+def invoice_timeline(db: Session, invoice_db_id: int, cursor: Optional[str] = None,
+                     limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    An invoice's audit history, newest first, across the hot table and the archive.
+    Keyset-paginated on (timestamp, id), with entries that have no timestamp last;
+    the archive is only read once a page reaches past the hot rows that have one
+    (archived entries are older than those). Raises ValueError for a malformed cursor.
+    """
+    hot_query = db.query(models.AuditLog).filter(models.AuditLog.invoice_db_id == invoice_db_id)
+    hot_rows = pagination.apply_keyset(
+        hot_query, models.AuditLog.timestamp, models.AuditLog.id, True, cursor, limit
+    ).all()
+    entries = [_hot_entry(log) for log in hot_rows]
+
+    page_full_of_timestamped = limit is not None and len(entries) > limit and entries[limit - 1]["timestamp"] is not None
+    if not page_full_of_timestamped:
+        archived = archived_entries_for_invoice(db, invoice_db_id)
+        if cursor:
+            last_ts, last_id = pagination.decode_cursor(cursor)
+            after = _timeline_key({"timestamp": last_ts, "id": last_id})
+            archived = [e for e in archived if _timeline_key(e) < after]
+        entries = sorted(entries + archived, key=_timeline_key, reverse=True)
+
+    if limit is None or len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    last = entries[-1]
+    # A missing timestamp is encoded as None, which apply_keyset and _timeline_key both sort last
+    return entries, pagination.encode_cursor(last["timestamp"], last["id"])
@@ -6,6 +6,7 @@ from contextlib import contextmanager
 import re
 
 from app.db.session import SessionLocal
+from app.db import write_queue
 from app.db import models
 from app.modules.ingestion import service as ingestion_service
 from app.modules.matching import engine as matching_engine
@@ -65,16 +66,28 @@ def process_single_document(job_id: int, file_info: Dict[str, Any]):
         }
 
 def update_job_progress(job_id: int, processed_count: int, status: str = "processing"):
-    """Helper function to update job progress in database."""
-    try:
-        with get_thread_db_session() as db:
-            job = db.query(models.Job).filter_by(id=job_id).first()
-            if job:
-                job.processed_files = processed_count
-                job.status = status
-                db.commit()
-    except Exception as e:
-        print(f"Error updating job progress: {e}")
+    """
+    Helper function to update job progress in database. Goes through the write queue
+    without waiting, so with group commit enabled progress updates share commits.
+    """
+    def _update(db):
+        job = db.query(models.Job).filter_by(id=job_id).first()
+        if job:
+            job.processed_files = processed_count
+            job.status = status
+
+    future = write_queue.submit(_update)
+    future.add_done_callback(
+        lambda f: f.exception() and print(f"Error updating job progress: {f.exception()}")
+    )
+
+def _mark_match_failed(inv_id: int, error: Exception):
+    def _update(db):
+        inv = db.query(models.Invoice).filter(models.Invoice.id == inv_id).first()
+        if inv:
+            inv.status = models.DocumentStatus.needs_review
+            inv.match_trace = [{"step": "Engine Error", "status": "FAIL", "message": str(error)}]
+    return write_queue.submit(_update)
 
 def process_uploaded_documents(job_id: int, files_data: List[Dict[str, Any]]):
     """
@@ -152,17 +165,23 @@ def process_uploaded_documents(job_id: int, files_data: List[Dict[str, Any]]):
         print(f"Ingestion complete. Queueing {len(invoice_ids_to_match)} invoices for matching.")
         update_job_progress(job_id, job.total_files, status="matching")
 
-        for inv_id in invoice_ids_to_match:
+        # Each match is a unit of work for the write queue, so with group commit
+        # enabled many invoices are committed together.
+        match_futures = {
+            inv_id: write_queue.submit(lambda session, inv_id=inv_id: matching_engine.run_match_for_invoice(session, inv_id))
+            for inv_id in invoice_ids_to_match
+        }
+        failure_futures = []
+        for inv_id, future in match_futures.items():
             try:
-                # We can call this directly since it's in a background task context
-                matching_engine.run_match_for_invoice(db, inv_id)
+                future.result()
             except Exception as e:
                 print(f"  [ERROR] Matching failed for Invoice ID {inv_id}: {e}")
-                inv = db.query(models.Invoice).filter(models.Invoice.id == inv_id).first()
-                if inv:
-                    inv.status = models.DocumentStatus.needs_review
-                    inv.match_trace = [{"step": "Engine Error", "status": "FAIL", "message": str(e)}]
-                    db.commit()
+                failure_futures.append(_mark_match_failed(inv_id, e))
+        for future in failure_futures:
+            future.exception()
+        # Make sure no queued progress update lands after the final status
+        write_queue.drain()
         
         job.status = "completed"
         job.completed_at = datetime.utcnow()
@@ -0,0 +1,474 @@
+# src/app/core/cache.py
+"""
+Shared caching layer.
+
+Each subsystem owns a namespaced `Cache`:
+
+    _dossiers = cache.Cache("dossiers", max_entries=512)
+    dossier = _dossiers.get_or_load(key, lambda: build(...))
+
+Storage is pluggable. With the default "memory" backend every cache is a size-bounded
+LRU with optional TTL inside the worker process. With cache_backend="redis" caches
+share one network store, so all workers see the same entries and invalidations;
+values are then serialized (pickle unless the cache picks another serializer).
+Caches whose values cannot leave the process (e.g. compiled SQL statements) are
+created with local=True and always stay in memory. FakeSharedBackend is an
+in-process stand-in for the network store, for tests and local development.
+
+Invalidation is namespaced: `clear()` bumps the namespace's generation counter,
+which is part of every key, so all of its entries become unreachable at once, in
+every worker, without scanning the store. Old entries age out through LRU/TTL.
+
+`get_or_load` protects against stampedes: concurrent misses for the same key in a
+process wait for a single load, and with a shared backend a short-lived lock entry
+keeps other workers from loading the same key at the same time.
+
+A backend that cannot be reached is treated as a miss: `get_or_load` calls the
+loader and returns its result uncached, so an outage of the shared store slows
+requests down instead of failing them.
+
+Every cache counts hits, misses, loads, coalesced waits, load and backend errors
+and invalidations; `metrics()` reports them per namespace together with the
+backend's size and eviction counts.
+"""
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+# Returned by backends for absent or expired keys (None is a valid cached value)
+MISSING = object()
+
+# Keys longer than this are hashed so they stay within store limits
+_MAX_RAW_KEY_LENGTH = 200
+
+
+# --- Serializers ---
+class PickleSerializer:
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class JsonSerializer:
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+PICKLE = PickleSerializer()
+JSON = JsonSerializer()
+
+
+# --- Backends ---
+class CacheBackend:
+    """Storage interface. `shared` backends are visible to every worker and store bytes."""
+    shared = False
+
+    def get(self, key: str) -> Any:
+        """The stored value, or MISSING."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl_s: Optional[float] = None) -> bool:
+        """Stores the value only if the key is absent; True if it was stored."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def counter(self, key: str) -> int:
+        """Current value of an integer counter (0 if never incremented)."""
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically increments a counter and returns the new value."""
+        raise NotImplementedError
+
+    def info(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """Size-bounded LRU with per-entry TTL, private to the process."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # key -> (value, expiry as a time.monotonic() deadline or None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Counters (namespace generations) are kept apart so LRU eviction never resets them
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _live(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _store(self, key: str, value: Any, ttl_s: Optional[float], now: float):
+        self._entries[key] = (value, now + ttl_s if ttl_s else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        with self._lock:
+            self._store(key, value, ttl_s, time.monotonic())
+
+    def add(self, key: str, value: Any, ttl_s: Optional[float] = None) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl_s, now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self.max_entries,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+
+class FakeSharedBackend(MemoryBackend):
+    """
+    In-process stand-in for a network store: behaves like a shared backend (values
+    must be bytes, so serialization is exercised) but lives in this process.
+    """
+    shared = True
+
+    def __init__(self, max_entries: int = 100_000):
+        super().__init__(max_entries)
+
+    def _store(self, key: str, value: Any, ttl_s: Optional[float], now: float):
+        if not isinstance(value, bytes):
+            raise TypeError(f"Shared cache values must be bytes, not {type(value).__name__}.")
+        super()._store(key, value, ttl_s, now)
+
+
+class RedisBackend(CacheBackend):
+    """Redis store shared by all workers (requires the optional `redis` package)."""
+    shared = True
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("cache_backend='redis' requires the redis package (pip install redis).")
+        self._client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _px(ttl_s: Optional[float]) -> Optional[int]:
+        return max(int(ttl_s * 1000), 1) if ttl_s else None
+
+    def get(self, key: str) -> Any:
+        value = self._client.get(key)
+        return MISSING if value is None else value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        self._client.set(key, value, px=self._px(ttl_s))
+
+    def add(self, key: str, value: Any, ttl_s: Optional[float] = None) -> bool:
+        return bool(self._client.set(key, value, px=self._px(ttl_s), nx=True))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def counter(self, key: str) -> int:
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+
+_shared_backend: Optional[CacheBackend] = None
+_shared_backend_lock = threading.Lock()
+
+
+def shared_backend() -> Optional[CacheBackend]:
+    """The configured shared store, or None with the default "memory" backend."""
+    global _shared_backend
+    if settings.cache_backend == "memory":
+        return None
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            if settings.cache_backend == "redis":
+                _shared_backend = RedisBackend(settings.cache_redis_url)
+            else:
+                raise ValueError(f"Unknown cache_backend '{settings.cache_backend}'. Use 'memory' or 'redis'.")
+        return _shared_backend
+
+
+# --- Caches ---
+_caches: Dict[str, "Cache"] = {}
+
+
+def _encode_key(key: Any) -> str:
+    if isinstance(key, str):
+        raw = key
+    else:
+        # Tuples/lists of plain values; json keeps it identical across processes
+        raw = json.dumps(key, default=str, separators=(",", ":"))
+    if len(raw) > _MAX_RAW_KEY_LENGTH:
+        raw = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return raw
+
+
+class Cache:
+    """A namespaced cache; see the module docstring."""
+
+    def __init__(self, namespace: str, max_entries: int = 1024, ttl_s: Optional[float] = None,
+                 serializer: Optional[Any] = None, local: bool = False):
+        if namespace in _caches:
+            raise ValueError(f"Cache namespace '{namespace}' is already in use.")
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.local = local
+        self._serializer = serializer
+        self._backend: Optional[CacheBackend] = None
+        self._backend_lock = threading.Lock()
+        self._inflight: Dict[str, list] = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "waits": 0,
+                       "load_errors": 0, "backend_errors": 0, "invalidations": 0}
+        _caches[namespace] = self
+
+    # --- Plumbing ---
+    @property
+    def backend(self) -> CacheBackend:
+        with self._backend_lock:
+            if self._backend is None:
+                shared = None if self.local else shared_backend()
+                self._backend = shared or MemoryBackend(self.max_entries)
+            return self._backend
+
+    def use_backend(self, backend: CacheBackend):
+        """Replaces the storage (e.g. with a FakeSharedBackend in tests); existing entries are dropped."""
+        with self._backend_lock:
+            self._backend = backend
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    @property
+    def _prefix(self) -> str:
+        return f"{settings.cache_key_prefix}:{self.namespace}"
+
+    def _full_key(self, key: Any) -> Optional[str]:
+        """The key in the current generation, or None if the backend cannot be reached."""
+        # Resolved outside the try: a misconfigured backend should fail loudly, not be bypassed
+        backend = self.backend
+        try:
+            generation = backend.counter(f"{self._prefix}:generation")
+        except Exception as e:
+            self._count("backend_errors")
+            print(f"Cache '{self.namespace}': generation lookup failed, bypassing the cache: {e}")
+            return None
+        return f"{self._prefix}:{generation}:{_encode_key(key)}"
+
+    def _serializer_for(self, backend: CacheBackend):
+        if backend.shared:
+            return self._serializer or PICKLE
+        return self._serializer
+
+    def _read(self, full_key: str) -> Any:
+        backend = self.backend
+        try:
+            value = backend.get(full_key)
+        except Exception as e:
+            self._count("backend_errors")
+            print(f"Cache '{self.namespace}': read failed, treating as a miss: {e}")
+            return MISSING
+        if value is MISSING:
+            return MISSING
+        serializer = self._serializer_for(backend)
+        return serializer.loads(value) if serializer else value
+
+    def _write(self, full_key: str, value: Any, ttl_s: Optional[float]):
+        backend = self.backend
+        serializer = self._serializer_for(backend)
+        try:
+            backend.set(full_key, serializer.dumps(value) if serializer else value, ttl_s or self.ttl_s)
+        except Exception as e:
+            self._count("backend_errors")
+            print(f"Cache '{self.namespace}': write failed: {e}")
+
+    @contextmanager
+    def _key_lock(self, full_key: str):
+        """One loader per key in this process; the others wait for it."""
+        with self._inflight_lock:
+            entry = self._inflight.setdefault(full_key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._inflight_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._inflight[full_key]
+
+    def _wait_for_other_worker(self, full_key: str) -> Any:
+        deadline = time.monotonic() + settings.cache_lock_wait_s
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self._read(full_key)
+            if value is not MISSING:
+                return value
+            delay = min(delay * 2, 0.25)
+        return MISSING
+
+    # --- API ---
+    def get(self, key: Any, default: Any = None) -> Any:
+        full_key = self._full_key(key)
+        value = MISSING if full_key is None else self._read(full_key)
+        self._count("misses" if value is MISSING else "hits")
+        return default if value is MISSING else value
+
+    def set(self, key: Any, value: Any, ttl_s: Optional[float] = None):
+        full_key = self._full_key(key)
+        if full_key is not None:
+            self._write(full_key, value, ttl_s)
+
+    def delete(self, key: Any):
+        full_key = self._full_key(key)
+        if full_key is None:
+            return
+        try:
+            self.backend.delete(full_key)
+        except Exception as e:
+            self._count("backend_errors")
+            print(f"Cache '{self.namespace}': delete failed: {e}")
+
+    def clear(self):
+        """Invalidates every entry of the namespace (in all workers, with a shared backend)."""
+        try:
+            self.backend.incr(f"{self._prefix}:generation")
+        except Exception as e:
+            self._count("backend_errors")
+            print(f"Cache '{self.namespace}': clear failed: {e}")
+            return
+        self._count("invalidations")
+
+    def get_or_load(self, key: Any, loader: Callable[[], Any], ttl_s: Optional[float] = None,
+                    should_cache: Callable[[Any], bool] = lambda value: value is not None) -> Any:
+        """
+        The cached value, or loader()'s result, stored if should_cache(result) (by
+        default anything but None). Concurrent misses for one key share a single load.
+        """
+        full_key = self._full_key(key)
+        if full_key is None:
+            # Backend unavailable: serve uncached rather than fail
+            self._count("misses")
+            self._count("loads")
+            try:
+                return loader()
+            except Exception:
+                self._count("load_errors")
+                raise
+        value = self._read(full_key)
+        if value is not MISSING:
+            self._count("hits")
+            return value
+        self._count("misses")
+
+        with self._key_lock(full_key):
+            # Another thread may have loaded it while we waited for the lock
+            value = self._read(full_key)
+            if value is not MISSING:
+                self._count("waits")
+                return value
+
+            backend = self.backend
+            lock_key = f"{full_key}:lock"
+            locked = lock_failed = False
+            if backend.shared:
+                try:
+                    locked = backend.add(lock_key, b"1", settings.cache_lock_wait_s)
+                except Exception as e:
+                    lock_failed = True
+                    self._count("backend_errors")
+                    print(f"Cache '{self.namespace}': lock failed, loading anyway: {e}")
+                if not locked and not lock_failed:
+                    value = self._wait_for_other_worker(full_key)
+                    if value is not MISSING:
+                        self._count("waits")
+                        return value
+            try:
+                self._count("loads")
+                try:
+                    value = loader()
+                except Exception:
+                    self._count("load_errors")
+                    raise
+                if should_cache(value):
+                    self._write(full_key, value, ttl_s)
+                return value
+            finally:
+                if locked:
+                    try:
+                        backend.delete(lock_key)
+                    except Exception:
+                        pass
+
+    def info(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        backend = self.backend
+        stats["backend"] = type(backend).__name__
+        # A shared store's size is not per namespace
+        if not backend.shared:
+            stats.update(backend.info())
+        return stats
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss/load/eviction counters of every cache, by namespace."""
+    return {namespace: cached.info() for namespace, cached in sorted(_caches.items())}
@@ -0,0 +1,178 @@
+# src/app/core/config_cache.py
+"""
+Read-through cache for configuration the hot paths consult on every invoice: vendor
+settings (tolerance, contact email), active automation rules and high-confidence
+learned heuristics.
+
+Each section has a row in config_versions. Whenever a flush inserts, updates or
+deletes a row of a cached model, the section's version is bumped in the same
+transaction, so the API, the copilot tools and anything else going through the ORM
+are covered without having to remember to invalidate. Writes that bypass the ORM
+(e.g. the learning upsert) call `bump` themselves.
+
+A process serves a section from memory and re-reads its version at most every
+`config_cache_max_age_s`, reloading when it changed; commits made by this process
+invalidate its own copy right away. So other workers see a change within that bound,
+and reading the configuration costs one primary-key lookup per interval instead of a
+query per invoice. Callers that must not act on stale data pass max_age_s=0.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import bulk, models
+
+VENDOR_SETTINGS = "vendor_settings"
+AUTOMATION_RULES = "automation_rules"
+HEURISTICS = "heuristics"
+
+# Which section a change to each model invalidates
+MODEL_SECTIONS = {
+    models.VendorSetting: VENDOR_SETTINGS,
+    models.AutomationRule: AUTOMATION_RULES,
+    models.LearnedHeuristic: HEURISTICS,
+}
+
+# Sections a session has bumped, invalidated locally once it commits
+_CHANGED_KEY = "config_sections_changed"
+
+Loader = Callable[[Session], Any]
+
+
+class Section:
+    """One cached section: a loader plus the value and version it last produced."""
+
+    def __init__(self, name: str, loader: Loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._version: Optional[int] = None
+        self._loaded = False
+        self._checked_at = 0.0
+        # Incremented by invalidate(), so a load that raced with it is not trusted
+        self._generation = 0
+        self.stats = {"hits": 0, "checks": 0, "reloads": 0}
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self._generation += 1
+
+    def get(self, db: Session, max_age_s: Optional[float] = None) -> Any:
+        """The section's value; re-checks the version if the last check is older than max_age_s."""
+        if max_age_s is None:
+            max_age_s = settings.config_cache_max_age_s
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and now - self._checked_at < max_age_s:
+                self.stats["hits"] += 1
+                return self._value
+            self.stats["checks"] += 1
+            generation = self._generation
+
+        # Version first: a change committed while loading only makes the next check reload again
+        version = db.scalar(select(models.ConfigVersion.version).where(models.ConfigVersion.section == self.name)) or 0
+        with self._lock:
+            if self._loaded and version == self._version:
+                if generation == self._generation:
+                    self._checked_at = now
+                return self._value
+
+        value = self._loader(db)
+        with self._lock:
+            self.stats["reloads"] += 1
+            self._value, self._version, self._loaded = value, version, True
+            self._checked_at = now if generation == self._generation else 0.0
+        return value
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "version": self._version}
+
+
+_sections: Dict[str, Section] = {}
+
+
+def section(name: str, loader: Loader) -> Section:
+    """Registers the loader for a section; modules call this at import time."""
+    if name in _sections:
+        raise ValueError(f"Configuration section '{name}' is already registered.")
+    _sections[name] = Section(name, loader)
+    return _sections[name]
+
+
+def cache_info() -> Dict[str, Dict[str, Any]]:
+    """Returns hit/check/reload counters and the cached version of each section."""
+    return {name: cached.info() for name, cached in _sections.items()}
+
+
+def bump(db: Session, sections: Iterable[str]):
+    """
+    Bumps the versions of `sections` in the session's transaction. Executed on the
+    session's connection without flushing, so it is safe inside flush hooks.
+    """
+    sections = sorted(set(sections))
+    if not sections:
+        return
+    now = datetime.utcnow()
+    stmt = bulk.upsert_statement(
+        db, models.ConfigVersion, ["section"],
+        lambda table, excluded: {"version": table.c.version + 1, "updated_at": excluded.updated_at},
+    )
+    db.connection().execute(stmt, [{"section": name, "version": 1, "updated_at": now} for name in sections])
+    db.info.setdefault(_CHANGED_KEY, set()).update(sections)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_sections(session: Session, flush_context):
+    changed: Set[str] = set()
+    for instances in (session.new, session.deleted):
+        changed.update(MODEL_SECTIONS[type(instance)] for instance in instances if type(instance) in MODEL_SECTIONS)
+    for instance in session.dirty:
+        if type(instance) in MODEL_SECTIONS and session.is_modified(instance):
+            changed.add(MODEL_SECTIONS[type(instance)])
+    bump(session, changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    for name in session.info.pop(_CHANGED_KEY, ()):
+        if name in _sections:
+            _sections[name].invalidate()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_changes(session: Session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CHANGED_KEY, None)
+
+
+# --- Vendor settings ---
+@dataclass(frozen=True)
+class VendorConfig:
+    vendor_name: str
+    price_tolerance_percent: Optional[float]
+    contact_email: Optional[str]
+
+
+def _load_vendor_settings(db: Session) -> Dict[str, VendorConfig]:
+    rows = db.execute(select(models.VendorSetting.vendor_name, models.VendorSetting.price_tolerance_percent,
+                             models.VendorSetting.contact_email))
+    return {row.vendor_name: VendorConfig(*row) for row in rows}
+
+
+_vendor_settings = section(VENDOR_SETTINGS, _load_vendor_settings)
+
+
+def vendor_config(db: Session, vendor_name: Optional[str]) -> Optional[VendorConfig]:
+    """The vendor's settings (exact name match), or None if it has none."""
+    if not vendor_name:
+        return None
+    return _vendor_settings.get(db).get(vendor_name)
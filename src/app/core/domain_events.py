@@ -0,0 +1,139 @@
+# src/app/core/domain_events.py
+"""
+Domain events, recorded in the transactional outbox (app.core.outbox).
+
+    invoice.ingested         {invoice_db_id, invoice_id, vendor_name, status}
+    invoice.status_changed   {invoice_db_id, invoice_id, vendor_name, from, to, user}
+    invoice.match_completed  {invoice_db_id, invoice_id, vendor_name, status, review_category}
+    invoice.changed          {invoice_db_id, invoice_id, vendor_name, fields, previous_created_day}
+    purchase_order.edited    {po_db_id, po_number, fields}
+
+New invoices, invoice status changes, edits to the invoice fields the dashboard
+rollups aggregate and edits to the PO fields matching depends on are recorded
+automatically when the ORM flushes them. Set-based updates record their
+status changes with `status_change_row` + outbox.record_many, and the matching engine
+records match_completed explicitly.
+
+The handlers are wired up in app.main; each receives the dispatcher's session and a
+batch of events of one type, and must not commit.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core import outbox
+from app.db import models
+
+INVOICE_INGESTED = "invoice.ingested"
+INVOICE_STATUS_CHANGED = "invoice.status_changed"
+INVOICE_MATCH_COMPLETED = "invoice.match_completed"
+INVOICE_CHANGED = "invoice.changed"
+PURCHASE_ORDER_EDITED = "purchase_order.edited"
+
+# The `user` of status changes made by automation rules
+AUTOMATION_USER = "AutomationEngine"
+
+# Invoice columns the daily KPI rollups aggregate (besides status)
+INVOICE_ROLLUP_FIELDS = ("grand_total", "created_at")
+# PO columns the matching engine reads; editing any of them invalidates linked matches
+PO_MATCH_FIELDS = ("po_number", "vendor_name", "order_date", "line_items")
+
+
+def _status_value(status) -> Optional[str]:
+    return status.value if hasattr(status, "value") else status
+
+
+def invoice_ingested_row(invoice: models.Invoice) -> Dict[str, Any]:
+    return {
+        "event_type": INVOICE_INGESTED,
+        "aggregate_id": invoice.id,
+        "payload": {
+            "invoice_db_id": invoice.id, "invoice_id": invoice.invoice_id, "vendor_name": invoice.vendor_name,
+            "status": _status_value(invoice.status),
+        },
+    }
+
+
+def status_change_row(invoice_db_id: int, invoice_id: str, vendor_name: Optional[str],
+                      previous_status, new_status, user: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "event_type": INVOICE_STATUS_CHANGED,
+        "aggregate_id": invoice_db_id,
+        "payload": {
+            "invoice_db_id": invoice_db_id, "invoice_id": invoice_id, "vendor_name": vendor_name,
+            "from": _status_value(previous_status), "to": _status_value(new_status),
+            "user": user,
+        },
+    }
+
+
+def match_completed_row(invoice: models.Invoice) -> Dict[str, Any]:
+    return {
+        "event_type": INVOICE_MATCH_COMPLETED,
+        "aggregate_id": invoice.id,
+        "payload": {
+            "invoice_db_id": invoice.id, "invoice_id": invoice.invoice_id, "vendor_name": invoice.vendor_name,
+            "status": _status_value(invoice.status), "review_category": invoice.review_category,
+        },
+    }
+
+
+def invoice_changed_row(invoice: models.Invoice, fields: List[str], previous_created_at) -> Dict[str, Any]:
+    return {
+        "event_type": INVOICE_CHANGED,
+        "aggregate_id": invoice.id,
+        "payload": {
+            "invoice_db_id": invoice.id, "invoice_id": invoice.invoice_id, "vendor_name": invoice.vendor_name,
+            "fields": fields,
+            # A moved invoice also changes the totals of the day it was created on before
+            "previous_created_day": previous_created_at.date().isoformat() if previous_created_at else None,
+        },
+    }
+
+
+def po_edited_row(po: models.PurchaseOrder, fields: List[str]) -> Dict[str, Any]:
+    return {
+        "event_type": PURCHASE_ORDER_EDITED,
+        "aggregate_id": po.id,
+        "payload": {"po_db_id": po.id, "po_number": po.po_number, "fields": fields},
+    }
+
+
+def current_status(outbox_event: models.OutboxEvent) -> Optional[str]:
+    """The invoice status an ingested or status_changed event left the invoice in."""
+    if outbox_event.event_type == INVOICE_STATUS_CHANGED:
+        return outbox_event.payload.get("to")
+    return outbox_event.payload.get("status")
+
+
+def _changed(history) -> bool:
+    # Assigning the loaded value again shows up as a change; only count real ones
+    return bool(history.added) and (not history.deleted or history.deleted[0] != history.added[0])
+
+
+@event.listens_for(Session, "after_flush")
+def _record_domain_events(session: Session, flush_context):
+    rows = []
+    for instance in session.new:
+        if isinstance(instance, models.Invoice):
+            rows.append(invoice_ingested_row(instance))
+    for instance in session.dirty:
+        if isinstance(instance, models.Invoice):
+            state = inspect(instance)
+            history = state.attrs.status.history
+            if history.added and (not history.deleted or history.deleted[0] != history.added[0]):
+                previous = history.deleted[0] if history.deleted else None
+                rows.append(status_change_row(instance.id, instance.invoice_id, instance.vendor_name,
+                                              previous, history.added[0]))
+            fields = [name for name in INVOICE_ROLLUP_FIELDS if _changed(state.attrs[name].history)]
+            if fields:
+                created = state.attrs.created_at.history
+                previous_created_at = created.deleted[0] if created.added and created.deleted else None
+                rows.append(invoice_changed_row(instance, fields, previous_created_at))
+        elif isinstance(instance, models.PurchaseOrder):
+            state = inspect(instance)
+            fields = [name for name in PO_MATCH_FIELDS if state.attrs[name].history.has_changes()]
+            if fields:
+                rows.append(po_edited_row(instance, fields))
+    outbox.record_in_flush(session, rows)
@@ -0,0 +1,320 @@
+# src/app/core/events.py
+"""
+Server-push event bus.
+
+Committed changes that the UI otherwise polls for are announced as small events:
+
+    job.progress             {job_id, status, processed_files, total_files}
+    invoice.status_changed   {invoice_db_id, invoice_id, from, to}
+    invoice.match_completed  {invoice_db_id, invoice_id, status, review_category}
+    notification.created     {id, type, message, related_entity_id, related_entity_type}
+
+Job, invoice and notification changes made through the ORM are picked up at flush
+and queued on the session; set-based updates queue theirs with
+`publish_after_commit`. Queued events are only published once the session commits
+(or, for write-queue units, once their group commit succeeds).
+
+Subscribers (the SSE endpoint) receive events on their asyncio loop. With the
+default "memory" backend only subscribers in the same process see an event; the
+"postgres" backend relays events through LISTEN/NOTIFY so every worker sees them.
+If a worker's LISTEN connection drops, it reconnects with backoff; meanwhile it also
+delivers its own events locally, and once it is listening again its subscribers are
+told to resync, since events from other workers may have been missed.
+"""
+import asyncio
+import itertools
+import json
+import select
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import models
+from app.db.session import engine
+
+TOPIC_JOBS = "jobs"
+TOPIC_INVOICES = "invoices"
+TOPIC_NOTIFICATIONS = "notifications"
+TOPICS = (TOPIC_JOBS, TOPIC_INVOICES, TOPIC_NOTIFICATIONS)
+
+# Events waiting for their session to commit
+_PENDING_KEY = "pending_events"
+# Set by the write queue: a list that collects events until the group commit succeeds
+SINK_KEY = "event_sink"
+
+_NOTIFY_CHANNEL = "ap_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_NOTIFY_MAX_BYTES = 7900
+
+
+def make_event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": event_type,
+        "topic": event_type.split(".", 1)[0] + "s",
+        "data": data,
+        "ts": datetime.utcnow().isoformat(),
+    }
+
+
+class Subscription:
+    """A subscriber's bounded queue. If it overflows, the subscriber is told to resync."""
+
+    def __init__(self, bus: "EventBus", topics: Set[str], loop: asyncio.AbstractEventLoop):
+        self._bus = bus
+        self.topics = topics
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=settings.event_subscriber_queue_size)
+        self.overflowed = False
+
+    def _deliver(self, event_data: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event_data)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fans events out to subscribers; safe to publish from any thread."""
+
+    def __init__(self):
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Set while the listener holds a working LISTEN connection
+        self._listening = threading.Event()
+
+    # --- Subscribers ---
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None) -> Subscription:
+        """Registers a subscriber on the running event loop."""
+        subscription = Subscription(self, set(topics or TOPICS), asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+    def _resync_all(self):
+        """Tells every subscriber to refetch, e.g. after events may have been missed."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, make_event("stream.resync", {}))
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def _dispatch(self, events: List[Dict[str, Any]]):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event_data in events:
+            event_data.setdefault("id", next(self._ids))
+            for subscription in subscriptions:
+                if event_data["topic"] in subscription.topics:
+                    try:
+                        subscription.loop.call_soon_threadsafe(subscription._deliver, event_data)
+                    except RuntimeError:
+                        # The subscriber's loop is closed; it is going away
+                        self.unsubscribe(subscription)
+
+    # --- Publishing ---
+
+    def publish_many(self, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        if settings.event_bus_backend == "postgres" and self._listener is not None and self._listener.is_alive():
+            try:
+                self._notify(events)
+                # Our own subscribers only get relayed events while the listener is connected
+                if self._listening.is_set():
+                    return
+            except Exception as e:
+                print(f"Warning: Could not relay events through Postgres, delivering locally: {e}")
+        self._dispatch(events)
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        self.publish_many([make_event(event_type, data)])
+
+    # --- Shared backend (Postgres LISTEN/NOTIFY) ---
+
+    def _notify(self, events: List[Dict[str, Any]]):
+        with engine.connect() as conn:
+            for event_data in events:
+                payload = json.dumps(event_data, default=str, separators=(",", ":"))
+                if len(payload.encode("utf-8")) > _NOTIFY_MAX_BYTES:
+                    # Too large to relay; other workers' clients will catch up on their next fetch
+                    self._dispatch([event_data])
+                    continue
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {"channel": _NOTIFY_CHANNEL, "payload": payload})
+            conn.commit()
+
+    def _connect(self):
+        raw = engine.raw_connection()
+        driver_connection = raw.driver_connection
+        # The listener holds its connection for as long as it is healthy, so take it out of the pool
+        raw.detach()
+        driver_connection.autocommit = True
+        return driver_connection
+
+    def _listen_forever(self):
+        """Keeps a LISTEN connection open, reconnecting with backoff whenever it fails."""
+        delay, reconnecting = 1.0, False
+        while not self._stop.is_set():
+            driver_connection = None
+            try:
+                driver_connection = self._connect()
+                self._listen_loop(driver_connection, on_listening=self._resync_all if reconnecting else None)
+                return
+            except Exception as e:
+                if self._listening.is_set():
+                    # It had been working; start the backoff over
+                    delay = 1.0
+                self._listening.clear()
+                print(f"Warning: Event listener connection failed, reconnecting in {delay:.0f}s: {e}")
+                reconnecting = True
+            finally:
+                if driver_connection is not None:
+                    try:
+                        driver_connection.close()
+                    except Exception:
+                        pass
+            self._stop.wait(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _listen_loop(self, driver_connection, on_listening=None):
+        cursor = driver_connection.cursor()
+        cursor.execute(f"LISTEN {_NOTIFY_CHANNEL}")
+        self._listening.set()
+        if on_listening:
+            on_listening()
+        while not self._stop.is_set():
+            if select.select([driver_connection], [], [], 1.0) == ([], [], []):
+                continue
+            driver_connection.poll()
+            batch = []
+            while driver_connection.notifies:
+                notify = driver_connection.notifies.pop(0)
+                try:
+                    batch.append(json.loads(notify.payload))
+                except ValueError:
+                    continue
+            self._dispatch(batch)
+        self._listening.clear()
+
+    def start(self):
+        """Starts the shared-backend listener, if one is configured. Safe to call more than once."""
+        if settings.event_bus_backend != "postgres" or self._listener is not None:
+            return
+        if engine.dialect.name != "postgresql" or engine.dialect.driver != "psycopg2":
+            print("Warning: event_bus_backend=postgres needs a psycopg2 Postgres database; using the in-process bus.")
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen_forever, name="event-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._stop.set()
+        self._listener.join(5)
+        self._listener = None
+
+
+bus = EventBus()
+
+
+def format_sse(event_data: Dict[str, Any]) -> str:
+    """Encodes an event in the text/event-stream wire format."""
+    payload = json.dumps(event_data, default=str, separators=(",", ":"))
+    return f"id: {event_data.get('id', '')}\nevent: {event_data['type']}\ndata: {payload}\n\n"
+
+
+# --- Session integration ---
+
+def publish_after_commit(db: Session, event_type: str, data: Dict[str, Any]):
+    """Queues an event on the session; it is published once the session commits."""
+    db.info.setdefault(_PENDING_KEY, []).append(make_event(event_type, data))
+
+
+def _changed(instance, attribute: str):
+    """(old, new) if the attribute changed in this flush, else None."""
+    history = inspect(instance).attrs[attribute].history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+
+def _enum_value(value):
+    return value.value if hasattr(value, "value") else value
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(session: Session, flush_context):
+    for instance in session.new:
+        if isinstance(instance, models.Notification):
+            publish_after_commit(session, "notification.created", {
+                "id": instance.id, "type": instance.type, "message": instance.message,
+                "related_entity_id": instance.related_entity_id,
+                "related_entity_type": instance.related_entity_type,
+            })
+        elif isinstance(instance, models.Job):
+            publish_after_commit(session, "job.progress", {
+                "job_id": instance.id, "status": instance.status,
+                "processed_files": instance.processed_files or 0, "total_files": instance.total_files,
+            })
+
+    for instance in session.dirty:
+        if isinstance(instance, models.Invoice):
+            change = _changed(instance, "status")
+            if change and change[0] != change[1]:
+                publish_after_commit(session, "invoice.status_changed", {
+                    "invoice_db_id": instance.id, "invoice_id": instance.invoice_id,
+                    "from": _enum_value(change[0]), "to": _enum_value(change[1]),
+                })
+        elif isinstance(instance, models.Job):
+            if _changed(instance, "processed_files") or _changed(instance, "status"):
+                publish_after_commit(session, "job.progress", {
+                    "job_id": instance.id, "status": instance.status,
+                    "processed_files": instance.processed_files or 0, "total_files": instance.total_files,
+                })
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_on_commit(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    sink = session.info.get(SINK_KEY)
+    if sink is not None:
+        sink.extend(pending)
+        return
+    bus.publish_many(pending)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_unpublished(session: Session, transaction):
+    # Events still queued when the outermost transaction ends were rolled back
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,128 @@
+# src/app/core/invoice_archive.py
+"""
+Hot/cold tiering for invoices.
+
+Closed invoices (paid or rejected) that have not changed for
+`invoice_archive_after_days` are moved from `invoices` to `invoices_archive`, with
+their JSON payloads (line items, match trace) intact. Rows that referenced the
+invoice are handled in the same transaction:
+
+- PO/GRN links and comments are snapshotted onto the archive row, then deleted;
+- the invoice's comparison snapshot is dropped (it is rebuilt on demand);
+- audit entries are moved into an audit archive segment, so the invoice's timeline
+  stays available through the audit-log endpoint;
+- the invoice's full-text index entry is dropped (document_lines are kept for
+  historical line-item analytics);
+- the daily KPI rollups of the invoices' creation days are recomputed.
+
+Historical reports read through models.InvoiceHistory (hot UNION ALL archive).
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import audit_archive, kpi_rollups
+from app.db import bulk, models
+from app.modules.search import fulltext
+
+CLOSED_STATUSES = (models.DocumentStatus.paid, models.DocumentStatus.rejected)
+
+
+def _links_by_invoice(db: Session, table, column_name: str, ids: List[int]) -> Dict[int, List[int]]:
+    links: Dict[int, List[int]] = {}
+    for invoice_id, target_id in db.execute(select(table.invoice_id, getattr(table, column_name)).where(table.invoice_id.in_(ids))):
+        links.setdefault(invoice_id, []).append(target_id)
+    return links
+
+
+def _comments_by_invoice(db: Session, ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    comments: Dict[int, List[Dict[str, Any]]] = {}
+    rows = db.query(models.Comment).filter(models.Comment.invoice_id.in_(ids)).order_by(models.Comment.created_at, models.Comment.id)
+    for c in rows:
+        comments.setdefault(c.invoice_id, []).append({
+            "id": c.id, "user": c.user, "text": c.text, "type": c.type,
+            "created_at": c.created_at.isoformat() if c.created_at else None,
+        })
+    return comments
+
+
+def _archive_batch(db: Session, ids: List[int]) -> int:
+    invoice_table = models.Invoice.__table__
+    invoice_rows = db.execute(select(invoice_table).where(invoice_table.c.id.in_(ids))).mappings().all()
+
+    po_links = _links_by_invoice(db, models.InvoicePurchaseOrderAssociation, "po_id", ids)
+    grn_links = _links_by_invoice(db, models.InvoiceGRNAssociation, "grn_id", ids)
+    comments = _comments_by_invoice(db, ids)
+    archived_at = datetime.utcnow()
+
+    archive_rows = [{
+        **row,
+        "archived_at": archived_at,
+        "purchase_order_ids": po_links.get(row["id"], []),
+        "grn_ids": grn_links.get(row["id"], []),
+        "comments": comments.get(row["id"], []),
+    } for row in invoice_rows]
+
+    segment_path = None
+    try:
+        bulk.bulk_insert(db, models.invoices_archive, archive_rows)
+        _, segment_path = audit_archive.move_to_segment(db, models.AuditLog.invoice_db_id.in_(ids))
+        for model, column in ((models.Comment, models.Comment.invoice_id),
+                              (models.ComparisonSnapshot, models.ComparisonSnapshot.invoice_db_id),
+                              (models.InvoicePurchaseOrderAssociation, models.InvoicePurchaseOrderAssociation.invoice_id),
+                              (models.InvoiceGRNAssociation, models.InvoiceGRNAssociation.invoice_id),
+                              (models.Invoice, models.Invoice.id)):
+            db.execute(delete(model).where(column.in_(ids)).execution_options(synchronize_session=False))
+        fulltext.remove_documents(db, fulltext.DOC_TYPE_INVOICE, ids)
+        kpi_rollups.recompute_days(db, {row["created_at"].date() if row["created_at"] else None for row in invoice_rows})
+        db.commit()
+    except Exception:
+        db.rollback()
+        if segment_path and os.path.exists(segment_path):
+            os.remove(segment_path)
+        raise
+    return len(archive_rows)
+
+
+def archive_closed_invoices(db: Session, older_than_days: Optional[int] = None) -> int:
+    """
+    Moves closed invoices not updated within the horizon into invoices_archive, one
+    batch (and one commit) at a time. Returns the number of invoices archived.
+    """
+    if older_than_days is None:
+        older_than_days = settings.invoice_archive_after_days
+    if older_than_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    # SQLite hands the highest rowid out again once that row is deleted, which would
+    # let a new invoice reuse an archived invoice's ID; always keep the newest row hot
+    max_id = db.query(func.max(models.Invoice.id)).scalar()
+    if max_id is None:
+        return 0
+
+    archived = 0
+    while True:
+        ids = list(db.scalars(
+            select(models.Invoice.id)
+            .where(models.Invoice.status.in_(CLOSED_STATUSES),
+                   models.Invoice.updated_at < cutoff,
+                   models.Invoice.id < max_id)
+            .order_by(models.Invoice.id)
+            .limit(settings.invoice_archive_batch_size)
+        ))
+        if not ids:
+            break
+        archived += _archive_batch(db, ids)
+    if archived:
+        print(f"🗄️ Archived {archived} closed invoice(s) older than {older_than_days} day(s).")
+    return archived
+
+
+def find_archived_invoice(db: Session, invoice_id: str) -> Optional[models.ArchivedInvoice]:
+    """Looks up an archived invoice by its string ID."""
+    return db.query(models.ArchivedInvoice).filter(models.ArchivedInvoice.invoice_id == invoice_id).first()
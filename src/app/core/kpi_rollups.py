@@ -0,0 +1,92 @@
+# src/app/core/kpi_rollups.py
+"""
+Daily invoice rollups for the dashboard.
+
+invoice_daily_rollups holds, per creation day and status, how many invoices there are
+and the sum of their grand_total. Like the KPIs, it is computed from
+models.InvoiceHistory, so archived invoices count too and the dashboard summary and
+the KPIs describe the same invoices. Instead of applying +1/-1 deltas per event (which
+would double count when an event is redelivered), the outbox handler recomputes the
+creation days of the changed invoices from the invoice history, one indexed range
+query per day, so handling an event twice is harmless.
+
+Ingestion, status changes and edits to grand_total/created_at raise events; the
+archive job recomputes the days of the invoices it moves. `rebuild` recomputes every
+day. It runs on a schedule to build the table the first time and to pick up changes
+that bypass both (set-based updates, deletes).
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from app.db import bulk, models
+from app.db.functions import day_of
+
+Rollup = models.InvoiceDailyRollup
+
+
+def _rollup_rows(grouped) -> List[Dict]:
+    now = datetime.utcnow()
+    return [{"day": day, "status": status, "invoice_count": count, "total_amount": amount, "refreshed_at": now}
+            for day, status, count, amount in grouped]
+
+
+def recompute_days(db: Session, days: Set[Optional[date]]):
+    """Replaces the rollup rows of the given creation days (None: invoices without created_at). Does not commit."""
+    Invoice = models.InvoiceHistory
+    for day in days:
+        stmt = select(Invoice.status, func.count(Invoice.id), func.sum(Invoice.grand_total)).group_by(Invoice.status)
+        if day is None:
+            stmt = stmt.where(Invoice.created_at.is_(None))
+            db.execute(delete(Rollup).where(Rollup.day.is_(None)))
+        else:
+            start = datetime.combine(day, time.min)
+            stmt = stmt.where(Invoice.created_at >= start, Invoice.created_at < start + timedelta(days=1))
+            db.execute(delete(Rollup).where(Rollup.day == day))
+        rows = _rollup_rows((day, status, count, amount) for status, count, amount in db.execute(stmt))
+        if rows:
+            bulk.bulk_insert(db, Rollup, rows)
+
+
+def handle_invoice_events(db: Session, events: List[models.OutboxEvent]):
+    """Outbox handler: refreshes the days the changed invoices were (and, if moved, had been) created on."""
+    invoice_ids = {e.payload["invoice_db_id"] for e in events}
+    created = db.scalars(select(models.InvoiceHistory.created_at).where(models.InvoiceHistory.id.in_(invoice_ids)))
+    days = {created_at.date() if created_at else None for created_at in created}
+    days.update(date.fromisoformat(e.payload["previous_created_day"])
+                for e in events if e.payload.get("previous_created_day"))
+    recompute_days(db, days)
+
+
+def rebuild(db: Session) -> int:
+    """Recomputes the whole table in one transaction. Returns the number of rollup rows."""
+    Invoice = models.InvoiceHistory
+    day = day_of(Invoice.created_at)
+    grouped = db.execute(
+        select(day, Invoice.status, func.count(Invoice.id), func.sum(Invoice.grand_total)).group_by(day, Invoice.status)
+    ).all()
+    db.execute(delete(Rollup))
+    rows = _rollup_rows(grouped)
+    bulk.bulk_insert(db, Rollup, rows)
+    db.commit()
+    return len(rows)
+
+
+def status_totals(db: Session, start_date: Optional[date] = None,
+                  end_date: Optional[date] = None) -> Optional[Dict[models.DocumentStatus, Tuple[int, float]]]:
+    """
+    (invoice count, total grand_total) per status for invoices created in the date range,
+    or None if the rollups have not been built yet and the caller should scan instead.
+    """
+    if not db.scalar(select(exists().where(Rollup.id.isnot(None)))):
+        if db.scalar(select(exists().where(models.InvoiceHistory.id.isnot(None)))):
+            return None
+        return {}
+    stmt = select(Rollup.status, func.sum(Rollup.invoice_count), func.sum(Rollup.total_amount)).group_by(Rollup.status)
+    if start_date:
+        stmt = stmt.where(Rollup.day >= start_date)
+    if end_date:
+        stmt = stmt.where(Rollup.day <= end_date)
+    return {status: (int(count or 0), float(amount or 0.0)) for status, count, amount in db.execute(stmt)}
@@ -1,75 +1,133 @@
-from sqlalchemy.orm import Session
+# src/app/core/monitoring_service.py
+"""
+Proactive monitoring: turns patterns in the data into notifications.
+
+Each check is one set-based query that already excludes candidates with an unread
+notification (and, for suggestions, an existing rule), followed by one bulk insert.
+The partial unique index on unread notifications (type, related_entity_id) makes the
+insert idempotent, so a concurrent cycle can never create a duplicate.
+"""
+import json
 from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, exists, select
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.db import bulk, models
+
+SUGGESTION_CONFIDENCE = 0.9
+# The action a suggestion proposes; heuristics already covered by such a rule are skipped
+SUGGESTED_RULE_ACTION = "approve"
+# A suggested rule records the heuristic it came from (source_heuristic_key); the
+# automation executor then approves the vendor's invoices in review whose failures are
+# within the learned tolerance. Its conditions narrow that to the review category the
+# exception puts invoices in.
+EXCEPTION_REVIEW_CATEGORIES = {
+    "PriceMismatchException": "data_mismatch",
+    "QuantityMismatchException": "data_mismatch",
+}
+
+
+def _no_unread_notification(notification_type: str, entity_id_column):
+    return ~exists().where(
+        models.Notification.type == notification_type,
+        models.Notification.related_entity_id == entity_id_column,
+        models.Notification.is_read == 0,
+    )
 
-from app.db import models
-
-def _create_notification_if_not_exists(db: Session, type: str, message: str, entity_id: str, entity_type: str, action: dict = None):
-    """Prevents creating duplicate notifications."""
-    existing = db.query(models.Notification).filter_by(
-        type=type,
-        related_entity_id=entity_id,
-        is_read=0
-    ).first()
-    
-    if not existing:
-        new_notif = models.Notification(
-            type=type,
-            message=message,
-            related_entity_id=entity_id,
-            related_entity_type=entity_type,
-            proposed_action=action
-        )
-        db.add(new_notif)
-        print(f"💡 PROACTIVE: Generated new '{type}' notification for {entity_type} {entity_id}.")
 
-def check_for_automation_suggestions(db: Session):
+def _create_notifications(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """Bulk insert-or-ignore of notification rows. Returns how many were created."""
+    Notification = models.Notification
+    created = bulk.insert_ignore(db, Notification, rows, returning=(
+        Notification.id, Notification.type, Notification.message,
+        Notification.related_entity_id, Notification.related_entity_type,
+    ))
+    # Core inserts bypass the ORM flush hook that announces new notifications
+    for row in created:
+        events.publish_after_commit(db, "notification.created", dict(row._mapping))
+    if created:
+        print(f"💡 PROACTIVE: Generated {len(created)} new '{rows[0]['type']}' notification(s).")
+    return len(created)
+
+
+def _suggested_conditions(exception_type: str) -> Dict[str, Any]:
+    return {"field": "review_category", "operator": "equals",
+            "value": EXCEPTION_REVIEW_CATEGORIES.get(exception_type, "data_mismatch")}
+
+
+def check_for_automation_suggestions(db: Session) -> int:
     """
-    Scans high-confidence learned heuristics and suggests promoting them to
-    formal automation rules.
+    Suggests promoting high-confidence learned heuristics to automation rules, one
+    suggestion per vendor, unless a rule was already created from the heuristic (rules
+    record it in source_heuristic_key) or a suggestion is still unread.
     """
-    # Find heuristics with high confidence that don't already have a corresponding rule
-    high_confidence_heuristics = db.query(models.LearnedHeuristic).filter(
-        models.LearnedHeuristic.confidence_score >= 0.9
+    Heuristic, Rule = models.LearnedHeuristic, models.AutomationRule
+    candidates = db.execute(
+        select(Heuristic.vendor_name, Heuristic.exception_type, Heuristic.condition_key)
+        .where(
+            Heuristic.confidence_score >= SUGGESTION_CONFIDENCE,
+            ~exists().where(
+                Rule.vendor_name == Heuristic.vendor_name,
+                Rule.source_heuristic_key == Heuristic.condition_key,
+                Rule.action == SUGGESTED_RULE_ACTION,
+            ),
+            _no_unread_notification("AutomationSuggestion", Heuristic.vendor_name),
+        )
+        .order_by(Heuristic.id)
     ).all()
-    
-    for heuristic in high_confidence_heuristics:
-        # Check if an automation rule for this exact case already exists
-        existing_rule = db.query(models.AutomationRule).filter_by(
-            vendor_name=heuristic.vendor_name,
-            conditions=heuristic.learned_condition,
-            action=heuristic.resolution_action
-        ).first()
-
-        if not existing_rule:
-            message = f"You often approve '{heuristic.exception_type}' for '{heuristic.vendor_name}' under certain conditions. Would you like to automate this?"
-            action = {
+
+    rows, seen_vendors = [], set()
+    for vendor_name, exception_type, heuristic_key in candidates:
+        if vendor_name in seen_vendors:
+            continue
+        seen_vendors.add(vendor_name)
+        rows.append({
+            "type": "AutomationSuggestion",
+            "message": f"You often approve '{exception_type}' for '{vendor_name}' under certain conditions. Would you like to automate this?",
+            "related_entity_id": vendor_name,
+            "related_entity_type": "Vendor",
+            "proposed_action": {
                 "tool_name": "create_automation_rule",
                 "args": {
-                    "rule_name": f"Auto-approve {heuristic.exception_type} for {heuristic.vendor_name}",
-                    "vendor_name": heuristic.vendor_name,
-                    "condition_json": str(heuristic.learned_condition).replace("'", '"'),
-                    "action": "approve" # Hard-coded for now
-                }
-            }
-            _create_notification_if_not_exists(db, "AutomationSuggestion", message, heuristic.vendor_name, "Vendor", action)
+                    "rule_name": f"Auto-approve {exception_type} for {vendor_name}",
+                    "vendor_name": vendor_name,
+                    "condition_json": json.dumps(_suggested_conditions(exception_type)),
+                    "action": SUGGESTED_RULE_ACTION,
+                    "source_heuristic_key": heuristic_key,
+                },
+            },
+        })
+    return _create_notifications(db, rows)
 
 
-def check_for_financial_optimizations(db: Session):
+def check_for_financial_optimizations(db: Session) -> int:
     """
     Scans for invoices with approaching early payment discounts.
     """
-    deadline = datetime.now().date() + timedelta(days=3)
-    
-    invoices_with_discounts = db.query(models.Invoice).filter(
-        models.Invoice.status == models.DocumentStatus.matched,
-        models.Invoice.discount_due_date.isnot(None),
-        models.Invoice.discount_due_date <= deadline,
-        models.Invoice.discount_due_date >= datetime.now().date()
+    today = datetime.now().date()
+    deadline = today + timedelta(days=3)
+    Invoice = models.Invoice
+
+    invoices_with_discounts = db.execute(
+        select(Invoice.invoice_id, Invoice.discount_amount, Invoice.discount_due_date)
+        .where(
+            Invoice.status == models.DocumentStatus.matched,
+            and_(Invoice.discount_due_date >= today, Invoice.discount_due_date <= deadline),
+            _no_unread_notification("Optimization", Invoice.invoice_id),
+        )
     ).all()
 
-    for inv in invoices_with_discounts:
-        message = f"Early payment discount of ${inv.discount_amount or 0:,.2f} for Invoice {inv.invoice_id} is expiring on {inv.discount_due_date}. Pay now to capture it."
-        _create_notification_if_not_exists(db, "Optimization", message, inv.invoice_id, "Invoice")
+    rows = [{
+        "type": "Optimization",
+        "message": f"Early payment discount of ${discount_amount or 0:,.2f} for Invoice {invoice_id} is expiring on {discount_due_date}. Pay now to capture it.",
+        "related_entity_id": invoice_id,
+        "related_entity_type": "Invoice",
+    } for invoice_id, discount_amount, discount_due_date in invoices_with_discounts]
+    return _create_notifications(db, rows)
+
 
 def run_monitoring_cycle(db: Session):
     """
@@ -85,4 +143,4 @@ def run_monitoring_cycle(db: Session):
     except Exception as e:
         print(f"❌ Error during monitoring cycle: {e}")
         db.rollback()
-    print("--- ✅ Monitoring Cycle Complete ---") 
\ No newline at end of file
+    print("--- ✅ Monitoring Cycle Complete ---")
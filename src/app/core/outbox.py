@@ -0,0 +1,220 @@
+# src/app/core/outbox.py
+"""
+Transactional outbox.
+
+Changes that other parts of the system react to are recorded as rows in
+outbox_events, inside the same transaction as the change itself, so an event exists
+if and only if its change was committed.
+
+The event types themselves (invoice.ingested, invoice.status_changed, ...) and the
+flush hook that records them are defined in app.core.domain_events.
+
+A dispatcher thread delivers pending events to the handlers subscribed to their
+type. It is woken as soon as a session in this process commits new events, and
+polls every `outbox_poll_s` for events committed elsewhere. Workers claim batches
+with a guarded UPDATE, so each event is handled by one worker. If a batch fails, its
+events are delivered one at a time, and only the events that still fail are retried
+with backoff, up to `outbox_max_attempts`. All handlers of one event type
+share the batch's transaction, so their writes commit together with the events being
+marked delivered.
+"""
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import bulk, models
+from app.db.session import SessionLocal
+
+# Set on a session once it has written outbox rows, so its commit wakes the dispatcher
+_WROTE_KEY = "outbox_written"
+
+Handler = Callable[[Session, List[models.OutboxEvent]], None]
+
+
+def record_many(db: Session, rows: List[Dict[str, Any]]):
+    """Writes outbox rows ({event_type, aggregate_id, payload}) in the session's transaction."""
+    if not rows:
+        return
+    bulk.bulk_insert(db, models.OutboxEvent, rows)
+    db.info[_WROTE_KEY] = True
+
+
+def record(db: Session, event_type: str, payload: Dict[str, Any], aggregate_id: Optional[int] = None):
+    record_many(db, [{"event_type": event_type, "aggregate_id": aggregate_id, "payload": payload}])
+
+
+def record_in_flush(session: Session, rows: List[Dict[str, Any]]):
+    """record_many for after_flush hooks, where the session itself cannot be flushed again."""
+    if not rows:
+        return
+    # Written on the flush's own connection, so it commits or rolls back with the change
+    session.connection().execute(insert(models.OutboxEvent), rows)
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session: Session):
+    if session.info.pop(_WROTE_KEY, None):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_writes(session: Session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_WROTE_KEY, None)
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Earliest pending retry, so the dispatcher wakes for it without waiting a full poll
+        self._retry_at: Optional[datetime] = None
+
+    def subscribe(self, event_type: str, handler: Handler):
+        """Registers a handler; it receives the session and a batch of events of that type."""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def wake(self):
+        self._wake.set()
+
+    def _claim(self, db: Session, now: datetime) -> List[models.OutboxEvent]:
+        Event = models.OutboxEvent
+        pending = (
+            select(Event.id)
+            .where(Event.processed_at.is_(None), Event.available_at <= now,
+                   Event.claimed_until.is_(None) | (Event.claimed_until < now))
+            .order_by(Event.id)
+            .limit(settings.outbox_batch_size)
+        )
+        claim_id = f"{self.worker_id}:{uuid.uuid4().hex[:6]}"
+        # The WHERE is re-checked per row, so two workers never claim the same event
+        db.execute(
+            update(Event)
+            .where(Event.id.in_(pending.scalar_subquery()), Event.processed_at.is_(None),
+                   Event.claimed_until.is_(None) | (Event.claimed_until < now))
+            .values(claimed_by=claim_id, claimed_until=now + timedelta(minutes=5))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return db.query(Event).filter(Event.claimed_by == claim_id, Event.processed_at.is_(None)).order_by(Event.id).all()
+
+    def _deliver(self, db: Session, batch: List[models.OutboxEvent]):
+        by_type: Dict[str, List[models.OutboxEvent]] = {}
+        for outbox_event in batch:
+            by_type.setdefault(outbox_event.event_type, []).append(outbox_event)
+
+        for event_type, events in by_type.items():
+            error = self._deliver_events(db, event_type, events)
+            if error is None:
+                continue
+            print(f"Error delivering {len(events)} '{event_type}' outbox event(s): {error}")
+            if len(events) == 1:
+                self._retry_later(db, [events[0].id], str(error))
+                continue
+            # Isolate the failing event(s), so healthy events are not held back or given up with them
+            for outbox_event in events:
+                error = self._deliver_events(db, event_type, [outbox_event])
+                if error is not None:
+                    print(f"Error delivering '{event_type}' outbox event {outbox_event.id}: {error}")
+                    self._retry_later(db, [outbox_event.id], str(error))
+
+    def _deliver_events(self, db: Session, event_type: str, events: List[models.OutboxEvent]) -> Optional[Exception]:
+        """Runs the handlers and marks the events delivered in one transaction; returns the error if it failed."""
+        try:
+            for handler in self._handlers.get(event_type, []):
+                handler(db, events)
+            now = datetime.utcnow()
+            for outbox_event in events:
+                outbox_event.processed_at = now
+                outbox_event.claimed_until = None
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+
+    def _retry_later(self, db: Session, ids: List[int], error: str):
+        now = datetime.utcnow()
+        for outbox_event in db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(ids)):
+            outbox_event.attempts = (outbox_event.attempts or 0) + 1
+            outbox_event.last_error = error[:1000]
+            outbox_event.claimed_until = None
+            if outbox_event.attempts >= settings.outbox_max_attempts:
+                # Give up; the event stays in the table with its error for inspection
+                outbox_event.processed_at = now
+            else:
+                outbox_event.available_at = now + timedelta(seconds=2 ** outbox_event.attempts)
+                if self._retry_at is None or outbox_event.available_at < self._retry_at:
+                    self._retry_at = outbox_event.available_at
+        db.commit()
+
+    def dispatch_pending(self) -> int:
+        """Delivers everything currently pending. Returns the number of events handled."""
+        handled = 0
+        with SessionLocal() as db:
+            while True:
+                batch = self._claim(db, datetime.utcnow())
+                if not batch:
+                    return handled
+                self._deliver(db, batch)
+                handled += len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            timeout = settings.outbox_poll_s
+            if self._retry_at is not None:
+                timeout = min(timeout, max((self._retry_at - datetime.utcnow()).total_seconds(), 0))
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            # A commit may wake the dispatcher before a pending retry is due; keep that retry's time
+            if self._retry_at is not None and self._retry_at <= datetime.utcnow():
+                self._retry_at = None
+            try:
+                self.dispatch_pending()
+            except Exception as e:
+                print(f"Error in outbox dispatcher: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        # Deliver whatever was left over from before the restart
+        self.wake()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+dispatcher = OutboxDispatcher()
+
+
+def prune_delivered(db: Session, retention_days: Optional[int] = None) -> int:
+    """Deletes delivered events older than the retention horizon."""
+    if retention_days is None:
+        retention_days = settings.outbox_retention_days
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.execute(delete(models.OutboxEvent).where(
+        models.OutboxEvent.processed_at.is_not(None), models.OutboxEvent.processed_at < cutoff
+    ))
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,198 @@
+# src/app/core/scheduler.py
+"""
+Recurring background jobs (monitoring, automation sweep, archival).
+
+Each job has its own interval plus random jitter and runs in a thread pool, so its
+synchronous database work never blocks the event loop. The schedule lives in the
+scheduled_jobs table: a worker runs a job only after atomically claiming its row
+
+    UPDATE scheduled_jobs SET locked_by = :me, locked_until = :now + lease
+    WHERE name = :job AND next_run_at <= :now
+      AND (locked_until IS NULL OR locked_until < :now)
+
+so with several uvicorn workers (or nodes) each run happens once, on whichever
+worker claims it first. A worker that dies mid-run loses its lease after
+`scheduler_lease_s`. Every run is recorded in scheduler_runs with its duration.
+"""
+import asyncio
+import os
+import random
+import socket
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+
+JobFunc = Callable[[Session], object]
+
+
+@dataclass(frozen=True)
+class ScheduledTask:
+    name: str
+    func: JobFunc
+    interval_s: int
+
+
+class Scheduler:
+    def __init__(self, tasks: List[ScheduledTask]):
+        self.tasks: Dict[str, ScheduledTask] = {task.name: task for task in tasks}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Future] = {}
+        self._sleep_s: float = settings.scheduler_poll_s
+
+    # --- Shared schedule ---
+
+    def _next_run(self, task: ScheduledTask, after: datetime) -> datetime:
+        jitter = task.interval_s * settings.scheduler_jitter_percent / 100
+        return after + timedelta(seconds=task.interval_s + random.uniform(0, jitter))
+
+    def _register(self):
+        """Creates the schedule rows of jobs no worker has registered yet; they run soon after."""
+        with SessionLocal() as db:
+            known = set(db.scalars(select(models.ScheduledJob.name)))
+            now = datetime.utcnow()
+            for task in self.tasks.values():
+                if task.name in known:
+                    continue
+                # Spread the first runs of all jobs over a few seconds
+                db.add(models.ScheduledJob(name=task.name, next_run_at=now + timedelta(seconds=random.uniform(0, 5))))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback() # Another worker registered it first
+
+    def _claim(self, db: Session, task: ScheduledTask, now: datetime) -> bool:
+        Job = models.ScheduledJob
+        result = db.execute(
+            update(Job)
+            .where(Job.name == task.name, Job.next_run_at <= now,
+                   (Job.locked_until.is_(None)) | (Job.locked_until < now))
+            .values(locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=settings.scheduler_lease_s),
+                    last_started_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _release(self, db: Session, task: ScheduledTask, finished: datetime, status: str):
+        Job = models.ScheduledJob
+        db.execute(
+            update(Job)
+            .where(Job.name == task.name, Job.locked_by == self.worker_id)
+            .values(next_run_at=self._next_run(task, finished), locked_by=None, locked_until=None,
+                    last_finished_at=finished, last_status=status)
+            .execution_options(synchronize_session=False)
+        )
+
+    # --- Running a job (in the thread pool) ---
+
+    def run_task(self, task: ScheduledTask) -> Optional[str]:
+        """Claims and runs one job if it is due. Returns the run's status, or None if not claimed."""
+        with SessionLocal() as db:
+            started = datetime.utcnow()
+            if not self._claim(db, task, started):
+                return None
+            run = models.SchedulerRun(job_name=task.name, worker=self.worker_id, started_at=started)
+            db.add(run)
+            db.commit()
+            run_id = run.id
+
+        status, error = "success", None
+        try:
+            with SessionLocal() as job_db:
+                task.func(job_db)
+        except Exception as e:
+            status, error = "failed", "".join(traceback.format_exception_only(type(e), e)).strip()
+            print(f"Error in scheduled job '{task.name}': {e}")
+
+        finished = datetime.utcnow()
+        with SessionLocal() as db:
+            db.execute(
+                update(models.SchedulerRun).where(models.SchedulerRun.id == run_id)
+                .values(finished_at=finished, status=status, error=error,
+                        duration_ms=int((finished - started).total_seconds() * 1000))
+            )
+            self._release(db, task, finished, status)
+            db.execute(delete(models.SchedulerRun).where(
+                models.SchedulerRun.job_name == task.name,
+                models.SchedulerRun.started_at < finished - timedelta(days=settings.scheduler_history_days),
+            ))
+            db.commit()
+        return status
+
+    def _due_tasks(self) -> List[ScheduledTask]:
+        """Returns the jobs due now and records how long to sleep until the next one is."""
+        with SessionLocal() as db:
+            schedule = dict(db.execute(select(models.ScheduledJob.name, models.ScheduledJob.next_run_at)).all())
+        now = datetime.utcnow()
+        due, next_due = [], None
+        for name, task in self.tasks.items():
+            next_run_at = schedule.get(name)
+            if next_run_at is None or name in self._running:
+                continue
+            if next_run_at <= now:
+                due.append(task)
+            elif next_due is None or next_run_at < next_due:
+                next_due = next_run_at
+        self._sleep_s = settings.scheduler_poll_s
+        if next_due is not None:
+            self._sleep_s = min(self._sleep_s, max((next_due - now).total_seconds(), 0.5))
+        return due
+
+    # --- Event loop side ---
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._register)
+        while True:
+            try:
+                due = await loop.run_in_executor(self._executor, self._due_tasks)
+                for task in due:
+                    future = loop.run_in_executor(self._executor, self.run_task, task)
+                    self._running[task.name] = future
+                    future.add_done_callback(lambda f, name=task.name: self._running.pop(name, None))
+                sleep_s = self._sleep_s
+            except Exception as e:
+                print(f"Error in scheduler loop: {e}")
+                sleep_s = settings.scheduler_poll_s
+            await asyncio.sleep(sleep_s)
+
+    def start(self):
+        """Starts the scheduler on the running event loop."""
+        # One thread per job plus one for reading the schedule
+        self._executor = ThreadPoolExecutor(max_workers=len(self.tasks) + 1, thread_name_prefix="scheduler")
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._loop_task is None:
+            return
+        self._loop_task.cancel()
+        try:
+            await self._loop_task
+        except asyncio.CancelledError:
+            pass
+        self._loop_task = None
+        # Let in-flight jobs finish in the background; their leases expire if they never do
+        self._executor.shutdown(wait=False)
+        print("Scheduler stopped.")
+
+
+def recent_runs(db: Session, job_name: Optional[str] = None, limit: int = 50) -> List[models.SchedulerRun]:
+    """Most recent runs, newest first."""
+    query = db.query(models.SchedulerRun)
+    if job_name:
+        query = query.filter(models.SchedulerRun.job_name == job_name)
+    return query.order_by(models.SchedulerRun.started_at.desc(), models.SchedulerRun.id.desc()).limit(limit).all()
@@ -0,0 +1,157 @@
+# src/app/db/bulk.py
+"""
+Bulk insert paths. On Postgres (psycopg2) rows are streamed with COPY FROM STDIN, which
+is far cheaper than row-by-row INSERTs; elsewhere it falls back to a single
+executemany INSERT. Either way the rows are written on the session's connection, in
+its current transaction.
+"""
+import enum
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Sequence
+
+from sqlalchemy import JSON, Enum, Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# Below this many rows COPY's setup cost is not worth it
+COPY_MIN_ROWS = 50
+
+
+def _table_of(target) -> Table:
+    return target.__table__ if hasattr(target, "__table__") else target
+
+
+def _apply_defaults(table: Table, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    COPY bypasses SQLAlchemy's Python-side column defaults (e.g. created_at), so fill
+    them in here. Server-side defaults and autoincrement keys are left to the database.
+    """
+    defaults = {}
+    for column in table.columns:
+        default = column.default
+        if default is None or column.primary_key:
+            continue
+        if default.is_callable:
+            defaults[column.key] = default.arg
+        elif default.is_scalar:
+            defaults[column.key] = lambda ctx, value=default.arg: value
+
+    filled = []
+    for row in rows:
+        row = dict(row)
+        for key, make_default in defaults.items():
+            if key not in row:
+                row[key] = make_default(None)
+        filled.append(row)
+    return filled
+
+
+def _copy_value(column, value: Any) -> str:
+    """Encodes a value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(column.type, JSON):
+        value = json.dumps(value, default=str)
+    elif isinstance(column.type, Enum) and isinstance(value, enum.Enum):
+        # SQLAlchemy stores Python enums by member name
+        value = value.name
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    else:
+        value = str(value)
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+                 .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _copy_rows(db: Session, table: Table, rows: List[Dict[str, Any]]):
+    keys = sorted({key for row in rows for key in row})
+    columns = [table.columns[key] for key in keys]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(column, row.get(column.key)) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    quoted_columns = ", ".join(f'"{column.name}"' for column in columns)
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY "{table.name}" ({quoted_columns}) FROM STDIN', buffer)
+
+
+def _supports_copy(db: Session) -> bool:
+    bind = db.get_bind()
+    return bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+
+
+def bulk_insert(db: Session, target, rows: Sequence[Dict[str, Any]]) -> int:
+    """
+    Inserts plain dict rows into a model's table (or a Table). Returns the row count.
+    Rows are not loaded into the session, so no ORM objects or IDs come back.
+    """
+    if not rows:
+        return 0
+    table = _table_of(target)
+    # Pending ORM objects (e.g. the parent rows these reference) must reach the DB first
+    db.flush()
+    if len(rows) >= COPY_MIN_ROWS and _supports_copy(db):
+        _copy_rows(db, table, _apply_defaults(table, rows))
+    else:
+        db.execute(insert(table), list(rows))
+    return len(rows)
+
+
+def _dialect_insert(db: Session, table: Table, operation: str):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"{operation}() is not implemented for the '{dialect}' dialect.")
+
+
+def insert_ignore(db: Session, target, rows: Sequence[Dict[str, Any]], returning: Sequence[Any] = ()) -> List[Any]:
+    """
+    Inserts rows, skipping any that would violate a unique constraint or index
+    (INSERT ... ON CONFLICT DO NOTHING). Returns the `returning` values of the rows
+    actually inserted.
+    """
+    if not rows:
+        return []
+    table = _table_of(target)
+    stmt = _dialect_insert(db, table, "insert_ignore").on_conflict_do_nothing()
+    db.flush()
+    if returning:
+        # Sent as multi-row INSERTs; RETURNING only reports the rows that were inserted
+        return db.execute(stmt.returning(*returning), list(rows)).all()
+    db.execute(stmt, list(rows))
+    return []
+
+
+def upsert_statement(db: Session, target, index_elements: Sequence[str], set_: Callable[[Table, Any], Dict[str, Any]]):
+    """The INSERT ... ON CONFLICT DO UPDATE statement `upsert` runs, for callers that execute it themselves."""
+    table = _table_of(target)
+    stmt = _dialect_insert(db, table, "upsert")
+    return stmt.on_conflict_do_update(index_elements=list(index_elements), set_=set_(table, stmt.excluded))
+
+
+def upsert(db: Session, target, rows: Sequence[Dict[str, Any]], index_elements: Sequence[str],
+           set_: Callable[[Table, Any], Dict[str, Any]], returning: Sequence[Any] = ()) -> List[Any]:
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE, in one statement, so concurrent
+    writers cannot both insert the same key. `set_(table, excluded)` returns the update
+    values; `table` columns refer to the existing row and `excluded` to the proposed one.
+    Rows must not repeat a key (Postgres refuses to update a row twice in one statement).
+    Column onupdate defaults are not applied to the update, so set_ must include them.
+    """
+    if not rows:
+        return []
+    stmt = upsert_statement(db, target, index_elements, set_)
+    db.flush()
+    if returning:
+        return db.execute(stmt.returning(*returning), list(rows)).all()
+    db.execute(stmt, list(rows))
+    return []
@@ -0,0 +1,89 @@
+# src/app/db/functions.py
+"""
+Dialect-portable SQL expressions for date arithmetic and truncation.
+
+SQLite has no interval type, so day differences were written with julianday(), which
+does not exist on Postgres. These constructs compile to the right SQL for each backend.
+"""
+from sqlalchemy import Date, DateTime, Float
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+class days_between(FunctionElement):
+    """
+    Fractional number of days from `start` to `end` (end - start). Works for Date and
+    DateTime columns. Usage: func.avg(days_between(Invoice.paid_date, Invoice.invoice_date))
+    """
+    type = Float()
+    inherit_cache = True
+    name = "days_between"
+
+    def __init__(self, end, start):
+        super().__init__(end, start)
+
+
+class utc_now(FunctionElement):
+    """The current UTC time as a naive timestamp, comparable with our DateTime columns."""
+    type = DateTime()
+    inherit_cache = True
+    name = "utc_now"
+
+
+def _args(element):
+    return list(element.clauses)
+
+
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    end, start = _args(element)
+    return f"(julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)}))"
+
+
+@compiles(days_between, "postgresql")
+def _days_between_postgresql(element, compiler, **kw):
+    end, start = _args(element)
+    return (f"(EXTRACT(EPOCH FROM (CAST({compiler.process(end, **kw)} AS TIMESTAMP) - "
+            f"CAST({compiler.process(start, **kw)} AS TIMESTAMP))) / 86400.0)")
+
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    raise CompileError(f"days_between() is not implemented for the '{compiler.dialect.name}' dialect.")
+
+
+@compiles(utc_now, "sqlite")
+def _utc_now_sqlite(element, compiler, **kw):
+    # UTC like CURRENT_TIMESTAMP, but with fractional seconds, so fresh rows do not come
+    # out up to a second in the future
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+@compiles(utc_now, "postgresql")
+def _utc_now_postgresql(element, compiler, **kw):
+    return "(NOW() AT TIME ZONE 'utc')"
+
+
+@compiles(utc_now)
+def _utc_now_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+class day_of(FunctionElement):
+    """The calendar day of a DateTime column, as a Date."""
+    type = Date()
+    inherit_cache = True
+    name = "day_of"
+
+
+@compiles(day_of, "sqlite")
+def _day_of_sqlite(element, compiler, **kw):
+    (value,) = _args(element)
+    return f"date({compiler.process(value, **kw)})"
+
+
+@compiles(day_of)
+def _day_of_default(element, compiler, **kw):
+    (value,) = _args(element)
+    return f"CAST({compiler.process(value, **kw)} AS DATE)"
@@ -2,10 +2,14 @@
 import enum
 from datetime import datetime
 from sqlalchemy import (Column, Integer, String, Float, Date, JSON, Enum, 
-                        ForeignKey, DateTime, func, Boolean)
-from sqlalchemy.orm import relationship
+                        ForeignKey, DateTime, func, Boolean, Index, Table,
+                        false, select, true, union_all)
+from sqlalchemy import event
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.ext.declarative import declarative_base
 
+from app.utils.condition_keys import condition_key as _condition_key
+
 Base = declarative_base()
 
 class InvoicePurchaseOrderAssociation(Base):
@@ -39,6 +43,61 @@ class Job(Base):
     processed_files = Column(Integer, default=0)
     summary = Column(JSON, nullable=True)
 
+class ScheduledJob(Base):
+    """
+    Shared schedule and leader lease for a recurring background job. A worker runs a
+    job only after claiming its row (next_run_at due, lease free), so across workers
+    and nodes each run happens exactly once.
+    """
+    __tablename__ = "scheduled_jobs"
+    name = Column(String, primary_key=True)
+    next_run_at = Column(DateTime, nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)
+
+class SchedulerRun(Base):
+    """Run history of scheduled jobs."""
+    __tablename__ = "scheduler_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False)
+    worker = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    status = Column(String, nullable=False, default="running") # running, success, failed
+    error = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_scheduler_runs_job_started", "job_name", "started_at"),
+    )
+
+class OutboxEvent(Base):
+    """
+    Transactional outbox: events written in the same transaction as the change they
+    describe, then delivered to in-process handlers by app.core.outbox's dispatcher.
+    """
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String, nullable=False)
+    aggregate_id = Column(Integer, nullable=True) # e.g. the invoice's DB ID
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Delivery state
+    available_at = Column(DateTime, default=datetime.utcnow) # Pushed back after a failed attempt
+    claimed_by = Column(String, nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The dispatcher scans undelivered events in order
+        Index("ix_outbox_events_pending", "processed_at", "available_at", "id"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -52,6 +111,55 @@ class AuditLog(Base):
     invoice_db_id = Column(Integer, ForeignKey("invoices.id"), nullable=True, index=True)
     invoice = relationship("Invoice", back_populates="audit_logs")
 
+    __table_args__ = (
+        # Paginated per-invoice timeline, newest first
+        Index("ix_audit_logs_invoice_timeline", "invoice_db_id", "timestamp", "id"),
+        # Archival scans for the oldest entries
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+    )
+
+class AuditArchiveSegment(Base):
+    """A compressed JSON-lines file of audit log entries moved out of the hot table."""
+    __tablename__ = "audit_archive_segments"
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, nullable=False, unique=True)
+    codec = Column(String, nullable=False) # 'zstd' or 'gzip'
+    row_count = Column(Integer, nullable=False)
+    min_timestamp = Column(DateTime, nullable=True)
+    max_timestamp = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AuditArchiveIndex(Base):
+    """Which segments hold entries for which invoice, so archived history stays queryable."""
+    __tablename__ = "audit_archive_index"
+    id = Column(Integer, primary_key=True, index=True)
+    segment_id = Column(Integer, ForeignKey("audit_archive_segments.id", ondelete="CASCADE"), nullable=False)
+    invoice_db_id = Column(Integer, nullable=True)
+    entity_id = Column(String, nullable=True)
+    entry_count = Column(Integer, nullable=False)
+    min_timestamp = Column(DateTime, nullable=True)
+    max_timestamp = Column(DateTime, nullable=True)
+    # Where this group's entries sit in the segment: one compressed frame of their own,
+    # so they can be read without decompressing the rest (NULL for older segments)
+    byte_offset = Column(Integer, nullable=True)
+    byte_length = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_audit_archive_index_invoice", "invoice_db_id", "max_timestamp"),
+        Index("ix_audit_archive_index_entity", "entity_id"),
+    )
+
+class ConfigVersion(Base):
+    """
+    Version counter per cached configuration section (vendor settings, automation
+    rules, heuristics), bumped in the same transaction as the change; see
+    app.core.config_cache.
+    """
+    __tablename__ = "config_versions"
+    section = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class VendorSetting(Base):
     __tablename__ = "vendor_settings"
     id = Column(Integer, primary_key=True, index=True)
@@ -73,6 +181,8 @@ class LearnedHeuristic(Base):
     # Stores the specific conditions of the learned rule
     # e.g., {"max_variance_percent": 10.0} for a PriceMismatch
     learned_condition = Column(JSON, nullable=False)
+    # Hash of learned_condition (see app.utils.condition_keys), kept in sync on save
+    condition_key = Column(String(32), nullable=False)
     
     # The action the user took that we are learning from
     resolution_action = Column(String, nullable=False) 
@@ -86,6 +196,12 @@ class LearnedHeuristic(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_applied_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # One heuristic per vendor, exception and condition; learning upserts against it
+        Index("ux_learned_heuristics_condition", "vendor_name", "exception_type", "condition_key", unique=True),
+        Index("ix_learned_heuristics_last_applied_at", "last_applied_at"),
+    )
+
 class Notification(Base):
     """
     Stores proactive alerts and suggestions generated by the system's
@@ -110,6 +226,13 @@ class Notification(Base):
     is_read = Column(Integer, default=0) # 0 for unread, 1 for read
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # At most one unread notification of a type per entity; the monitoring cycle
+        # inserts with ON CONFLICT DO NOTHING against this index
+        Index("ux_notifications_unread_entity", "type", "related_entity_id", unique=True,
+              sqlite_where=(is_read == 0), postgresql_where=(is_read == 0)),
+    )
+
 class AutomationRule(Base):
     __tablename__ = "automation_rules"
     id = Column(Integer, primary_key=True, index=True)
@@ -120,6 +243,24 @@ class AutomationRule(Base):
     conditions = Column(JSON, nullable=False) # e.g., {"field": "grand_total", "operator": "<", "value": 500}
     action = Column(String, nullable=False) # e.g., "approve"
     is_active = Column(Integer, default=1)
+    # Hash of conditions (see app.utils.condition_keys), kept in sync on save
+    condition_key = Column(String(32), nullable=True)
+    # condition_key of the learned heuristic a suggested rule was created from
+    source_heuristic_key = Column(String(32), nullable=True)
+
+    __table_args__ = (
+        Index("ix_automation_rules_vendor_source_heuristic", "vendor_name", "source_heuristic_key"),
+    )
+
+@event.listens_for(LearnedHeuristic, "before_insert")
+@event.listens_for(LearnedHeuristic, "before_update")
+def _set_heuristic_condition_key(mapper, connection, target):
+    target.condition_key = _condition_key(target.learned_condition)
+
+@event.listens_for(AutomationRule, "before_insert")
+@event.listens_for(AutomationRule, "before_update")
+def _set_rule_condition_key(mapper, connection, target):
+    target.condition_key = _condition_key(target.conditions)
 
 class PurchaseOrder(Base):
     __tablename__ = "purchase_orders"
@@ -208,7 +349,8 @@ class Invoice(Base):
     payment_batch_id = Column(String, index=True, nullable=True)
     
     # Timestamps for KPI calculation
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # The previous value is loaded on change, so the KPI rollups can refresh the day it leaves
+    created_at = column_property(Column(DateTime, default=datetime.utcnow), active_history=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Link to the processing job
@@ -221,6 +363,54 @@ class Invoice(Base):
     comments = relationship("Comment", back_populates="invoice", cascade="all, delete-orphan")
     audit_logs = relationship("AuditLog", back_populates="invoice", cascade="all, delete-orphan")
 
+    # Composite indexes backing the keyset-paginated list views, which filter by
+    # status and page through (sort key, id).
+    __table_args__ = (
+        Index("ix_invoices_status_invoice_date_id", "status", "invoice_date", "id"),
+        Index("ix_invoices_status_due_date_id", "status", "due_date", "id"),
+        Index("ix_invoices_status_review_category", "status", "review_category"),
+        # Daily KPI rollups are recomputed one creation day at a time
+        Index("ix_invoices_created_at", "created_at"),
+        # Expiring-discount scan of the monitoring cycle
+        Index("ix_invoices_status_discount_due_date", "status", "discount_due_date"),
+    )
+
+# Automation rules scoped to a vendor select by status and case-insensitive vendor
+Index("ix_invoices_status_vendor_lower", Invoice.status, func.lower(Invoice.vendor_name))
+
+# --- Cold tier for closed invoices ---
+# Paid/rejected invoices past the archive horizon are moved here by
+# app.core.invoice_archive, so day-to-day queries on `invoices` only touch open work.
+# The table mirrors every Invoice column, plus snapshots of the rows that pointed at
+# the invoice (PO/GRN links and comments); its audit entries go to the audit archive.
+invoices_archive = Table(
+    "invoices_archive", Base.metadata,
+    *[column._copy() for column in Invoice.__table__.columns],
+    Column("archived_at", DateTime, default=datetime.utcnow),
+    Column("purchase_order_ids", JSON, nullable=True),
+    Column("grn_ids", JSON, nullable=True),
+    Column("comments", JSON, nullable=True),
+    # Historical reports filter by period and vendor
+    Index("ix_invoices_archive_created_at", "created_at"),
+    Index("ix_invoices_archive_vendor_name", "vendor_name"),
+)
+
+class ArchivedInvoice(Base):
+    __table__ = invoices_archive
+
+# Historical reports read through this union of the hot and archived invoices. It is
+# mapped like a read-only table, so queries written against Invoice work unchanged.
+INVOICE_HISTORY_COLUMNS = [column.name for column in Invoice.__table__.columns]
+invoice_history = union_all(
+    select(*[Invoice.__table__.c[name] for name in INVOICE_HISTORY_COLUMNS], false().label("is_archived")),
+    select(*[invoices_archive.c[name] for name in INVOICE_HISTORY_COLUMNS], true().label("is_archived")),
+).subquery("invoice_history")
+
+class InvoiceHistory(Base):
+    """Read-only view over `invoices` UNION ALL `invoices_archive`."""
+    __table__ = invoice_history
+    __mapper_args__ = {"primary_key": [invoice_history.c.id]}
+
 class Comment(Base):
     __tablename__ = "comments"
     id = Column(Integer, primary_key=True, index=True)
@@ -230,4 +420,82 @@ class Comment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     # Add a type field for distinguishing communications
     type = Column(String, default="internal") # 'internal', 'vendor', 'internal_review'
-    invoice = relationship("Invoice", back_populates="comments") 
\ No newline at end of file
+    invoice = relationship("Invoice", back_populates="comments")
+
+    __table_args__ = (
+        Index("ix_comments_invoice_timeline", "invoice_id", "created_at", "id"),
+    )
+
+class ComparisonSnapshot(Base):
+    """
+    The resolution workbench payload for an invoice (line pairing, related documents,
+    suggestion), persisted by the matching engine. `source_stamp` records the state of
+    the inputs it was built from, so a read can tell whether it is still current.
+    """
+    __tablename__ = "comparison_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_db_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), unique=True, nullable=False)
+    version = Column(Integer, nullable=False, default=1) # Bumped on every rebuild
+    format_version = Column(Integer, nullable=False)
+    source_stamp = Column(JSON, nullable=False)
+    payload = Column(JSON, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class InvoiceDailyRollup(Base):
+    """
+    Invoice count and total value per creation day and status, kept current by
+    app.core.kpi_rollups from invoice events so dashboard totals need not scan invoices.
+    """
+    __tablename__ = "invoice_daily_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=True) # Day of created_at; NULL for invoices without one
+    status = Column(Enum(DocumentStatus), nullable=False)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=True) # Sum of grand_total
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_invoice_daily_rollups_day_status", "day", "status", unique=True),
+    )
+
+class SavedView(Base):
+    """A named invoice search (filters + sort) that can be re-run from the explorer."""
+    __tablename__ = "saved_views"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    filters = Column(JSON, nullable=False, default=list) # List of {field, operator, value}
+    sort_by = Column(String, default="invoice_date")
+    sort_order = Column(String, default="desc")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentLine(Base):
+    """
+    One row per line item of an invoice, PO or GRN. A relational copy of the JSON
+    `line_items` columns (which stay the source of truth) so item-level analytics,
+    price history and SKU lookups can run in SQL.
+    """
+    __tablename__ = "document_lines"
+    id = Column(Integer, primary_key=True, index=True)
+    doc_type = Column(String, nullable=False) # 'invoice', 'purchase_order' or 'grn'
+    doc_id = Column(Integer, nullable=False)
+    doc_reference = Column(String) # invoice_id / po_number / grn_number
+    doc_date = Column(Date, nullable=True) # invoice_date / order_date / received_date
+    vendor_name = Column(String, nullable=True)
+    line_number = Column(Integer, nullable=False)
+    sku = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    po_number = Column(String, nullable=True) # PO referenced by an invoice line
+    quantity = Column(Float, nullable=True)
+    unit = Column(String, nullable=True)
+    unit_price = Column(Float, nullable=True)
+    line_total = Column(Float, nullable=True)
+    normalized_qty = Column(Float, nullable=True)
+    normalized_unit = Column(String, nullable=True)
+    normalized_unit_price = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_document_lines_doc", "doc_type", "doc_id", "line_number"),
+        Index("ix_document_lines_sku_date", "sku", "doc_date"),
+        Index("ix_document_lines_description", "description", "doc_type"),
+    )
@@ -171,6 +171,50 @@ class SearchRequest(BaseModel):
     filters: List[FilterCondition] = Field(default_factory=list)
     sort_by: str = 'invoice_date'
     sort_order: str = 'desc'
+    # Keyset pagination: omit `limit` to get every matching row.
+    limit: Optional[int] = Field(default=None, ge=1, le=1000)
+    cursor: Optional[str] = None
+    include_total: bool = False
+
+class SavedViewCreate(BaseModel):
+    name: str = Field(min_length=1)
+    filters: List[FilterCondition] = Field(default_factory=list)
+    sort_by: str = 'invoice_date'
+    sort_order: str = 'desc'
+
+class SavedView(SavedViewCreate):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class TextSearchResult(BaseModel):
+    doc_type: str # 'invoice', 'purchase_order' or 'grn'
+    doc_id: int
+    reference: Optional[str] = None
+    vendor: Optional[str] = None
+    snippet: Optional[str] = None
+    score: float
+
+class DocumentLine(BaseModel):
+    doc_type: str
+    doc_id: int
+    doc_reference: Optional[str] = None
+    doc_date: Optional[date] = None
+    vendor_name: Optional[str] = None
+    line_number: int
+    sku: Optional[str] = None
+    description: Optional[str] = None
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+    unit_price: Optional[float] = None
+    line_total: Optional[float] = None
+    normalized_qty: Optional[float] = None
+    normalized_unit: Optional[str] = None
+    normalized_unit_price: Optional[float] = None
+    class Config:
+        from_attributes = True
 
 # --- NEW CONFIGURATION SCHEMAS ---
 
@@ -198,6 +242,8 @@ class AutomationRuleBase(BaseModel):
     action: str
     is_active: bool = True
     source: str = "user"
+    # Set when the rule is created from an automation suggestion
+    source_heuristic_key: Optional[str] = None
 
 class AutomationRuleCreate(AutomationRuleBase):
     pass
@@ -1,23 +1,127 @@
-# database.py
-from sqlalchemy import create_engine
+ # database.py
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.db.models import Base
-from app.config import settings
+from app.db import upgrades
+from app.config import settings, PARALLEL_WORKERS
 
 # The database URL for a local SQLite file
 SQLALCHEMY_DATABASE_URL = settings.database_url
+# Hosted Postgres providers often hand out postgres:// URLs, which SQLAlchemy rejects
+if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
+    SQLALCHEMY_DATABASE_URL = "postgresql://" + SQLALCHEMY_DATABASE_URL[len("postgres://"):]
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+IS_POSTGRES = SQLALCHEMY_DATABASE_URL.startswith("postgresql")
+# In-memory databases live in a single connection, so pooling/WAL do not apply
+IS_SQLITE_MEMORY = IS_SQLITE and (":memory:" in SQLALCHEMY_DATABASE_URL or SQLALCHEMY_DATABASE_URL.rstrip("/") == "sqlite:")
+
+# Room for every ingestion worker plus the job thread, matching and API requests
+POOL_SIZE = settings.db_pool_size or PARALLEL_WORKERS + 4
+
+
+def _create_engine():
+    if IS_SQLITE_MEMORY:
+        return create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+    if IS_SQLITE:
+        return create_engine(
+            SQLALCHEMY_DATABASE_URL,
+            connect_args={
+                "check_same_thread": False,
+                # pysqlite's busy handler: wait for the write lock instead of failing at once
+                "timeout": settings.sqlite_busy_timeout_ms / 1000,
+            },
+            pool_size=POOL_SIZE,
+            max_overflow=settings.db_max_overflow,
+        )
+    connect_args = {}
+    if IS_POSTGRES and settings.db_statement_timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={int(settings.db_statement_timeout_ms)}"
+    return create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args=connect_args,
+        pool_size=POOL_SIZE,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle_s,
+        pool_timeout=settings.db_pool_timeout_s,
+    )
+
 
 # The engine is the main point of contact with the DB
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = _create_engine()
+
+
+def _async_database_url(url: str) -> str:
+    """Maps the configured URL onto the asyncio driver for the same database."""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+def _create_async_engine():
+    url = _async_database_url(SQLALCHEMY_DATABASE_URL)
+    if IS_SQLITE_MEMORY:
+        # NOTE: an in-memory database is private to its engine, so the async engine sees
+        # a separate (empty) database. Use a file or server database with async endpoints.
+        return create_async_engine(url)
+    if IS_SQLITE:
+        return create_async_engine(
+            url,
+            connect_args={"timeout": settings.sqlite_busy_timeout_ms / 1000},
+            pool_size=POOL_SIZE,
+            max_overflow=settings.db_max_overflow,
+        )
+    connect_args = {}
+    if IS_POSTGRES and settings.db_statement_timeout_ms:
+        # asyncpg takes session settings directly rather than a libpq options string
+        connect_args["server_settings"] = {"statement_timeout": str(int(settings.db_statement_timeout_ms))}
+    return create_async_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=POOL_SIZE,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle_s,
+        pool_timeout=settings.db_pool_timeout_s,
+    )
+
+
+# Async engine for the read-heavy API endpoints. Requests awaiting it do not hold a
+# threadpool worker while the database is busy. Sync paths keep using `engine`.
+async_engine = _create_async_engine()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies the SQLite concurrency profile to every new connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    # Keep sort/temp structures in memory rather than temp files
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if IS_SQLITE and not IS_SQLITE_MEMORY:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 
 # A SessionLocal class to create DB sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async sessions are read-mostly; keep loaded attributes usable after commit
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 def create_db_and_tables():
     # This function creates all the tables defined in models.py
     # This now includes the new Job and AuditLog tables
     print("Creating all database tables...")
     Base.metadata.create_all(bind=engine)
-    print("Database tables created successfully.") 
\ No newline at end of file
+    # create_all skips tables that already exist; add what earlier versions lack
+    upgrades.upgrade_schema(engine)
+    print("Database tables created successfully.")
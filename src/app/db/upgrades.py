@@ -0,0 +1,144 @@
+# src/app/db/upgrades.py
+"""
+In-place upgrades for databases created by an earlier version of the models.
+
+Tables are created with `Base.metadata.create_all`, which only creates missing tables:
+it never adds a column or an index to a table that already exists. Each step below
+brings one existing table up to date and is idempotent, so `upgrade_schema` runs on
+every startup (see app.db.session.create_db_and_tables) and does nothing once the
+database is current.
+"""
+from typing import Any, Dict, List
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+from app.db import models
+from app.utils.condition_keys import condition_key
+
+
+def _column_names(conn: Connection, table_name: str) -> List[str]:
+    return [column["name"] for column in inspect(conn).get_columns(table_name)]
+
+
+def _index_names(conn: Connection, table_name: str) -> List[str]:
+    return [index["name"] for index in inspect(conn).get_indexes(table_name)]
+
+
+def _add_missing_columns(conn: Connection, table) -> List[str]:
+    """Adds the model's columns the table lacks (as nullable, so existing rows are valid). Returns their names."""
+    existing = set(_column_names(conn, table.name))
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+        added.append(column.name)
+    if added:
+        print(f"Added column(s) {', '.join(added)} to '{table.name}'.")
+    return added
+
+
+def _create_missing_indexes(conn: Connection, table):
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _backfill_condition_keys(conn: Connection, table, source_column: str):
+    """Sets condition_key on rows saved before it existed."""
+    rows = conn.execute(
+        select(table.c.id, table.c[source_column]).where(table.c.condition_key.is_(None))
+    ).all()
+    for row_id, document in rows:
+        conn.execute(table.update().where(table.c.id == row_id).values(condition_key=condition_key(document)))
+    if rows:
+        print(f"Backfilled condition_key for {len(rows)} row(s) of '{table.name}'.")
+
+
+def _merge_duplicate_heuristics(conn: Connection, table):
+    """
+    Folds heuristics that share (vendor, exception type, condition_key) into the oldest
+    one: trigger counts are summed and the highest confidence is kept. Learning created
+    such rows before the unique index existed, and the index cannot be built over them.
+    """
+    group = (table.c.vendor_name, table.c.exception_type, table.c.condition_key)
+    duplicates = conn.execute(select(*group).group_by(*group).having(func.count() > 1)).all()
+    for vendor_name, exception_type, key in duplicates:
+        rows = conn.execute(
+            select(table.c.id, table.c.trigger_count, table.c.confidence_score,
+                   table.c.created_at, table.c.last_applied_at)
+            .where(table.c.vendor_name == vendor_name, table.c.exception_type == exception_type,
+                   table.c.condition_key == key)
+            .order_by(table.c.id)
+        ).all()
+        keep, merged = rows[0], rows[1:]
+        values: Dict[str, Any] = {
+            "trigger_count": sum(row.trigger_count or 0 for row in rows),
+            "confidence_score": max((row.confidence_score for row in rows if row.confidence_score is not None), default=None),
+            "created_at": min((row.created_at for row in rows if row.created_at), default=keep.created_at),
+            "last_applied_at": max((row.last_applied_at for row in rows if row.last_applied_at), default=keep.last_applied_at),
+        }
+        conn.execute(table.update().where(table.c.id == keep.id).values(**values))
+        conn.execute(table.delete().where(table.c.id.in_([row.id for row in merged])))
+    if duplicates:
+        print(f"Merged {len(duplicates)} group(s) of duplicate learned heuristics.")
+
+
+def _upgrade_learned_heuristics(conn: Connection):
+    table = models.LearnedHeuristic.__table__
+    added = _add_missing_columns(conn, table)
+    _backfill_condition_keys(conn, table, "learned_condition")
+    if "ux_learned_heuristics_condition" not in _index_names(conn, table.name):
+        _merge_duplicate_heuristics(conn, table)
+    if "condition_key" in added and conn.dialect.name == "postgresql":
+        # SQLite cannot add a NOT NULL constraint to an existing column; the model sets it on every save
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} ALTER COLUMN condition_key SET NOT NULL")
+    _create_missing_indexes(conn, table)
+
+
+def _upgrade_automation_rules(conn: Connection):
+    table = models.AutomationRule.__table__
+    _add_missing_columns(conn, table)
+    _backfill_condition_keys(conn, table, "conditions")
+    _create_missing_indexes(conn, table)
+
+
+def _remove_duplicate_unread_notifications(conn: Connection, table):
+    """Keeps only the newest unread notification of each type per entity, as the unique index requires."""
+    group = (table.c.type, table.c.related_entity_id)
+    newest = (
+        select(func.max(table.c.id))
+        .where(table.c.is_read == 0, table.c.related_entity_id.is_not(None))
+        .group_by(*group)
+    )
+    result = conn.execute(
+        table.delete().where(
+            table.c.is_read == 0,
+            table.c.related_entity_id.is_not(None),
+            table.c.id.not_in(newest),
+        )
+    )
+    if result.rowcount:
+        print(f"Removed {result.rowcount} duplicate unread notification(s).")
+
+
+def _upgrade_notifications(conn: Connection):
+    table = models.Notification.__table__
+    if "ux_notifications_unread_entity" not in _index_names(conn, table.name):
+        _remove_duplicate_unread_notifications(conn, table)
+    _create_missing_indexes(conn, table)
+
+
+def _upgrade_audit_archive_index(conn: Connection):
+    # Segments indexed before frame offsets existed keep NULLs and are read whole
+    _add_missing_columns(conn, models.AuditArchiveIndex.__table__)
+
+
+def upgrade_schema(engine: Engine):
+    """Brings tables created by earlier versions up to the current models."""
+    with engine.begin() as conn:
+        _upgrade_learned_heuristics(conn)
+        _upgrade_automation_rules(conn)
+        _upgrade_notifications(conn)
+        _upgrade_audit_archive_index(conn)
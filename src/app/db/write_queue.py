@@ -0,0 +1,166 @@
+# src/app/db/write_queue.py
+"""
+Optional single-writer queue with group commit.
+
+SQLite allows one writer at a time and pays an fsync per commit, so many small
+background commits (job progress, matching results) from different threads contend
+for the lock. With `write_queue_enabled`, such units of work are handed to one writer
+thread that runs a batch of them in a single transaction and commits once.
+
+Each unit is a callable taking a Session. It runs inside its own SAVEPOINT, so it may
+call `db.commit()` / `db.rollback()` as usual: those only release or roll back its
+savepoint, and a failing unit does not affect the rest of the batch. A unit's Future
+resolves once the group commit has succeeded. Return plain values from a unit, not ORM
+objects, since its session is closed afterwards.
+
+When the queue is disabled, units run immediately on a fresh session and commit on
+their own, so callers use the same API either way. Server-push events raised by the
+units of a batch are published only after the group commit.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import events
+from app.db.session import SessionLocal, engine
+
+WorkUnit = Callable[[Session], Any]
+
+_queue: "queue.Queue[Optional[Tuple[WorkUnit, Future]]]" = queue.Queue()
+_writer_thread: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return settings.write_queue_enabled
+
+
+def _run_inline(work: WorkUnit) -> Future:
+    future: Future = Future()
+    db = SessionLocal()
+    try:
+        result = work(db)
+        db.commit()
+        future.set_result(result)
+    except Exception as e:
+        db.rollback()
+        future.set_exception(e)
+    finally:
+        db.close()
+    return future
+
+
+def _collect_batch() -> Tuple[List[Tuple[WorkUnit, Future]], bool]:
+    """Blocks for the first unit, then gathers more for up to max_delay_ms. Returns (batch, stop)."""
+    first = _queue.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    deadline = time.monotonic() + settings.write_queue_max_delay_ms / 1000
+    while len(batch) < settings.write_queue_max_batch:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = _queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _run_batch(batch: List[Tuple[WorkUnit, Future]]):
+    outcomes: List[Tuple[Future, bool, Any]] = []
+    batch_events: List[dict] = []
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            for work, future in batch:
+                # Sessions joined to the connection's transaction turn their own
+                # commit()/rollback() into savepoint release/rollback.
+                db = Session(bind=conn, join_transaction_mode="create_savepoint", autoflush=False)
+                db.info[events.SINK_KEY] = batch_events
+                try:
+                    result = work(db)
+                    db.commit()
+                    outcomes.append((future, True, result))
+                except Exception as e:
+                    db.rollback()
+                    outcomes.append((future, False, e))
+                finally:
+                    db.close()
+            transaction.commit()
+        except Exception as e:
+            print(f"Error committing write batch of {len(batch)} unit(s): {e}")
+            if transaction.is_active:
+                transaction.rollback()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+    events.bus.publish_many(batch_events)
+    for future, ok, value in outcomes:
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+
+def _writer_loop():
+    while True:
+        batch, stop = _collect_batch()
+        if batch:
+            _run_batch(batch)
+        if stop:
+            break
+
+
+def start():
+    """Starts the writer thread if the queue is enabled. Safe to call more than once."""
+    global _writer_thread
+    if not is_enabled():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer_thread.start()
+
+
+def stop(timeout: float = 10.0):
+    """Flushes pending work and stops the writer thread."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None:
+            return
+        _queue.put(None)
+        _writer_thread.join(timeout)
+        _writer_thread = None
+
+
+def submit(work: WorkUnit) -> Future:
+    """Schedules a unit of work. Returns a Future with the unit's return value."""
+    if not is_enabled():
+        return _run_inline(work)
+    start()
+    future: Future = Future()
+    _queue.put((work, future))
+    return future
+
+
+def execute(work: WorkUnit, timeout: Optional[float] = None) -> Any:
+    """Runs a unit of work and waits for it to be committed. Re-raises its exception."""
+    return submit(work).result(timeout)
+
+
+def drain(timeout: Optional[float] = None):
+    """Waits until everything submitted so far has been committed."""
+    if is_enabled():
+        execute(lambda db: None, timeout)
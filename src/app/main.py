@@ -1,49 +1,74 @@
 # src/app/main.py
-import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.db.session import create_db_and_tables, SessionLocal
+from app.db.session import create_db_and_tables, SessionLocal, engine
+from app.db import write_queue
 # --- ADD COPILOT TO IMPORTS ---
-from app.api.endpoints import documents, dashboard, invoices, copilot, learning, notifications, configuration, workflow, payments
+from app.api.endpoints import documents, dashboard, invoices, copilot, learning, notifications, configuration, workflow, payments, events as events_endpoints
 from app.core.monitoring_service import run_monitoring_cycle
+from app.core import audit_archive, domain_events, events, invoice_archive, kpi_rollups, outbox
+from app.core.scheduler import ScheduledTask, Scheduler
+from app.config import settings
 from app.modules.automation import executor as automation_executor
+from app.modules.learning import service as learning_service
+from app.modules.matching import comparison, engine as matching_engine
+from app.modules.search import fulltext
+from app.modules.ingestion import lines as document_lines
 
-# --- NEW LIFESPAN MANAGER ---
-async def recurring_background_tasks():
-    """Wrapper to run all recurring services on a schedule."""
-    while True:
-        try:
-            print("--- Kicking off recurring background tasks ---")
-            # Use consistent session management for both services
-            with SessionLocal() as db:
-                # Proactive Monitoring (runs every hour)
-                run_monitoring_cycle(db)
-                
-                # Automation Engine (runs every 5 minutes)
-                automation_executor.run_automation_engine(db)
+# --- Domain event subscribers (delivered through the outbox) ---
+subscribe = outbox.dispatcher.subscribe
+# Learn from reviewer approvals, then run automation rules on invoices that arrive in an automatable status
+subscribe(domain_events.INVOICE_STATUS_CHANGED, learning_service.handle_status_changes)
+subscribe(domain_events.INVOICE_INGESTED, automation_executor.handle_status_changes)
+subscribe(domain_events.INVOICE_STATUS_CHANGED, automation_executor.handle_status_changes)
+# Keep the dashboard's daily rollups current
+subscribe(domain_events.INVOICE_INGESTED, kpi_rollups.handle_invoice_events)
+subscribe(domain_events.INVOICE_STATUS_CHANGED, kpi_rollups.handle_invoice_events)
+subscribe(domain_events.INVOICE_CHANGED, kpi_rollups.handle_invoice_events)
+# Persist the workbench comparison of each finished match
+subscribe(domain_events.INVOICE_MATCH_COMPLETED, comparison.handle_match_completed)
+# Re-match the open invoices of an edited PO
+subscribe(domain_events.PURCHASE_ORDER_EDITED, matching_engine.handle_po_edited)
 
-        except Exception as e:
-            print(f"Error in recurring task: {e}")
-        # Let's run this more frequently, e.g., every 5 minutes (300 seconds)
-        await asyncio.sleep(300)
+# --- Recurring jobs ---
+def archive_cold_data(db):
+    """Moves closed invoices and aged audit entries to the cold tier."""
+    invoice_archive.archive_closed_invoices(db)
+    audit_archive.archive_old_entries(db)
+    outbox.prune_delivered(db)
+
+scheduler = Scheduler([
+    # Proactive Monitoring (hourly by default)
+    ScheduledTask("monitoring", run_monitoring_cycle, settings.monitoring_interval_s),
+    # Automation reconcile sweep (hourly); changed invoices are handled via the outbox
+    ScheduledTask("automation", automation_executor.run_automation_engine, settings.automation_interval_s),
+    ScheduledTask("archival", archive_cold_data, settings.archival_interval_s),
+    ScheduledTask("kpi_rollups", kpi_rollups.rebuild, settings.kpi_rollup_interval_s),
+])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup
     print("🚀 Application starting up...")
     create_db_and_tables()
-    # Start the background tasks
-    task = asyncio.create_task(recurring_background_tasks())
+    fulltext.ensure_search_index(engine)
+    with SessionLocal() as db:
+        document_lines.backfill_if_empty(db)
+        fulltext.backfill_if_empty(db)
+    write_queue.start()
+    events.bus.start()
+    outbox.dispatcher.start()
+    # Start the recurring jobs
+    scheduler.start()
     yield
     # On shutdown
     print("👋 Application shutting down...")
-    task.cancel()
-    try:
-        await task
-    except asyncio.CancelledError:
-        print("Background tasks successfully cancelled.")
+    write_queue.stop()
+    events.bus.stop()
+    outbox.dispatcher.stop()
+    await scheduler.stop()
 
 # --- MODIFIED APP INITIALIZATION ---
 app = FastAPI(
@@ -60,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"], # Pagination headers for list endpoints
 )
 
 # Include API routers
@@ -72,6 +98,7 @@ app.include_router(notifications.router, prefix="/api/notifications", tags=["Not
 app.include_router(configuration.router, prefix="/api/config", tags=["Configuration & Settings"]) # <-- RENAMED TAG
 app.include_router(workflow.router, prefix="/api/workflow", tags=["Workflow & Audit"])
 app.include_router(payments.router, prefix="/api/payments", tags=["Payments"])
+app.include_router(events_endpoints.router, prefix="/api/events", tags=["Events"])
 
 
 @app.get("/api/health", tags=["Health Check"])
@@ -1,99 +1,177 @@
+from dataclasses import dataclass
+from sqlalchemy import and_, select
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import Any, Collection, List, Dict, Optional, Set, Union
 
+from app.core import config_cache, domain_events
 from app.db import models
-from app.utils.auditing import log_audit_event
+from app.modules.automation import rules
+from app.modules.learning import service as learning_service
+from app.modules.workflow import transitions
 
-def evaluate_rule(invoice: models.Invoice, rule: models.AutomationRule) -> bool:
-    """Evaluates if a single invoice matches the conditions of a single rule."""
-    conditions = rule.conditions
-    if not conditions:
-        return False # A rule must have conditions
+def evaluate_rule(invoice: models.Invoice, rule: Union[models.AutomationRule, "ActiveRule"]) -> bool:
+    """Evaluates if a single invoice matches the conditions of a single rule, in Python."""
+    if isinstance(rule, ActiveRule):
+        return rule.compiled is not None and rule.compiled.matches(invoice)
+    try:
+        return rules.compile_rule(rule).matches(invoice)
+    except rules.RuleCompileError:
+        return False # Invalid rules never match
 
-    field = conditions.get("field")
-    operator = conditions.get("operator")
-    value = conditions.get("value")
 
-    if not all([field, operator]):
-        return False # Invalid condition structure
+# Statuses the automation rules act on: matched invoices (a rule might auto-pay) and
+# brand new Non-PO invoices, but not those already deep in review.
+AUTOMATABLE_STATUSES = (models.DocumentStatus.matched, models.DocumentStatus.ingested)
 
-    invoice_value = getattr(invoice, field, None)
-    if invoice_value is None and operator != "is_null":
-        return False
+# Rules created from a learned heuristic act on invoices held for review instead,
+# approving those whose failed checks are all within the heuristic's tolerance.
+LEARNED_RULE_STATUSES = (models.DocumentStatus.needs_review,)
 
-    try:
-        if operator == "equals":
-            return str(invoice_value) == str(value)
-        elif operator == "<":
-            return float(invoice_value) < float(value)
-        elif operator == ">":
-            return float(invoice_value) > float(value)
-        elif operator == "contains":
-            return str(value).lower() in str(invoice_value).lower()
-        elif operator == "is_null":
-            return invoice_value is None
-        # Add more operators here as needed (e.g., <=, >=, etc.)
-    except (ValueError, TypeError):
-        # Failed to compare values (e.g., trying to compare a string with a number)
-        return False
-        
-    return False
+# What 'approve' does from each status, and the audit action recorded
+APPROVE_TRANSITIONS = {
+    # Already passed 3-way match, so it can go straight to payment
+    models.DocumentStatus.matched: (models.DocumentStatus.pending_payment, "Moved to Pending Payment"),
+    models.DocumentStatus.ingested: (models.DocumentStatus.matched, "Approved Non-PO Invoice"),
+    models.DocumentStatus.needs_review: (models.DocumentStatus.matched, "Approved Within Learned Tolerance"),
+}
 
 
-def run_automation_engine(db: Session):
+@dataclass(frozen=True)
+class LearnedTolerance:
+    """The learned heuristic a suggested rule was created from."""
+    exception_type: str
+    learned_condition: Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class ActiveRule:
+    """An active rule as cached: compiled once, or the reason it cannot be."""
+    id: int
+    rule_name: str
+    action: str
+    compiled: Optional[rules.CompiledRule]
+    error: Optional[str] = None
+    learned: Optional[LearnedTolerance] = None
+
+
+def _load_active_rules(db: Session) -> List[ActiveRule]:
+    Rule, Heuristic = models.AutomationRule, models.LearnedHeuristic
+    # A heuristic's condition never changes under its condition_key, so it is cached with the rules
+    rows = db.execute(
+        select(Rule, Heuristic.exception_type, Heuristic.learned_condition)
+        .outerjoin(Heuristic, and_(Heuristic.vendor_name == Rule.vendor_name,
+                                   Heuristic.condition_key == Rule.source_heuristic_key))
+        .where(Rule.is_active == 1)
+        .order_by(Rule.id)
+    ).all()
+    active = []
+    for rule, exception_type, learned_condition in rows:
+        learned = LearnedTolerance(exception_type, learned_condition) if exception_type else None
+        if rule.source_heuristic_key and learned is None:
+            active.append(ActiveRule(rule.id, rule.rule_name, rule.action, None,
+                                     "The learned heuristic it was created from no longer exists."))
+            continue
+        try:
+            active.append(ActiveRule(rule.id, rule.rule_name, rule.action, rules.compile_rule(rule), learned=learned))
+        except rules.RuleCompileError as e:
+            active.append(ActiveRule(rule.id, rule.rule_name, rule.action, None, str(e)))
+    return active
+
+
+_active_rules = config_cache.section(config_cache.AUTOMATION_RULES, _load_active_rules)
+
+
+def load_rules(db: Session, max_age_s: Optional[float] = None) -> List[ActiveRule]:
     """
-    Finds all active rules and applies them to pending invoices.
+    Active rules in creation order, from the configuration cache. Vendor scoping is
+    part of each rule's predicate.
     """
-    print("--- 🤖 Running Automation Rule Engine ---")
-    
-    # 1. Fetch all active rules and pending invoices
-    active_rules = db.query(models.AutomationRule).filter_by(is_active=1).all()
-    # We only want to run this on invoices that have passed initial matching
-    # or are brand new Non-PO invoices, but not those already deep in review.
-    invoices_to_process = db.query(models.Invoice).filter(
-        models.Invoice.status.in_([
-            models.DocumentStatus.matched, # Rule might auto-pay
-            models.DocumentStatus.ingested # Rule for non-PO invoices
-        ])
-    ).all()
+    return _active_rules.get(db, max_age_s)
 
-    if not active_rules:
-        print("  -> No active automation rules found. Engine finished.")
-        return
 
-    print(f"  -> Found {len(active_rules)} active rule(s) and {len(invoices_to_process)} invoice(s) to check.")
+def apply_rules(db: Session, active_rules: List[ActiveRule],
+                invoice_ids: Optional[Collection[int]] = None) -> int:
+    """
+    Applies the first matching rule (in creation order) to each automatable invoice,
+    optionally only among `invoice_ids`. Each rule selects its invoices with one query
+    and moves them with one set-based transition. Rules created from a learned
+    heuristic select invoices in review and keep those within its tolerance. Does not
+    commit. Returns how many invoices were actioned.
+    """
     processed_count = 0
+    claimed: Set[int] = set()
+    for rule in active_rules:
+        if rule.action != "approve":
+            continue
+        if rule.compiled is None:
+            print(f"  -> Skipping rule '{rule.rule_name}' (id {rule.id}): {rule.error}")
+            continue
 
-    # 2. Iterate through each invoice and check against each rule
-    for invoice in invoices_to_process:
-        for rule in active_rules:
-            # Vendor-specific rule check
-            if rule.vendor_name and rule.vendor_name.lower() != (invoice.vendor_name or '').lower():
+        statuses = LEARNED_RULE_STATUSES if rule.learned else AUTOMATABLE_STATUSES
+        columns = [models.Invoice.id, models.Invoice.status]
+        if rule.learned:
+            columns.append(models.Invoice.match_trace)
+        stmt = select(*columns).where(models.Invoice.status.in_(statuses), rule.compiled.predicate)
+        if invoice_ids is not None:
+            stmt = stmt.where(models.Invoice.id.in_(list(invoice_ids)))
+        by_status: Dict[models.DocumentStatus, List[int]] = {}
+        for row in db.execute(stmt):
+            if row.id in claimed:
                 continue
+            if rule.learned and not learning_service.is_covered(
+                    row, rule.learned.exception_type, rule.learned.learned_condition):
+                continue
+            by_status.setdefault(row.status, []).append(row.id)
+
+        for status, ids in by_status.items():
+            # An earlier rule's transition may have moved these on; later rules skip them either way
+            claimed.update(ids)
+            new_status, action_taken = APPROVE_TRANSITIONS[status]
+            result = transitions.transition_invoices(
+                db, ids, new_status, allowed_from=[status], user=domain_events.AUTOMATION_USER, action=action_taken,
+                audit_details=lambda row, rule=rule: {"rule_id": rule.id, "rule_name": rule.rule_name},
+            )
+            if result.updated_count:
+                print(f"  -> MATCH: {result.updated_count} invoice(s) matched rule '{rule.rule_name}'.")
+            processed_count += result.updated_count
+    return processed_count
+
+
+def handle_status_changes(db: Session, events: List[models.OutboxEvent]):
+    """
+    Outbox handler (invoice.ingested, invoice.status_changed): evaluates only the
+    invoices that just arrived in an automatable status or in review.
+    """
+    targets = {status.value for status in AUTOMATABLE_STATUSES + LEARNED_RULE_STATUSES}
+    invoice_ids = {e.payload["invoice_db_id"] for e in events if domain_events.current_status(e) in targets}
+    if not invoice_ids:
+        return
+    active_rules = load_rules(db)
+    if not active_rules:
+        return
+    # The rules' queries re-check the status: it may have moved on since the event was written
+    processed_count = apply_rules(db, active_rules, invoice_ids)
+    if processed_count:
+        print(f"🤖 Automation: actioned {processed_count} of {len(invoice_ids)} changed invoice(s).")
 
-            if evaluate_rule(invoice, rule):
-                print(f"  -> MATCH: Invoice {invoice.invoice_id} matched rule '{rule.rule_name}'.")
-                
-                # 3. Perform the action
-                if rule.action == "approve":
-                    # We can directly approve, as it has already passed 3-way match
-                    if invoice.status == models.DocumentStatus.matched:
-                        invoice.status = models.DocumentStatus.pending_payment
-                        action_taken = "Moved to Pending Payment"
-                    elif invoice.status == models.DocumentStatus.ingested: # Non-PO invoice
-                        invoice.status = models.DocumentStatus.matched
-                        action_taken = "Approved Non-PO Invoice"
-                        
-                    if action_taken:
-                        log_audit_event(
-                            db=db, invoice_db_id=invoice.id, user='AutomationEngine',
-                            action=action_taken, details={"rule_id": rule.id, "rule_name": rule.rule_name}
-                        )
-                        processed_count += 1
-                        # Stop checking other rules for this invoice once one has matched
-                        break 
 
+def run_automation_engine(db: Session):
+    """
+    Reconcile sweep: applies all active rules to every invoice in an automatable
+    status. Changed invoices are normally handled right away via the outbox
+    (handle_status_changes); this periodic pass catches anything that was missed.
+    """
+    print("--- 🤖 Running Automation Rule Engine (reconcile sweep) ---")
+
+    # The sweep is rare; make sure it acts on the current rules
+    active_rules = load_rules(db, max_age_s=0)
+    if not active_rules:
+        print("  -> No active automation rules found. Engine finished.")
+        return
+    print(f"  -> Found {len(active_rules)} active rule(s).")
+
+    processed_count = apply_rules(db, active_rules)
     if processed_count > 0:
         db.commit()
-    
-    print(f"--- ✅ Automation Engine Finished. Processed {processed_count} invoice(s). ---") 
\ No newline at end of file
+
+    print(f"--- ✅ Automation Engine Finished. Processed {processed_count} invoice(s). ---")
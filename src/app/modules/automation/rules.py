@@ -0,0 +1,213 @@
+# src/app/modules/automation/rules.py
+"""
+Compiles AutomationRule conditions into SQL predicates.
+
+A condition is either a single comparison or an AND/OR tree of them:
+
+    {"field": "grand_total", "operator": "<", "value": 500}
+    {"and": [{"field": "grand_total", "operator": "between", "value": [100, 500]},
+             {"or": [{"field": "gl_code", "operator": "in", "value": ["6100", "6200"]},
+                     {"field": "notes", "operator": "is_null"}]}]}
+
+Fields are the searchable invoice columns; values are converted to the column's type
+up front, so a bad rule is rejected when it is saved rather than silently never
+matching. The same parsed tree drives both the SQL predicate (used by the executor to
+select a rule's invoices in one query) and `matches`, a Python evaluator with
+identical semantics: a comparison against a NULL column is false, except for
+`is_null`. There is no NOT, so SQL's three-valued logic never yields a different
+answer than the evaluator.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, Enum, Float, Integer, String, and_, func, or_
+
+from app.db import models
+from app.modules.search.compiler import SEARCHABLE_FIELDS, SearchQueryError, coerce_value, escape_like
+
+
+class RuleCompileError(ValueError):
+    """Raised when a rule's conditions reference an unknown field/operator or a bad value."""
+    pass
+
+
+RULE_FIELDS = SEARCHABLE_FIELDS
+
+# Spellings used by older rules and the rule builder
+OPERATOR_ALIASES = {'==': 'equals', '=': 'equals', '!=': 'not_equals'}
+
+COMPARISON_OPERATORS = {'<', '>', '<=', '>='}
+VALUE_OPERATORS = {'equals', 'not_equals', 'contains', 'in', 'between'} | COMPARISON_OPERATORS
+NULL_OPERATORS = {'is_null', 'is_not_null'}
+SUPPORTED_OPERATORS = VALUE_OPERATORS | NULL_OPERATORS
+
+BRANCH_KEYS = ('and', 'or')
+
+# Guards against pathological trees from the API
+MAX_DEPTH = 8
+
+
+def _is_text(column) -> bool:
+    # Enum is a String subtype, but status values are compared as enum members
+    return isinstance(column.type, String) and not isinstance(column.type, Enum)
+
+
+def _is_ordered(column) -> bool:
+    # Ordering is only offered where SQL and Python agree on it (no collation-dependent text)
+    return isinstance(column.type, (Float, Integer, Date, DateTime))
+
+
+def _coerce(field: str, value: Any) -> Any:
+    try:
+        return coerce_value(field, RULE_FIELDS[field], value)
+    except SearchQueryError as e:
+        raise RuleCompileError(str(e)) from e
+
+
+def _parse(conditions: Any, depth: int = 0) -> Tuple:
+    """Validates a condition tree into ('and'|'or', [nodes]) / ('cond', field, operator, value) nodes."""
+    if depth > MAX_DEPTH:
+        raise RuleCompileError(f"Conditions are nested more than {MAX_DEPTH} levels deep.")
+    if not isinstance(conditions, dict) or not conditions:
+        raise RuleCompileError("A condition must be a non-empty object.")
+
+    branch = [key for key in BRANCH_KEYS if key in conditions]
+    if branch:
+        key = branch[0]
+        children = conditions[key]
+        if len(conditions) != 1 or not isinstance(children, list) or not children:
+            raise RuleCompileError(f"'{key}' must be the only key and hold a non-empty list of conditions.")
+        return key, [_parse(child, depth + 1) for child in children]
+
+    field = conditions.get("field")
+    operator = OPERATOR_ALIASES.get(conditions.get("operator"), conditions.get("operator"))
+    value = conditions.get("value")
+    if field not in RULE_FIELDS:
+        raise RuleCompileError(f"Field '{field}' cannot be used in a rule. Allowed fields: {sorted(RULE_FIELDS)}")
+    if operator not in SUPPORTED_OPERATORS:
+        raise RuleCompileError(f"Unsupported operator '{operator}'. Supported operators: {sorted(SUPPORTED_OPERATORS | set(OPERATOR_ALIASES))}")
+    column = RULE_FIELDS[field]
+
+    if operator in NULL_OPERATORS:
+        return "cond", field, operator, None
+    if value is None:
+        raise RuleCompileError(f"Operator '{operator}' on field '{field}' needs a value; use 'is_null' to match empty fields.")
+    if operator == 'contains':
+        if not _is_text(column):
+            raise RuleCompileError(f"Operator 'contains' only applies to text fields, not '{field}'.")
+        return "cond", field, operator, str(value)
+    if operator in COMPARISON_OPERATORS or operator == 'between':
+        if not _is_ordered(column):
+            raise RuleCompileError(f"Operator '{operator}' only applies to number and date fields, not '{field}'.")
+    if operator == 'in':
+        if not isinstance(value, list) or not value:
+            raise RuleCompileError(f"Operator 'in' requires a non-empty list value for field '{field}'.")
+        return "cond", field, operator, [_coerce(field, v) for v in value]
+    if operator == 'between':
+        if not (isinstance(value, list) and len(value) == 2) or None in value:
+            raise RuleCompileError(f"Operator 'between' requires a [low, high] value for field '{field}'.")
+        return "cond", field, operator, [_coerce(field, v) for v in value]
+    return "cond", field, operator, _coerce(field, value)
+
+
+def _to_sql(node: Tuple):
+    if node[0] == 'and':
+        return and_(*[_to_sql(child) for child in node[1]])
+    if node[0] == 'or':
+        return or_(*[_to_sql(child) for child in node[1]])
+
+    _, field, operator, value = node
+    column = RULE_FIELDS[field]
+    if operator == 'is_null':
+        return column.is_(None)
+    if operator == 'is_not_null':
+        return column.isnot(None)
+    if operator == 'equals':
+        return column == value
+    if operator == 'not_equals':
+        return column != value
+    if operator == 'contains':
+        return column.ilike(f"%{escape_like(value)}%", escape='\\')
+    if operator == '<':
+        return column < value
+    if operator == '>':
+        return column > value
+    if operator == '<=':
+        return column <= value
+    if operator == '>=':
+        return column >= value
+    if operator == 'in':
+        return column.in_(value)
+    if operator == 'between':
+        return column.between(value[0], value[1])
+    raise RuleCompileError(f"Unsupported operator '{operator}'.")
+
+
+def _evaluate(node: Tuple, invoice: models.Invoice) -> bool:
+    if node[0] == 'and':
+        return all(_evaluate(child, invoice) for child in node[1])
+    if node[0] == 'or':
+        return any(_evaluate(child, invoice) for child in node[1])
+
+    _, field, operator, value = node
+    actual = getattr(invoice, field, None)
+    if operator == 'is_null':
+        return actual is None
+    if operator == 'is_not_null':
+        return actual is not None
+    if actual is None:
+        return False
+    if operator == 'equals':
+        return actual == value
+    if operator == 'not_equals':
+        return actual != value
+    if operator == 'contains':
+        return value.lower() in str(actual).lower()
+    if operator == '<':
+        return actual < value
+    if operator == '>':
+        return actual > value
+    if operator == '<=':
+        return actual <= value
+    if operator == '>=':
+        return actual >= value
+    if operator == 'in':
+        return actual in value
+    if operator == 'between':
+        return value[0] <= actual <= value[1]
+    raise RuleCompileError(f"Unsupported operator '{operator}'.")
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """A rule's conditions, plus its vendor scope, as a parsed tree."""
+    vendor_name: Optional[str]
+    tree: Tuple
+
+    @property
+    def predicate(self):
+        """SQL predicate on invoices, vendor scope included."""
+        predicate = _to_sql(self.tree)
+        if self.vendor_name:
+            # Matches the (status, lower(vendor_name)) index on invoices
+            predicate = and_(func.lower(models.Invoice.vendor_name) == self.vendor_name.lower(), predicate)
+        return predicate
+
+    def matches(self, invoice: models.Invoice) -> bool:
+        """Python evaluation of `predicate` for one loaded invoice."""
+        if self.vendor_name and (invoice.vendor_name or '').lower() != self.vendor_name.lower():
+            return False
+        return _evaluate(self.tree, invoice)
+
+
+def validate_conditions(conditions: Dict[str, Any]):
+    """Raises RuleCompileError if the conditions cannot be compiled."""
+    _parse(conditions)
+
+
+def compile_conditions(conditions: Dict[str, Any], vendor_name: Optional[str] = None) -> CompiledRule:
+    return CompiledRule(vendor_name=vendor_name or None, tree=_parse(conditions))
+
+
+def compile_rule(rule: models.AutomationRule) -> CompiledRule:
+    return compile_conditions(rule.conditions, rule.vendor_name)
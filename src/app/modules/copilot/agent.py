@@ -1,6 +1,10 @@
 # src/app/modules/copilot/agent.py
+import asyncio
 import json
-from typing import Optional, Dict, Any
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from app.config import settings
 from app.db.session import SessionLocal
 from . import tools
@@ -26,7 +30,8 @@ SYSTEM_PROMPT = """You are the Supervity (AI) AP Specialist, an expert copilot a
 ## Guiding Principles
 - **Clarity and Honesty:** If you cannot fulfill a request or a tool fails, state it clearly.
 - **Never Invent Data:** If a tool returns no results, state that clearly (e.g., "I found no invoices matching that criteria."). Do not make up information.
-- **Focus on Single Actions:** Handle one primary action per user request. If a user asks to do multiple things, address the first one and then prompt them for the next command.
+- **Gather Data in One Go:** If answering needs several read-only tools (e.g., KPIs and the payment forecast), request them all in the same turn; they run in parallel. You may call further tools after seeing their results.
+- **One Action at a Time:** Execute at most one action-oriented tool per request unless the user explicitly asked for each action. Otherwise, do the first one and prompt them for the next command.
 - **Context is Key:** If the user is viewing a specific invoice, all subsequent commands relate to that invoice unless specified otherwise.
 
 ## Tool Usage Rules
@@ -75,21 +80,183 @@ def format_ui_response(text: str, action: str = "DISPLAY_TEXT", data: Any = None
     }
 
 
-def invoke_agent(user_message: str, current_invoice_id: Optional[str] = None) -> Dict[str, Any]:
+# Tools that call the model themselves and need the client
+CLIENT_TOOLS = {"analyze_spending_by_category", "draft_vendor_communication"}
+
+# Tools that change data; they run one at a time, in the order the model requested them
+WRITE_TOOLS = {"approve_invoice", "reject_invoice", "update_vendor_tolerance", "edit_purchase_order",
+               "regenerate_po_pdf", "create_payment_proposal", "create_automation_rule"}
+
+
+def ui_action_for_tool(tool_name: str) -> str:
+    """Determine the UI action based on the tool used."""
+    if tool_name == "get_invoice_details":
+        return "LOAD_SINGLE_DOSSIER"
+    if tool_name in ["get_system_kpis", "summarize_vendor_issues", "regenerate_po_pdf", "get_payment_forecast", "flag_potential_anomalies", "analyze_spending_by_category", "create_payment_proposal"]:
+        return "DISPLAY_JSON"
+    if tool_name in ["draft_vendor_communication"]:
+        return "DISPLAY_MARKDOWN"
+    if tool_name in ["approve_invoice", "reject_invoice", "update_vendor_tolerance", "edit_purchase_order", "create_automation_rule"]:
+        return "SHOW_TOAST_SUCCESS" # A success message for actions
+    return "LOAD_DATA"
+
+
+def _generation_config(allow_tools: bool) -> types.GenerateContentConfig:
+    # Tools stay declared on every turn so the history's function calls remain valid;
+    # once the budget is spent the model is only told not to call them
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(
+            thinking_budget=0,
+        ),
+        safety_settings=[
+            types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
+        ],
+        tools=create_tool_definitions(),
+        tool_config=types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(mode="AUTO" if allow_tools else "NONE"),
+        ),
+        response_mime_type="text/plain",
+    )
+
+
+# Shared by all requests, so concurrent chats cannot open more tool sessions than this
+_tool_executor = ThreadPoolExecutor(max_workers=settings.copilot_tool_workers, thread_name_prefix="copilot-tool")
+
+
+def _run_tool(tool_name: str, tool_args: Dict[str, Any]) -> Any:
+    """Runs a (synchronous, database-bound) tool with its own session. Called in a worker thread."""
+    db = SessionLocal()
+    try:
+        # Ensure 'db' is passed to every tool, and 'client' to tools that need it
+        call_args = {**tool_args, 'db': db}
+        if tool_name in CLIENT_TOOLS:
+            call_args['client'] = client
+        return tools.AVAILABLE_TOOLS[tool_name](**call_args)
+    finally:
+        db.close()
+
+
+async def _call_tool(tool_name: str, tool_args: Dict[str, Any], after: Optional[asyncio.Future] = None) -> Any:
     """
-    The main orchestrator for the Copilot using function calling with proper tool handling.
+    Runs a tool on the shared executor. Tool failures are returned as {"error": ...} so the
+    model can explain them. `after` is a call that must finish first (used to keep writes in order).
+    """
+    if after is not None:
+        await asyncio.wait({after})
+    if tool_name not in tools.AVAILABLE_TOOLS:
+        return {"error": f"Unknown tool: {tool_name}"}
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_tool_executor, _run_tool, tool_name, tool_args)
+    except Exception as e:
+        print(f"Copilot tool '{tool_name}' failed: {e}")
+        traceback.print_exc()
+        return {"error": f"The tool failed: {e}"}
+
+
+def _tool_failed(result: Any) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+def _function_response(function_call: types.FunctionCall, result: Any) -> types.Part:
+    # The response must be a JSON object; tool results may hold dates, decimals or lists
+    result = json.loads(json.dumps(result, default=str))
+    response = result if _tool_failed(result) else {"result": result}
+    return types.Part(function_response=types.FunctionResponse(id=function_call.id, name=function_call.name, response=response))
+
+
+class _Turn:
+    """What one streamed model turn produced."""
+
+    def __init__(self):
+        self.text = ""
+        self.parts: List[types.Part] = []
+        self.function_calls: List[types.FunctionCall] = []
+        self.tokens = 0
+
+
+def _remaining(deadline: float) -> float:
+    return max(deadline - time.monotonic(), 0.0)
+
+
+async def _stream_turn(contents: List[types.Content], allow_tools: bool, deadline: float, turn: _Turn) -> AsyncIterator[Dict[str, Any]]:
+    """Streams one model turn into `turn`, yielding its text as token events. Raises TimeoutError at the deadline."""
+    stream = await asyncio.wait_for(
+        client.aio.models.generate_content_stream(
+            model=settings.gemini_model_name,
+            contents=contents,
+            config=_generation_config(allow_tools),
+        ),
+        _remaining(deadline),
+    )
+    while True:
+        try:
+            chunk = await asyncio.wait_for(stream.__anext__(), _remaining(deadline))
+        except StopAsyncIteration:
+            break
+        if chunk.usage_metadata and chunk.usage_metadata.total_token_count:
+            # Counts are cumulative over the turn
+            turn.tokens = chunk.usage_metadata.total_token_count
+        if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+            # Kept verbatim for the history, which must echo the model's function calls
+            turn.parts.extend(chunk.candidates[0].content.parts)
+        if chunk.function_calls:
+            turn.function_calls.extend(chunk.function_calls)
+        elif chunk.text:
+            turn.text += chunk.text
+            yield {"type": "token", "text": chunk.text}
+
+
+def _final_response(text: str, results: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """The final UI response: a single tool keeps its own UI action; several are shown together as JSON."""
+    if not results:
+        return format_ui_response(text)
+    if len(results) == 1:
+        tool_name, result = results[0]
+        return format_ui_response(text=text, action=ui_action_for_tool(tool_name), data=result)
+    by_tool: Dict[str, List[Any]] = {}
+    for tool_name, result in results:
+        by_tool.setdefault(tool_name, []).append(result)
+    data = {tool_name: found[0] if len(found) == 1 else found for tool_name, found in by_tool.items()}
+    return format_ui_response(text=text, action="DISPLAY_JSON", data=data)
+
+
+async def stream_agent(user_message: str, current_invoice_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    The main orchestrator for the Copilot, as a stream of events:
+
+        {"type": "token", "text": "..."}                       model output, as it arrives
+        {"type": "tool_call.started", "id": ..., "tool": ..., "args": {...}}
+        {"type": "tool_call.finished", "id": ..., "tool": ..., "ok": bool}
+        {"type": "final", "responseText", "uiAction", "data"}  always last
+
+    The model may request several tools per turn. Read-only tools run concurrently on a
+    shared thread pool, each with its own session; actions run one after another in the
+    order requested. Their results go back to the model as function responses and the
+    loop continues until it answers, bounded by copilot_max_steps tool turns,
+    copilot_token_budget and copilot_time_budget_s. When the steps or tokens run out
+    the model must answer with what it has; at the deadline the request ends with
+    whatever data was gathered.
+
+    The final event's responseText is the answer to display. It replaces any tokens
+    streamed before the model decided to call a tool.
     """
     if not client:
-        return format_ui_response("I'm sorry, the AI service is not properly configured. Please check the API key.")
-    
-    db = SessionLocal()
+        yield {"type": "final", **format_ui_response("I'm sorry, the AI service is not properly configured. Please check the API key.")}
+        return
+
+    deadline = time.monotonic() + settings.copilot_time_budget_s
+    results: List[Tuple[str, Any]] = []
+    pending: Dict[asyncio.Future, Tuple[str, str]] = {}
     try:
         # Prepare the user message with context
         if current_invoice_id:
             context_message = f"(The user is currently viewing invoice: {current_invoice_id}) User question: {user_message}"
         else:
             context_message = user_message
-        
+
         contents = [
             types.Content(
                 role="user",
@@ -98,155 +265,76 @@ def invoke_agent(user_message: str, current_invoice_id: Optional[str] = None) ->
                 ],
             ),
         ]
-        
-        gemini_tools = create_tool_definitions()
-        
-        # Configure generation following the exact pattern from user's examples
-        generate_content_config = types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=0,
-            ),
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_NONE",
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_NONE",
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_NONE",
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_NONE",
-                ),
-            ],
-            tools=gemini_tools,
-            response_mime_type="text/plain",
-        )
-        
-        # Initial call to Gemini - following the exact streaming pattern from examples
-        response_text = ""
-        function_calls = None
-        
-        for chunk in client.models.generate_content_stream(
-            model=settings.gemini_model_name,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.function_calls is None:
-                if chunk.text:
-                    response_text += chunk.text
-            else:
-                function_calls = chunk.function_calls
-
-        # Check if the model wants to call a function
-        if function_calls:
-            # Execute the first function call
-            function_call = function_calls[0]
-            tool_name = function_call.name
-            tool_args = dict(function_call.args) if function_call.args else {}
-
-            if tool_name not in tools.AVAILABLE_TOOLS:
-                return format_ui_response(f"Error: Unknown tool requested: {tool_name}")
-
-            print(f"Agent wants to call tool '{tool_name}' with args: {tool_args}")
-            
-            tool_function = tools.AVAILABLE_TOOLS[tool_name]
-            # Ensure 'db' is passed to every tool, and 'client' to tools that need it
-            tool_args['db'] = db
-            if tool_name in ["analyze_spending_by_category", "draft_vendor_communication"]:
-                tool_args['client'] = client
-
-            tool_result = tool_function(**tool_args)
-
-            # Format the tool result for the follow-up conversation
-            tool_result_str = json.dumps(tool_result, default=str) if isinstance(tool_result, (dict, list)) else str(tool_result)
-            
-            # Send function result back to get final response
-            function_response_contents = [
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=context_message),
-                    ],
-                ),
-                types.Content(
-                    role="model",
-                    parts=[
-                        types.Part.from_text(text=f"I need to call the {tool_name} function with arguments: {tool_args}"),
-                    ],
-                ),
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=f"Function {tool_name} returned: {tool_result_str}. Please provide a helpful response based on this data."),
-                    ],
-                ),
-            ]
-            
-            # Get final response from model using the same pattern
-            final_config = types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0,
-                ),
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="BLOCK_NONE",
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="BLOCK_NONE",
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="BLOCK_NONE",
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="BLOCK_NONE",
-                    ),
-                ],
-                response_mime_type="text/plain",
-            )
-            
-            final_response_text = ""
-            for chunk in client.models.generate_content_stream(
-                model=settings.gemini_model_name,
-                contents=function_response_contents,
-                config=final_config,
-            ):
-                if chunk.text:
-                    final_response_text += chunk.text
-            
-            # Determine the UI action based on the tool used
-            ui_action = "LOAD_DATA" 
-            if tool_name == "get_invoice_details":
-                ui_action = "LOAD_SINGLE_DOSSIER"
-            elif tool_name in ["get_system_kpis", "summarize_vendor_issues", "regenerate_po_pdf", "get_payment_forecast", "flag_potential_anomalies", "analyze_spending_by_category", "create_payment_proposal"]:
-                ui_action = "DISPLAY_JSON"
-            elif tool_name in ["draft_vendor_communication"]:
-                ui_action = "DISPLAY_MARKDOWN"
-            elif tool_name in ["approve_invoice", "reject_invoice", "update_vendor_tolerance", "edit_purchase_order", "create_automation_rule"]:
-                ui_action = "SHOW_TOAST_SUCCESS" # A success message for actions
-
-            return format_ui_response(
-                text=final_response_text,
-                action=ui_action,
-                data=tool_result
-            )
-        else:
-            # No function call needed, return direct response
-            return format_ui_response(response_text)
 
+        steps = tokens = 0
+        while True:
+            allow_tools = steps < settings.copilot_max_steps and tokens < settings.copilot_token_budget
+            turn = _Turn()
+            async for token_event in _stream_turn(contents, allow_tools, deadline, turn):
+                yield token_event
+            tokens += turn.tokens
+
+            # No function call needed (or allowed): this is the answer
+            if not turn.function_calls or not allow_tools:
+                yield {"type": "final", **_final_response(turn.text, results)}
+                return
+
+            steps += 1
+            contents.append(types.Content(role="model", parts=turn.parts))
+
+            # Start every call at once; each action waits for the action requested before it
+            calls: Dict[str, Tuple[types.FunctionCall, asyncio.Future]] = {}
+            last_write = None
+            for index, function_call in enumerate(turn.function_calls):
+                call_id = f"{steps}.{index}"
+                tool_args = dict(function_call.args) if function_call.args else {}
+                print(f"Agent wants to call tool '{function_call.name}' with args: {tool_args}")
+                yield {"type": "tool_call.started", "id": call_id, "tool": function_call.name, "args": tool_args}
+                if function_call.name in WRITE_TOOLS:
+                    task = last_write = asyncio.ensure_future(_call_tool(function_call.name, tool_args, after=last_write))
+                else:
+                    task = asyncio.ensure_future(_call_tool(function_call.name, tool_args))
+                calls[call_id] = (function_call, task)
+                pending[task] = (call_id, function_call.name)
+
+            # Report calls as they finish
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=_remaining(deadline), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError()
+                for task in done:
+                    call_id, tool_name = pending.pop(task)
+                    yield {"type": "tool_call.finished", "id": call_id, "tool": tool_name, "ok": not _tool_failed(task.result())}
+
+            response_parts = []
+            for function_call, task in calls.values():
+                results.append((function_call.name, task.result()))
+                response_parts.append(_function_response(function_call, task.result()))
+            contents.append(types.Content(role="user", parts=response_parts))
+
+    except TimeoutError:
+        print(f"Copilot request exceeded its {settings.copilot_time_budget_s}s time budget.")
+        for task, (call_id, tool_name) in pending.items():
+            yield {"type": "tool_call.finished", "id": call_id, "tool": tool_name, "ok": False}
+        completed = [tool_name for tool_name, _ in results]
+        message = "I'm sorry, I ran out of time before I could finish answering."
+        if completed:
+            message += f" The results of {', '.join(completed)} are available for review."
+        yield {"type": "final", **_final_response(message, results)}
     except Exception as e:
         print(f"An error occurred in the Copilot agent: {e}")
-        import traceback
         traceback.print_exc()
-        return format_ui_response("I'm sorry, an error occurred while processing your request. Please try again.")
+        yield {"type": "final", **format_ui_response("I'm sorry, an error occurred while processing your request. Please try again.")}
     finally:
-        db.close() 
\ No newline at end of file
+        # Threads cannot be interrupted, but queued actions must not start once nobody is waiting
+        for task in pending:
+            task.cancel()
+
+
+async def invoke_agent(user_message: str, current_invoice_id: Optional[str] = None) -> Dict[str, Any]:
+    """Runs the Copilot to completion and returns only the final UI response."""
+    final = format_ui_response("I'm sorry, an error occurred while processing your request. Please try again.")
+    async for event in stream_agent(user_message, current_invoice_id):
+        if event["type"] == "final":
+            final = {key: value for key, value in event.items() if key != "type"}
+    return final
@@ -9,8 +9,15 @@ from dateutil.relativedelta import relativedelta
 from google.genai import types as genai_types
 from thefuzz import fuzz
 
+from app.core import config_cache
 from app.db import models, schemas
-from app.utils import data_formatting
+from app.utils import pagination
+from app.utils.auditing import log_audit_event
+from app.modules.search import compiler as search_compiler, fulltext
+from app.modules.ingestion import lines as document_lines
+from app.modules.workflow import transitions
+from app.modules.automation import rules
+from app.modules.dossier import service as dossier_service
 from app.config import settings
 from sample_data.pdf_templates import draw_po_pdf
 
@@ -31,48 +38,52 @@ get_system_kpis_declaration = genai_types.FunctionDeclaration(
     description="Gets key performance indicators (KPIs) for the entire AP system. This includes strategic metrics like touchless invoice rate, discount capture, average payment times, and vendor exception rates."
 )
 def get_system_kpis(db: Session) -> Dict[str, Any]:
-    from app.api.endpoints.dashboard import get_advanced_kpis
+    from app.api.endpoints.dashboard import compute_advanced_kpis
     print("Executing tool: get_system_kpis")
-    kpis = get_advanced_kpis(db)
+    kpis = compute_advanced_kpis(db)
     return make_json_serializable(kpis)
 
 search_invoices_declaration = genai_types.FunctionDeclaration(
     name="search_invoices",
-    description="Searches for invoices with specific filters like status, vendor name, or date range.",
+    description="Searches for invoices with specific filters like status, vendor name, or date range, and optional free-text keywords.",
     parameters=genai_types.Schema(
         type=genai_types.Type.OBJECT,
         properties={
             "status": genai_types.Schema(type=genai_types.Type.STRING),
             "vendor_name": genai_types.Schema(type=genai_types.Type.STRING),
-            "days_ago": genai_types.Schema(type=genai_types.Type.INTEGER)
+            "days_ago": genai_types.Schema(type=genai_types.Type.INTEGER),
+            "keywords": genai_types.Schema(type=genai_types.Type.STRING, description="Free text matched against invoice/PO/GRN numbers, notes and line-item descriptions or SKUs, e.g. 'steel beam'.")
         }
     )
 )
-def search_invoices(db: Session, status: Optional[str] = None, vendor_name: Optional[str] = None, days_ago: Optional[int] = None) -> List[Dict[str, Any]]:
-    print(f"Executing tool: search_invoices with status={status}, vendor={vendor_name}, days_ago={days_ago}")
-    query = db.query(models.Invoice)
+def search_invoices(db: Session, status: Optional[str] = None, vendor_name: Optional[str] = None, days_ago: Optional[int] = None, keywords: Optional[str] = None) -> List[Dict[str, Any]]:
+    print(f"Executing tool: search_invoices with status={status}, vendor={vendor_name}, days_ago={days_ago}, keywords={keywords}")
+    filters: List[schemas.FilterCondition] = []
     
     if status:
-        # --- FIX START ---
         # Sanitize the status string from the LLM to match the enum value format.
         sanitized_status = status.lower().replace(' ', '_')
-        try:
-            status_enum = models.DocumentStatus(sanitized_status)
-            query = query.filter(models.Invoice.status == status_enum)
-        except ValueError:
-            # If still invalid, return a helpful error.
+        if sanitized_status not in {e.value for e in models.DocumentStatus}:
             valid_statuses = [e.value for e in models.DocumentStatus]
             return [{"error": f"Invalid status value '{status}'. Valid options are: {valid_statuses}"}]
-        # --- FIX END ---
+        filters.append(schemas.FilterCondition(field="status", operator="equals", value=sanitized_status))
     
     if vendor_name:
-        query = query.filter(models.Invoice.vendor_name.ilike(f"%{vendor_name}%"))
+        filters.append(schemas.FilterCondition(field="vendor_name", operator="contains", value=vendor_name))
         
     if days_ago is not None:
         start_date = datetime.now().date() - timedelta(days=days_ago)
-        query = query.filter(models.Invoice.invoice_date >= start_date)
-        
-    results = query.order_by(models.Invoice.invoice_date.desc()).limit(20).all()
+        filters.append(schemas.FilterCondition(field="invoice_date", operator="gte", value=start_date.isoformat()))
+
+    if keywords and fulltext.is_available():
+        filters.append(schemas.FilterCondition(field=search_compiler.FULLTEXT_FIELD, operator="matches", value=keywords))
+
+    # Same compiler (and plan cache) as the invoice explorer search
+    try:
+        compiled = search_compiler.compile_search(filters, sort_by="invoice_date", sort_order="desc")
+    except search_compiler.SearchQueryError as e:
+        return [{"error": str(e)}]
+    results, _ = search_compiler.run_search(db, compiled, limit=20, options=[pagination.invoice_summary_options()])
     
     if not results:
         return []
@@ -101,9 +112,8 @@ get_invoice_details_declaration = genai_types.FunctionDeclaration(
 )
 def get_invoice_details(db: Session, invoice_id: str) -> Dict[str, Any]:
     print(f"Executing tool: get_invoice_details for invoice_id={invoice_id}")
-    invoice = db.query(models.Invoice).filter(models.Invoice.invoice_id == invoice_id).first()
-    if not invoice: return {"error": f"Invoice with ID '{invoice_id}' not found."}
-    dossier = data_formatting.format_full_dossier(invoice, db)
+    dossier = dossier_service.get_dossier(db, invoice_id)
+    if dossier is None: return {"error": f"Invoice with ID '{invoice_id}' not found."}
     return make_json_serializable(dossier)
 
 
@@ -206,12 +216,18 @@ def analyze_spending_by_category(db: Session, client: Any, period: str = "last m
     elif "quarter" in period: start_date = today - relativedelta(months=3)
     else: start_date = today - relativedelta(days=7)
     
-    line_items_text = ""
-    paid_invoices = db.query(models.Invoice).filter(models.Invoice.paid_date >= start_date.date()).all()
-    for inv in paid_invoices:
-        if inv.line_items:
-            for item in inv.line_items:
-                line_items_text += f"{item.get('description', '')}, cost: {item.get('line_total', 0)}\n"
+    # Aggregate paid line items per description in SQL instead of loading every invoice
+    item_totals = db.query(
+        models.DocumentLine.description,
+        func.coalesce(func.sum(models.DocumentLine.line_total), 0.0).label("total")
+    ).join(
+        models.Invoice,
+        (models.Invoice.id == models.DocumentLine.doc_id) & (models.DocumentLine.doc_type == document_lines.DOC_TYPE_INVOICE)
+    ).filter(
+        models.Invoice.paid_date >= start_date.date()
+    ).group_by(models.DocumentLine.description).order_by(func.sum(models.DocumentLine.line_total).desc()).all()
+
+    line_items_text = "".join(f"{description or ''}, cost: {total}\n" for description, total in item_totals)
     
     if not line_items_text:
         return {"error": "No paid invoice line items found for the specified period."}
@@ -308,17 +324,16 @@ get_learned_heuristics_declaration = genai_types.FunctionDeclaration(
 def get_learned_heuristics(db: Session, vendor_name: Optional[str] = None) -> List[Dict[str, Any]]:
     """Tool implementation to fetch learned heuristics from the database."""
     print(f"Executing tool: get_learned_heuristics for vendor={vendor_name}")
-    from app.api.endpoints.learning import get_all_learned_heuristics
+    from app.modules.learning.service import get_aggregated_heuristics
     
-    # We can reuse the logic from our API endpoint
-    results = get_all_learned_heuristics(vendor_name=vendor_name, db=db)
+    # Same aggregated view as the learning page
+    results = get_aggregated_heuristics(db, vendor_name=vendor_name)
     
     # Format for the LLM
     if not results:
         return [{"message": "No specific heuristics have been learned yet."}]
         
-    formatted_results = [schemas.LearnedHeuristic.from_orm(r).model_dump() for r in results]
-    return make_json_serializable(formatted_results)
+    return make_json_serializable(results)
 
 get_notifications_declaration = genai_types.FunctionDeclaration(
     name="get_notifications",
@@ -328,9 +343,9 @@ get_notifications_declaration = genai_types.FunctionDeclaration(
 def get_notifications(db: Session) -> List[Dict[str, Any]]:
     """Tool implementation to fetch unread notifications."""
     print("Executing tool: get_notifications")
-    from app.api.endpoints.notifications import get_notifications as fetch_notifs
+    from app.api.endpoints.notifications import fetch_unread_notifications
     
-    results = fetch_notifs(db=db)
+    results = fetch_unread_notifications(db)
     if not results:
         return [{"message": "There are no new notifications."}]
         
@@ -344,8 +359,7 @@ def _update_invoice_status(db: Session, invoice_id: str, new_status: models.Docu
     invoice.status = new_status
     if new_status == models.DocumentStatus.paid:
         invoice.paid_date = datetime.utcnow().date()
-    audit_log = models.AuditLog(entity_type='Invoice', entity_id=invoice.invoice_id, user='Copilot', action='Status Changed', details={'from': old_status, 'to': new_status.value, 'reason': reason})
-    db.add(audit_log)
+    log_audit_event(db, invoice.id, 'Copilot', 'Status Changed', details={'from': old_status, 'to': new_status.value, 'reason': reason}, invoice_id_str=invoice.invoice_id)
     db.commit()
     return {"success": True, "invoice_id": invoice_id, "new_status": new_status.value}
 
@@ -378,6 +392,9 @@ def edit_purchase_order(db: Session, po_number: str, changes: Dict[str, Any]) ->
     for key, value in changes.items():
         if hasattr(po, key):
             setattr(po, key, value)
+    if 'line_items' in changes:
+        document_lines.sync_document(db, po)
+    fulltext.index_document(db, po)
     db.commit()
     return {"success": True, "po_number": po_number, "updated_fields": list(changes.keys())}
 
@@ -425,20 +442,22 @@ def create_payment_proposal(db: Session, vendor_name: Optional[str] = None, due_
         due_date = datetime.now().date() + timedelta(days=due_in_days)
         query = query.filter(models.Invoice.due_date <= due_date)
     
-    invoices_to_pay = query.all()
-    if not invoices_to_pay:
+    ids_to_pay = [row_id for (row_id,) in query.with_entities(models.Invoice.id)]
+    if not ids_to_pay:
         return {"message": "No approved invoices found matching the criteria."}
 
     batch_id = f"BATCH-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    total_amount = 0
-    invoice_ids = []
-    for inv in invoices_to_pay:
-        inv.status = models.DocumentStatus.pending_payment
-        total_amount += inv.grand_total
-        invoice_ids.append(inv.invoice_id)
-        db.add(models.AuditLog(entity_type="Invoice", entity_id=inv.invoice_id, user="Copilot", action="Added to Payment Batch", details={"batch_id": batch_id}))
-    
+    result = transitions.transition_invoices(
+        db, ids_to_pay, models.DocumentStatus.pending_payment,
+        allowed_from=[models.DocumentStatus.matched],
+        user="Copilot", action="Added to Payment Batch",
+        values={"payment_batch_id": batch_id},
+        returning=[models.Invoice.grand_total],
+        audit_details=lambda row: {"batch_id": batch_id}
+    )
     db.commit()
+    total_amount = sum(row["grand_total"] or 0 for row in result.rows)
+    invoice_ids = [row["invoice_id"] for row in result.rows]
     return {
         "batch_id": batch_id,
         "invoice_count": len(invoice_ids),
@@ -468,7 +487,7 @@ def draft_vendor_communication(db: Session, client: Any, invoice_id: str, reason
         return dossier
         
     vendor_name = dossier.get("summary", {}).get("vendor_name")
-    vendor_setting = db.query(models.VendorSetting).filter_by(vendor_name=vendor_name).first()
+    vendor_setting = config_cache.vendor_config(db, vendor_name)
     vendor_email = vendor_setting.contact_email if vendor_setting else "vendor_contact@example.com"
     
     # Provide the match trace as structured context for the AI
@@ -548,22 +567,27 @@ Draft the email body now.
     except Exception as e:
         return {"error": f"Error generating email draft: {str(e)}"}
 
-create_automation_rule_declaration = genai_types.FunctionDeclaration(name="create_automation_rule", description="Creates a new automation rule, e.g., 'auto-approve invoices from a vendor under a certain amount'.", parameters=genai_types.Schema(type=genai_types.Type.OBJECT, properties={"rule_name": genai_types.Schema(type=genai_types.Type.STRING), "vendor_name": genai_types.Schema(type=genai_types.Type.STRING), "condition_json": genai_types.Schema(type=genai_types.Type.STRING, description="A JSON string like '{\"field\": \"grand_total\", \"operator\": \"<\", \"value\": 500}'"), "action": genai_types.Schema(type=genai_types.Type.STRING, description="The action to take, e.g., 'approve'")}))
-def create_automation_rule(db: Session, rule_name: str, action: str, vendor_name: Optional[str] = None, condition_json: Optional[str] = None) -> Dict[str, Any]:
+create_automation_rule_declaration = genai_types.FunctionDeclaration(name="create_automation_rule", description="Creates a new automation rule, e.g., 'auto-approve invoices from a vendor under a certain amount'.", parameters=genai_types.Schema(type=genai_types.Type.OBJECT, properties={"rule_name": genai_types.Schema(type=genai_types.Type.STRING), "vendor_name": genai_types.Schema(type=genai_types.Type.STRING), "condition_json": genai_types.Schema(type=genai_types.Type.STRING, description="A JSON string like '{\"field\": \"grand_total\", \"operator\": \"<\", \"value\": 500}'. Operators: equals, not_equals, <, >, <=, >=, in, between, contains, is_null. Combine conditions with {\"and\": [...]} or {\"or\": [...]}."), "action": genai_types.Schema(type=genai_types.Type.STRING, description="The action to take, e.g., 'approve'"), "source_heuristic_key": genai_types.Schema(type=genai_types.Type.STRING, description="Only when accepting an automation suggestion: copy the value from the suggestion's proposed action.")}))
+def create_automation_rule(db: Session, rule_name: str, action: str, vendor_name: Optional[str] = None, condition_json: Optional[str] = None, source_heuristic_key: Optional[str] = None) -> Dict[str, Any]:
     print("Executing tool: create_automation_rule")
     try:
         conditions = json.loads(condition_json) if condition_json else {}
+        rules.validate_conditions(conditions)
         new_rule = models.AutomationRule(
             rule_name=rule_name,
             vendor_name=vendor_name,
             conditions=conditions,
-            action=action
+            action=action,
+            source="suggested" if source_heuristic_key else "user",
+            source_heuristic_key=source_heuristic_key,
         )
         db.add(new_rule)
         db.commit()
-        return {"success": True, "message": f"Automation rule '{rule_name}' created. Note: A separate engine is required to execute these rules."}
+        return {"success": True, "message": f"Automation rule '{rule_name}' created. It applies to new and changed invoices automatically."}
     except json.JSONDecodeError:
         return {"error": "Invalid JSON format for condition."}
+    except rules.RuleCompileError as e:
+        return {"error": f"Invalid rule condition: {e}"}
     except Exception as e:
         db.rollback()
         return {"error": str(e)}
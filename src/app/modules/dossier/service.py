@@ -0,0 +1,107 @@
+# src/app/modules/dossier/service.py
+"""
+Invoice dossiers (the invoice with its GRN and PO) for the document viewer, the
+copilot and the workbench prefetch.
+
+The invoice graph is loaded with selectinload, so a batch of N dossiers costs a fixed
+four queries (invoices, GRNs, the GRNs' POs, direct POs) instead of lazy loads per
+invoice.
+Serialised dossiers are cached (app.core.cache) per invoice version: a cheap probe
+reads each invoice's updated_at and its linked documents' counts and updated_at, and
+a dossier is only rebuilt when that version changed.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+
+from app.core import cache
+from app.db import models
+from app.utils import data_formatting
+
+# Maximum number of serialised dossiers kept per process
+DOSSIER_CACHE_SIZE = 512
+# Largest batch the prefetch endpoint accepts
+MAX_BATCH_SIZE = 50
+
+# (invoice string ID, version) -> dossier; superseded versions age out of the LRU
+_dossier_cache = cache.Cache("dossiers", max_entries=DOSSIER_CACHE_SIZE)
+
+
+def dossier_cache_info() -> Dict[str, Any]:
+    """Returns hit/miss counters and the current size of the dossier cache."""
+    return _dossier_cache.info()
+
+
+def _version_query(invoice_ids: Sequence[str]):
+    """Current version of each invoice's dossier inputs, in one statement."""
+    Invoice = models.Invoice
+    GRN = models.GoodsReceiptNote
+    PO = models.PurchaseOrder
+    grn_link = models.InvoiceGRNAssociation
+    po_link = models.InvoicePurchaseOrderAssociation
+
+    def linked(link, doc, doc_key, aggregate):
+        return (select(aggregate).select_from(link).join(doc, doc_key == doc.id)
+                .where(link.invoice_id == Invoice.id).scalar_subquery())
+
+    # The dossier prefers the PO reached through the invoice's GRN
+    grn_pos_updated = (
+        select(func.max(PO.updated_at)).select_from(grn_link)
+        .join(GRN, grn_link.grn_id == GRN.id).join(PO, GRN.po_number == PO.po_number)
+        .where(grn_link.invoice_id == Invoice.id).scalar_subquery()
+    )
+
+    return select(
+        Invoice.invoice_id,
+        Invoice.updated_at,
+        linked(grn_link, GRN, grn_link.grn_id, func.count(GRN.id)),
+        linked(grn_link, GRN, grn_link.grn_id, func.max(GRN.updated_at)),
+        linked(po_link, PO, po_link.po_id, func.count(PO.id)),
+        linked(po_link, PO, po_link.po_id, func.max(PO.updated_at)),
+        grn_pos_updated,
+    ).where(Invoice.invoice_id.in_(invoice_ids))
+
+
+def _load_invoices(db: Session, invoice_ids: Sequence[str]) -> List[models.Invoice]:
+    return db.query(models.Invoice).options(
+        selectinload(models.Invoice.grns).selectinload(models.GoodsReceiptNote.po),
+        selectinload(models.Invoice.purchase_orders),
+    ).filter(models.Invoice.invoice_id.in_(invoice_ids)).all()
+
+
+def get_dossiers(db: Session, invoice_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns {invoice_id: dossier} for the given invoice string IDs; unknown IDs are
+    left out. Dossiers come from the cache when their invoice is unchanged. The
+    returned dicts are shared with the cache and must not be modified.
+    """
+    invoice_ids = list(dict.fromkeys(invoice_ids))
+    if not invoice_ids:
+        return {}
+
+    versions = {row[0]: tuple(row[1:]) for row in db.execute(_version_query(invoice_ids))}
+    dossiers: Dict[str, Dict[str, Any]] = {}
+    stale: List[str] = []
+    for invoice_id, version in versions.items():
+        cached = _dossier_cache.get((invoice_id, version))
+        if cached is not None:
+            dossiers[invoice_id] = cached
+        else:
+            stale.append(invoice_id)
+
+    if stale:
+        # Built as one batch (fixed query count), so not through get_or_load
+        built = {invoice.invoice_id: data_formatting.format_full_dossier(invoice, db)
+                 for invoice in _load_invoices(db, stale)}
+        for invoice_id, dossier in built.items():
+            _dossier_cache.set((invoice_id, versions[invoice_id]), dossier)
+        dossiers.update(built)
+
+    # Keep the caller's order
+    return {invoice_id: dossiers[invoice_id] for invoice_id in invoice_ids if invoice_id in dossiers}
+
+
+def get_dossier(db: Session, invoice_id: str) -> Optional[Dict[str, Any]]:
+    """The dossier for one invoice, or None if it does not exist."""
+    return get_dossiers(db, [invoice_id]).get(invoice_id)
@@ -1,4 +1,5 @@
 # src/app/modules/ingestion/extractor.py
+import hashlib
 import json
 from typing import Optional, Dict
 
@@ -6,6 +7,7 @@ from google import genai
 from google.genai import types
 
 from app.config import settings
+from app.core import cache
 
 # Configure the Gemini client
 client = None
@@ -41,10 +43,37 @@ EXTRACTION_PROMPT = """You are an elite Accounts Payable data extraction engine.
 **4. If Unreadable or Not an AP Document:**
 {"document_type": "Error", "error_message": "The document is illegible, password-protected, or not a recognizable AP document type."}"""
 
+# Extraction results by document content. JSON-serialized, so every caller gets its
+# own copy of the dict to normalize.
+_extraction_cache = cache.Cache("extractions", max_entries=256, serializer=cache.JSON)
+
+
+def _extraction_key(pdf_content: bytes) -> str:
+    # A different model or prompt may extract differently, so both are part of the key
+    digest = hashlib.sha256()
+    for part in (settings.gemini_model_name.encode("utf-8"), EXTRACTION_PROMPT.encode("utf-8"), pdf_content):
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def _is_reusable(data: Optional[Dict]) -> bool:
+    # Failures and 'Error' classifications are retried on the next upload
+    return bool(data) and data.get('document_type') != 'Error'
+
+
 def extract_data_from_pdf(pdf_content: bytes) -> Optional[Dict]:
     """
-    Sends PDF content to Gemini and gets structured JSON data back.
+    Sends PDF content to Gemini and gets structured JSON data back. Successful
+    extractions are cached by content, so re-uploading the same file (or uploading it
+    twice in one batch) costs a single Gemini call.
     """
+    if settings.extraction_cache_ttl_s <= 0:
+        return _extract(pdf_content)
+    return _extraction_cache.get_or_load(_extraction_key(pdf_content), lambda: _extract(pdf_content),
+                                         ttl_s=settings.extraction_cache_ttl_s, should_cache=_is_reusable)
+
+
+def _extract(pdf_content: bytes) -> Optional[Dict]:
     if not client:
         print("Extractor: GenAI client not available. Cannot process PDF.")
         return None
@@ -0,0 +1,104 @@
+# src/app/modules/ingestion/lines.py
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, tuple_
+from sqlalchemy.orm import Session
+
+from app.db import models, bulk
+from app.utils import unit_converter
+
+DOC_TYPE_INVOICE = "invoice"
+DOC_TYPE_PO = "purchase_order"
+DOC_TYPE_GRN = "grn"
+
+_BACKFILL_BATCH_SIZE = 500
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return str(value) if value not in (None, "") else None
+
+
+def _document_header(doc: Any) -> Dict[str, Any]:
+    if isinstance(doc, models.Invoice):
+        return {"doc_type": DOC_TYPE_INVOICE, "doc_reference": doc.invoice_id,
+                "doc_date": doc.invoice_date, "vendor_name": doc.vendor_name}
+    if isinstance(doc, models.PurchaseOrder):
+        return {"doc_type": DOC_TYPE_PO, "doc_reference": doc.po_number,
+                "doc_date": doc.order_date, "vendor_name": doc.vendor_name}
+    if isinstance(doc, models.GoodsReceiptNote):
+        return {"doc_type": DOC_TYPE_GRN, "doc_reference": doc.grn_number,
+                "doc_date": doc.received_date, "vendor_name": doc.po.vendor_name if doc.po else None}
+    raise TypeError(f"Cannot extract line items from {type(doc).__name__}")
+
+
+def build_line_rows(doc: Any) -> List[Dict[str, Any]]:
+    """Flattens a document's JSON line items into `document_lines` rows."""
+    header = _document_header(doc)
+    rows = []
+    for line_number, item in enumerate(doc.line_items or [], start=1):
+        if not isinstance(item, dict):
+            continue
+        if 'normalized_qty' not in item:
+            # Items edited by hand (e.g. PO edits) have not been through ingestion
+            item = unit_converter.normalize_item(dict(item))
+        quantity = next((item[key] for key in ('quantity', 'ordered_qty', 'received_qty') if item.get(key) is not None), None)
+        rows.append({
+            **header,
+            "doc_id": doc.id,
+            "line_number": line_number,
+            "sku": _to_str(item.get('sku')),
+            "description": _to_str(item.get('description')),
+            "po_number": _to_str(item.get('po_number')),
+            "quantity": unit_converter.to_float(quantity),
+            "unit": _to_str(item.get('unit')),
+            "unit_price": unit_converter.to_float(item.get('unit_price')),
+            "line_total": unit_converter.to_float(item.get('line_total')),
+            "normalized_qty": unit_converter.to_float(item.get('normalized_qty')),
+            "normalized_unit": _to_str(item.get('normalized_unit')),
+            "normalized_unit_price": unit_converter.to_float(item.get('normalized_unit_price')),
+        })
+    return rows
+
+
+def sync_document_lines(db: Session, docs: Iterable[Any]):
+    """
+    Replaces the `document_lines` rows of the given invoices, POs and GRNs with their
+    current JSON line items. New objects are flushed first so they have IDs. Runs in
+    the caller's transaction.
+    """
+    docs = [doc for doc in docs if doc is not None]
+    if not docs:
+        return
+    if any(doc.id is None for doc in docs):
+        db.flush()
+
+    keys = [(_document_header(doc)["doc_type"], doc.id) for doc in docs]
+    db.execute(delete(models.DocumentLine).where(
+        tuple_(models.DocumentLine.doc_type, models.DocumentLine.doc_id).in_(keys)
+    ).execution_options(synchronize_session=False))
+    rows = [row for doc in docs for row in build_line_rows(doc)]
+    bulk.bulk_insert(db, models.DocumentLine, rows)
+
+
+def sync_document(db: Session, doc: Any):
+    sync_document_lines(db, [doc])
+
+
+def backfill_if_empty(db: Session):
+    """Populates `document_lines` for databases created before the table existed."""
+    if db.query(models.DocumentLine.id).first():
+        return
+    total = 0
+    for model in (models.PurchaseOrder, models.GoodsReceiptNote, models.Invoice):
+        batch = []
+        for doc in db.query(model).filter(model.line_items.isnot(None)).yield_per(_BACKFILL_BATCH_SIZE):
+            batch.append(doc)
+            if len(batch) >= _BACKFILL_BATCH_SIZE:
+                sync_document_lines(db, batch)
+                total += len(batch)
+                batch = []
+        sync_document_lines(db, batch)
+        total += len(batch)
+    db.commit()
+    if total:
+        print(f"Line-item table populated for {total} document(s).")
@@ -7,6 +7,8 @@ from datetime import datetime, date
 from app.db import models
 from app.modules.ingestion import extractor
 from app.utils import unit_converter
+from app.modules.ingestion import lines as document_lines
+from app.modules.search import fulltext
 
 def convert_string_to_date(date_string: str | None) -> date | None:
     """
@@ -129,6 +131,8 @@ def ingest_document(db: Session, job_id: int, file_content: bytes, filename: str
                 po_data['file_path'] = filename
                 db_po = models.PurchaseOrder(**po_data)
                 db.add(db_po)
+                document_lines.sync_document(db, db_po)
+                fulltext.index_document(db, db_po)
             affected_po_numbers.add(po_number)
 
         elif doc_type == "Goods Receipt Note":
@@ -147,6 +151,8 @@ def ingest_document(db: Session, job_id: int, file_content: bytes, filename: str
                 grn_data['po'] = po
                 db_grn = models.GoodsReceiptNote(**grn_data)
                 db.add(db_grn)
+                document_lines.sync_document(db, db_grn)
+                fulltext.index_document(db, db_grn)
             affected_po_numbers.add(po_number)
             
         elif doc_type == "Invoice":
@@ -154,6 +160,9 @@ def ingest_document(db: Session, job_id: int, file_content: bytes, filename: str
             existing_invoice = db.query(models.Invoice).filter_by(invoice_id=invoice_id).first()
             if existing_invoice:
                  print(f"Invoice {invoice_id} already exists. Skipping creation.")
+            elif db.query(models.ArchivedInvoice.id).filter_by(invoice_id=invoice_id).first():
+                 # Re-uploading an old, already paid/rejected invoice must not re-open it
+                 print(f"Invoice {invoice_id} already exists in the invoice archive. Skipping creation.")
             else:
                 invoice_data = prepare_invoice_data(extracted_data, job_id)
                 invoice_data['file_path'] = filename
@@ -176,6 +185,8 @@ def ingest_document(db: Session, job_id: int, file_content: bytes, filename: str
                             affected_po_numbers.add(grn.po_number)
 
                 db.add(db_invoice)
+                document_lines.sync_document(db, db_invoice)
+                fulltext.index_document(db, db_invoice)
         else:
             msg = f"Unknown document type '{doc_type}' for {filename}."
             print(msg)
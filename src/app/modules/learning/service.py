@@ -0,0 +1,284 @@
+# src/app/modules/learning/service.py
+"""
+Learns vendor-specific heuristics from manual approvals: when a reviewer approves an
+invoice that failed matching (needs_review -> matched), the first failed check is
+turned into a tolerance that the comparison view can suggest next time.
+
+Heuristics are unique per (vendor, exception type, condition_key), where condition_key
+is a hash of the learned condition, so strengthening one is a single upsert. The
+per-vendor aggregation shown on the learning page is computed in SQL and cached until
+a heuristic is added or strengthened. The most confident heuristic per vendor and
+exception type is kept in the configuration cache for the comparison view.
+"""
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, load_only
+
+from app.core import cache, config_cache, domain_events
+from app.db import bulk, models
+from app.utils.condition_keys import condition_key
+
+# Heuristics at least this confident are offered as suggestions on the comparison view
+SUGGESTION_MIN_CONFIDENCE = 0.8
+
+# Tolerances a learned condition can hold; aggregated views take the loosest of each
+TOLERANCE_KEYS = ("max_variance_percent", "max_quantity_diff")
+
+# Aggregated views kept, keyed by vendor filter and heuristics version
+AGGREGATE_CACHE_SIZE = 64
+
+_aggregate_cache = cache.Cache("learned_heuristics", max_entries=AGGREGATE_CACHE_SIZE)
+
+
+def _derive_from_failure(step: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(exception_type, learned_condition) for one failed match step, or None if it is not learnable."""
+    failure_details = step.get("details") or {}
+    failure_step = step.get("step", "")
+
+    learned_condition = {}
+    exception_type = "" # We'll derive this from the step name
+
+    if "Price Match" in failure_step:
+        exception_type = "PriceMismatchException"
+        # The matching engine records the invoice's price as 'inv_price'
+        invoice_price = failure_details.get("inv_price", failure_details.get("invoice_price")) or 0
+        po_price = failure_details.get("po_price") or 0
+        if po_price > 0:
+            variance = abs(invoice_price - po_price) / po_price * 100
+            learned_condition = {"max_variance_percent": math.ceil(variance)}
+    elif "Quantity Match" in failure_step:
+        exception_type = "QuantityMismatchException"
+        invoice_qty = failure_details.get("invoice_qty", 0)
+        # Check if it was compared to GRN or PO
+        grn_qty = failure_details.get("grn_qty")
+        po_qty = failure_details.get("po_qty")
+        if grn_qty is not None:
+            learned_condition = {"max_quantity_diff": abs(invoice_qty - grn_qty)}
+        elif po_qty is not None:
+            learned_condition = {"max_quantity_diff": abs(invoice_qty - po_qty)}
+
+    if not exception_type or not learned_condition:
+        return None # Could not determine a learnable condition
+    return exception_type, learned_condition
+
+
+def _failed_checks(invoice: models.Invoice) -> List[Dict[str, Any]]:
+    # The closing 'Final Result' step only repeats that something failed
+    return [step for step in invoice.match_trace or []
+            if step.get("status") == "FAIL" and step.get("step") != "Final Result"]
+
+
+def derive_heuristic(invoice: models.Invoice) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Returns (exception_type, learned_condition) for an approved invoice, or None if
+    its match trace has no learnable failure. Reads from the match_trace field.
+    """
+    # We only learn from invoices that have a match trace
+    if not invoice.match_trace or not invoice.vendor_name:
+        return None
+
+    # Find the first failed step in the trace to learn from
+    failures = _failed_checks(invoice)
+    if not failures:
+        return None # No failure to learn from
+    return _derive_from_failure(failures[0])
+
+
+def is_covered(invoice: Any, exception_type: str, learned_condition: Dict[str, Any]) -> bool:
+    """
+    True if every check the invoice failed is an `exception_type` failure within the
+    tolerances of `learned_condition`, i.e. a reviewer who taught that heuristic would
+    have approved it. Works on anything with a match_trace attribute.
+    """
+    failures = _failed_checks(invoice)
+    if not failures or not learned_condition:
+        return False
+    for step in failures:
+        derived = _derive_from_failure(step)
+        if derived is None or derived[0] != exception_type:
+            return False
+        observed = derived[1]
+        if any(key not in observed or observed[key] > limit for key, limit in learned_condition.items()):
+            return False
+    return True
+
+
+def _confidence(trigger_count):
+    """Approaches 1 as trigger_count increases; works on ints and SQL expressions alike."""
+    return 1.0 - 1.0 / (trigger_count + 1)
+
+
+def learn_from_manual_approvals(db: Session, invoices: Iterable[models.Invoice]) -> int:
+    """
+    Creates or strengthens a LearnedHeuristic for each approved invoice. Approvals with
+    the same vendor, exception and condition are counted together and applied in one
+    upsert keyed on the heuristic's condition_key, so learning costs one statement
+    however many heuristics exist, and concurrent learners never create duplicates.
+    Returns how many approvals were learned from.
+    """
+    Heuristic = models.LearnedHeuristic
+    approvals: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    learned = 0
+    for invoice in invoices:
+        derived = derive_heuristic(invoice)
+        if not derived:
+            continue
+        exception_type, learned_condition = derived
+        key = (invoice.vendor_name, exception_type, condition_key(learned_condition))
+        row = approvals.get(key)
+        if row is None:
+            row = approvals[key] = {
+                "vendor_name": invoice.vendor_name,
+                "exception_type": exception_type,
+                "learned_condition": learned_condition,
+                "condition_key": key[2],
+                "resolution_action": models.DocumentStatus.matched.value,
+                "trigger_count": 0,
+            }
+        row["trigger_count"] += 1
+        learned += 1
+    if not approvals:
+        return 0
+
+    now = datetime.utcnow()
+    rows = [{**row, "confidence_score": _confidence(row["trigger_count"]), "last_applied_at": now}
+            for row in approvals.values()]
+    results = bulk.upsert(
+        db, Heuristic, rows,
+        index_elements=["vendor_name", "exception_type", "condition_key"],
+        set_=lambda table, excluded: {
+            "trigger_count": table.c.trigger_count + excluded.trigger_count,
+            "confidence_score": _confidence(table.c.trigger_count + excluded.trigger_count),
+            "last_applied_at": excluded.last_applied_at,
+        },
+        returning=[Heuristic.vendor_name, Heuristic.exception_type, Heuristic.trigger_count, Heuristic.confidence_score],
+    )
+    # Core upserts skip the ORM flush hook that normally bumps the cached version
+    config_cache.bump(db, [config_cache.HEURISTICS])
+    for vendor_name, exception_type, trigger_count, confidence_score in results:
+        print(f"✅ Learned heuristic for {vendor_name}: {exception_type} (seen {trigger_count}x, confidence {confidence_score:.2f})")
+    return learned
+
+
+def learn_from_manual_approval(db: Session, invoice: models.Invoice):
+    """Analyzes a single manually approved invoice to create or update a LearnedHeuristic."""
+    learn_from_manual_approvals(db, [invoice])
+
+
+def handle_status_changes(db: Session, events: List[models.OutboxEvent]):
+    """
+    Outbox handler: learns from the invoices a reviewer approved (needs_review -> matched).
+    Approvals made by automation rules apply what was already learned and are skipped.
+    """
+    approved_ids = {e.payload["invoice_db_id"] for e in events
+                    if e.payload.get("from") == models.DocumentStatus.needs_review.value
+                    and e.payload.get("to") == models.DocumentStatus.matched.value
+                    and e.payload.get("user") != domain_events.AUTOMATION_USER}
+    if not approved_ids:
+        return
+    invoices = db.query(models.Invoice).options(
+        load_only(models.Invoice.id, models.Invoice.vendor_name, models.Invoice.match_trace)
+    ).filter(models.Invoice.id.in_(approved_ids)).all()
+    print(f"🧠 Learning from manual approval of {len(invoices)} invoice(s)...")
+    learn_from_manual_approvals(db, invoices)
+
+
+def aggregate_cache_info() -> Dict[str, Any]:
+    """Returns hit/miss counters and the current size of the aggregated-heuristics cache."""
+    return _aggregate_cache.info()
+
+
+def _heuristics_version(db: Session) -> Tuple:
+    """Changes whenever a heuristic is created or strengthened. Two index lookups."""
+    Heuristic = models.LearnedHeuristic
+    # Separate subqueries, so each MAX is answered from its own index
+    return tuple(db.execute(select(
+        select(func.max(Heuristic.id)).scalar_subquery(),
+        select(func.max(Heuristic.last_applied_at)).scalar_subquery(),
+    )).one())
+
+
+def _whole(value: Optional[float]):
+    return int(value) if value is not None and float(value).is_integer() else value
+
+
+def _aggregate(db: Session, vendor_name: Optional[str]) -> List[Dict[str, Any]]:
+    Heuristic = models.LearnedHeuristic
+    max_confidence = func.max(Heuristic.confidence_score)
+    stmt = select(
+        Heuristic.vendor_name,
+        Heuristic.exception_type,
+        func.min(Heuristic.resolution_action),
+        max_confidence,
+        func.sum(Heuristic.trigger_count),
+        func.count(Heuristic.id),
+        *[func.max(Heuristic.learned_condition[key].as_float()) for key in TOLERANCE_KEYS],
+    ).group_by(Heuristic.vendor_name, Heuristic.exception_type).order_by(
+        max_confidence.desc(), Heuristic.vendor_name, Heuristic.exception_type
+    )
+    if vendor_name:
+        stmt = stmt.where(Heuristic.vendor_name.ilike(f"%{vendor_name}%"))
+
+    aggregated = []
+    for vendor, exception_type, resolution_action, confidence, triggers, impact, *tolerances in db.execute(stmt):
+        aggregated.append({
+            "id": f"{vendor}-{exception_type}",
+            "vendor_name": vendor,
+            "exception_type": exception_type,
+            "learned_condition": {key: _whole(value) for key, value in zip(TOLERANCE_KEYS, tolerances) if value is not None},
+            "resolution_action": resolution_action,
+            "confidence_score": confidence,
+            "trigger_count": int(triggers or 0),
+            "potential_impact": impact,
+        })
+    return aggregated
+
+
+def get_aggregated_heuristics(db: Session, vendor_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Learned heuristics grouped per vendor and exception type, most confident first:
+    summed trigger counts, the highest confidence, the number of distinct conditions
+    (potential_impact) and the loosest tolerance of each kind. The returned list is
+    shared with the cache and must not be modified.
+    """
+    vendor_name = vendor_name or None
+    version = _heuristics_version(db)
+    return _aggregate_cache.get_or_load((vendor_name, version), lambda: _aggregate(db, vendor_name))
+
+
+@dataclass(frozen=True)
+class HeuristicHint:
+    vendor_name: str
+    exception_type: str
+    learned_condition: Dict[str, Any]
+    resolution_action: str
+    confidence_score: float
+
+
+def _load_suggestions(db: Session) -> Dict[Tuple[str, str], HeuristicHint]:
+    Heuristic = models.LearnedHeuristic
+    rows = db.execute(select(
+        Heuristic.vendor_name, Heuristic.exception_type, Heuristic.learned_condition,
+        Heuristic.resolution_action, Heuristic.confidence_score,
+    ).where(
+        Heuristic.confidence_score >= SUGGESTION_MIN_CONFIDENCE,
+        Heuristic.resolution_action == models.DocumentStatus.matched.value,
+    ).order_by(Heuristic.confidence_score.desc(), Heuristic.id))
+    hints: Dict[Tuple[str, str], HeuristicHint] = {}
+    for row in rows:
+        # Most confident first, so the first row per key wins
+        hints.setdefault((row.vendor_name, row.exception_type), HeuristicHint(*row))
+    return hints
+
+
+_suggestions = config_cache.section(config_cache.HEURISTICS, _load_suggestions)
+
+
+def suggested_heuristic(db: Session, vendor_name: Optional[str], exception_type: str,
+                        max_age_s: Optional[float] = None) -> Optional[HeuristicHint]:
+    """The most confident heuristic worth suggesting for this vendor and exception, if any."""
+    return _suggestions.get(db, max_age_s).get((vendor_name, exception_type))
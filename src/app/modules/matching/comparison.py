@@ -1,12 +1,16 @@
 # src/app/modules/matching/comparison.py
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Dict, Any, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from thefuzz import process as fuzzy_process
 import math
 
 from app.db import models
 from app.db import schemas
+from app.db.session import SessionLocal
+from app.modules.learning import service as learning_service
 
 def _find_best_match(query: str, choices_map: Dict[str, Any], score_cutoff=63) -> Tuple[str | None, Any | None]:
     """Finds the best fuzzy match for a query string in a dictionary of choices."""
@@ -17,7 +21,10 @@ def _find_best_match(query: str, choices_map: Dict[str, Any], score_cutoff=63) -
         return best_match[0], choices_map[best_match[0]]
     return None, None
 
-def prepare_comparison_data(db: Session, invoice_db_id: int) -> Dict[str, Any]:
+# Bump when the payload shape changes, so snapshots built by older code are rebuilt
+SNAPSHOT_FORMAT_VERSION = 1
+
+def build_comparison_payload(db: Session, invoice_db_id: int) -> Dict[str, Any]:
     """
     Prepares a detailed, line-by-line comparison between an invoice,
     and all its related POs and GRNs, and includes proactive suggestions.
@@ -88,12 +95,8 @@ def prepare_comparison_data(db: Session, invoice_db_id: int) -> Dict[str, Any]:
             if "Price Match" in failure_step_name: exception_type = "PriceMismatchException"
             elif "Quantity Match" in failure_step_name: exception_type = "QuantityMismatchException"
             if exception_type:
-                heuristic = db.query(models.LearnedHeuristic).filter(
-                    models.LearnedHeuristic.vendor_name == invoice.vendor_name,
-                    models.LearnedHeuristic.exception_type == exception_type,
-                    models.LearnedHeuristic.confidence_score >= 0.8,
-                    models.LearnedHeuristic.resolution_action == 'matched'
-                ).order_by(models.LearnedHeuristic.confidence_score.desc()).first()
+                # The result is stored in the snapshot, so skip the cache's staleness window
+                heuristic = learning_service.suggested_heuristic(db, invoice.vendor_name, exception_type, max_age_s=0)
                 if heuristic:
                     condition_text = ""
                     if exception_type == "PriceMismatchException":
@@ -118,4 +121,115 @@ def prepare_comparison_data(db: Session, invoice_db_id: int) -> Dict[str, Any]:
             "grns": [{"file_path": grn.file_path, "grn_number": grn.grn_number} for grn in invoice.grns]
         },
         "suggestion": suggestion,
-    } 
\ No newline at end of file
+    }
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+def _snapshot_lookup(invoice_db_id: int):
+    """
+    One indexed read returning the stored snapshot (if any) together with the current
+    state of everything it was built from: the invoice, its linked POs and GRNs, and
+    the vendor's learned heuristics (which drive the suggestion).
+    """
+    Invoice = models.Invoice
+    po_link = models.InvoicePurchaseOrderAssociation
+    grn_link = models.InvoiceGRNAssociation
+    PO = models.PurchaseOrder
+    GRN = models.GoodsReceiptNote
+    Heuristic = models.LearnedHeuristic
+    Snapshot = models.ComparisonSnapshot
+
+    def linked(link, doc, doc_key, aggregate):
+        return (select(aggregate).select_from(link).join(doc, doc_key == doc.id)
+                .where(link.invoice_id == Invoice.id).scalar_subquery())
+
+    return (
+        select(
+            Invoice.updated_at.label("invoice_updated_at"),
+            linked(po_link, PO, po_link.po_id, func.count(PO.id)).label("po_count"),
+            linked(po_link, PO, po_link.po_id, func.max(PO.updated_at)).label("pos_updated_at"),
+            linked(grn_link, GRN, grn_link.grn_id, func.count(GRN.id)).label("grn_count"),
+            linked(grn_link, GRN, grn_link.grn_id, func.max(GRN.updated_at)).label("grns_updated_at"),
+            select(func.max(Heuristic.last_applied_at))
+                .where(Heuristic.vendor_name == Invoice.vendor_name)
+                .scalar_subquery().label("heuristics_updated_at"),
+            Snapshot.version, Snapshot.format_version, Snapshot.source_stamp, Snapshot.payload,
+        )
+        .select_from(Invoice)
+        .outerjoin(Snapshot, Snapshot.invoice_db_id == Invoice.id)
+        .where(Invoice.id == invoice_db_id)
+    )
+
+def _source_stamp(row) -> Dict[str, Any]:
+    return {
+        "invoice": _iso(row.invoice_updated_at),
+        "pos": [row.po_count, _iso(row.pos_updated_at)],
+        "grns": [row.grn_count, _iso(row.grns_updated_at)],
+        "heuristics": _iso(row.heuristics_updated_at),
+    }
+
+def _is_current(row, stamp: Dict[str, Any]) -> bool:
+    return (row.payload is not None
+            and row.format_version == SNAPSHOT_FORMAT_VERSION
+            and row.source_stamp == stamp)
+
+def _store_snapshot(db: Session, invoice_db_id: int, payload: Dict[str, Any], stamp: Dict[str, Any]):
+    snapshot = db.query(models.ComparisonSnapshot).filter_by(invoice_db_id=invoice_db_id).first()
+    if snapshot is None:
+        snapshot = models.ComparisonSnapshot(invoice_db_id=invoice_db_id, version=0)
+        db.add(snapshot)
+    snapshot.version += 1
+    snapshot.format_version = SNAPSHOT_FORMAT_VERSION
+    snapshot.source_stamp = stamp
+    snapshot.payload = payload
+    snapshot.computed_at = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request stored the snapshot first; it was built from the same inputs
+        db.rollback()
+
+def _rebuild(db: Session, invoice_db_id: int, row) -> Dict[str, Any]:
+    payload = build_comparison_payload(db, invoice_db_id)
+    if "error" not in payload:
+        _store_snapshot(db, invoice_db_id, payload, _source_stamp(row))
+    return payload
+
+def refresh_snapshot(db: Session, invoice_db_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Rebuilds and persists an invoice's comparison snapshot. Returns the payload, or
+    None if the invoice is gone.
+    """
+    row = db.execute(_snapshot_lookup(invoice_db_id)).first()
+    if row is None:
+        return None
+    return _rebuild(db, invoice_db_id, row)
+
+def handle_match_completed(db: Session, events: List[models.OutboxEvent]):
+    """
+    Outbox handler: persists the workbench view of each finished match, so opening the
+    invoice is a single read. Snapshots are only a cache, so a failure is logged and skipped.
+    """
+    invoice_ids = dict.fromkeys(e.payload["invoice_db_id"] for e in events)
+    # Snapshots commit one at a time; keep them out of the event batch's transaction
+    with SessionLocal() as snapshot_db:
+        for invoice_db_id in invoice_ids:
+            try:
+                refresh_snapshot(snapshot_db, invoice_db_id)
+            except Exception as e:
+                snapshot_db.rollback()
+                print(f"Warning: Could not store comparison snapshot for invoice DB ID {invoice_db_id}: {e}")
+
+def prepare_comparison_data(db: Session, invoice_db_id: int) -> Dict[str, Any]:
+    """
+    Serves the workbench comparison for an invoice from its persisted snapshot, and
+    only rebuilds it when the snapshot is missing or its inputs have changed since.
+    """
+    row = db.execute(_snapshot_lookup(invoice_db_id)).first()
+    if row is None:
+        return {"error": "Invoice not found"}
+    if _is_current(row, _source_stamp(row)):
+        return row.payload
+    return _rebuild(db, invoice_db_id, row)
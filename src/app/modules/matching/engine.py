@@ -1,11 +1,15 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Dict, Any, Tuple
 from thefuzz import process as fuzzy_process
 import math
 
 from app.db import models
+from app.db.session import SessionLocal
 from app.config import PRICE_TOLERANCE_PERCENT
 from app.utils.auditing import log_audit_event
+from app.core import config_cache, domain_events, events, outbox
+from app.modules.search import fulltext
 from .exceptions import *
 
 # This is the new entry point for the matching engine.
@@ -54,7 +58,7 @@ def run_match_for_invoice(db: Session, invoice_db_id: int):
     grn_items_map = {f"{item.get('description', '')}##{grn.grn_number}": {**item, 'grn_number': grn.grn_number} for grn in related_grns for item in (grn.line_items or [])}
 
     # --- Step 3: Get Vendor-Specific Tolerance ---
-    vendor_setting = db.query(models.VendorSetting).filter_by(vendor_name=invoice.vendor_name).first()
+    vendor_setting = config_cache.vendor_config(db, invoice.vendor_name)
     price_tolerance = vendor_setting.price_tolerance_percent if vendor_setting and vendor_setting.price_tolerance_percent is not None else PRICE_TOLERANCE_PERCENT
     add_trace(trace, "Configuration", "INFO", f"Using price tolerance of {price_tolerance}% for '{invoice.vendor_name}'.")
 
@@ -179,20 +183,46 @@ def _finalize_invoice_status(invoice: models.Invoice, trace: List, db: Session,
     if is_non_po:
         invoice.status = models.DocumentStatus.needs_review
         add_trace(trace, "Final Result", "INFO", "Non-PO invoice queued for manual review.")
-        log_audit_event(db, invoice.id, "Matching Engine", f"Match Complete: Non-PO, requires review")
+        log_audit_event(db, invoice.id, "Matching Engine", f"Match Complete: Non-PO, requires review", invoice_id_str=invoice.invoice_id)
     elif has_failures:
         invoice.status = models.DocumentStatus.needs_review
         add_trace(trace, "Final Result", "FAIL", "Invoice requires manual review due to validation failures.")
-        log_audit_event(db, invoice.id, "Matching Engine", f"Match Failed: Requires review ({category})")
+        log_audit_event(db, invoice.id, "Matching Engine", f"Match Failed: Requires review ({category})", invoice_id_str=invoice.invoice_id)
     else:
         invoice.status = models.DocumentStatus.matched
         invoice.review_category = None
         add_trace(trace, "Final Result", "PASS", "All checks passed. Invoice is matched and ready for payment.")
-        log_audit_event(db, invoice.id, "Matching Engine", "Match Succeeded")
-    
+        log_audit_event(db, invoice.id, "Matching Engine", "Match Succeeded", invoice_id_str=invoice.invoice_id)
+
+    events.publish_after_commit(db, "invoice.match_completed", {
+        "invoice_db_id": invoice.id, "invoice_id": invoice.invoice_id,
+        "status": invoice.status.value, "review_category": invoice.review_category,
+    })
+    # Subscribers (e.g. the comparison snapshot) react once this commits
+    outbox.record_many(db, [domain_events.match_completed_row(invoice)])
+    # Matching links the POs of the invoice's GRNs, and the index lists linked documents
+    fulltext.index_document(db, invoice)
     db.commit()
     print(f"--- Matching Engine finished for Invoice: {invoice.invoice_id} with status {invoice.status.value} ---")
 
+# Invoices whose match is still open to change; paid or rejected ones keep their result
+REMATCH_STATUSES = (models.DocumentStatus.ingested, models.DocumentStatus.needs_review, models.DocumentStatus.matched)
+
+def handle_po_edited(db: Session, events: List[models.OutboxEvent]):
+    """Outbox handler: re-matches the open invoices linked to each edited PO."""
+    po_ids = {e.payload["po_db_id"] for e in events}
+    Link = models.InvoicePurchaseOrderAssociation
+    invoice_ids = list(db.scalars(
+        select(Link.invoice_id).join(models.Invoice, models.Invoice.id == Link.invoice_id)
+        .where(Link.po_id.in_(po_ids), models.Invoice.status.in_(REMATCH_STATUSES))
+        .distinct()
+    ))
+    for invoice_db_id in invoice_ids:
+        print(f"Re-matching invoice ID {invoice_db_id} after a PO update.")
+        # Each run commits as it goes, so it gets its own session
+        with SessionLocal() as match_db:
+            run_match_for_invoice(match_db, invoice_db_id)
+
 def add_trace(trace_list: List, step: str, status: str, message: str, details: Dict = None):
     """Standardizes adding entries to the match trace."""
     trace_list.append({
@@ -0,0 +1,255 @@
+# src/app/modules/search/compiler.py
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, DateTime, Enum, Float, Integer, Select, and_, bindparam, select
+from sqlalchemy.orm import Session
+
+from app.core import cache
+from app.db import models, schemas
+from app.utils import pagination
+from app.modules.search import fulltext
+
+
+class SearchQueryError(ValueError):
+    """Raised when a search request references an unknown field/operator or a bad value."""
+    pass
+
+
+# Whitelist of invoice fields that can be filtered on. Anything else is rejected
+# instead of being passed to getattr() on the model.
+SEARCHABLE_FIELDS = {
+    'id': models.Invoice.id,
+    'invoice_id': models.Invoice.invoice_id,
+    'vendor_name': models.Invoice.vendor_name,
+    'buyer_name': models.Invoice.buyer_name,
+    'status': models.Invoice.status,
+    'review_category': models.Invoice.review_category,
+    'invoice_date': models.Invoice.invoice_date,
+    'due_date': models.Invoice.due_date,
+    'paid_date': models.Invoice.paid_date,
+    'discount_due_date': models.Invoice.discount_due_date,
+    'subtotal': models.Invoice.subtotal,
+    'tax': models.Invoice.tax,
+    'grand_total': models.Invoice.grand_total,
+    'discount_amount': models.Invoice.discount_amount,
+    'gl_code': models.Invoice.gl_code,
+    'payment_batch_id': models.Invoice.payment_batch_id,
+    'notes': models.Invoice.notes,
+    'job_id': models.Invoice.job_id,
+    'created_at': models.Invoice.created_at,
+    'updated_at': models.Invoice.updated_at,
+}
+
+# Pseudo-field for the `matches` operator, which searches the full-text index
+# (invoice ID, vendor, PO/GRN numbers, notes, line-item descriptions and SKUs).
+FULLTEXT_FIELD = 'text'
+
+SORTABLE_FIELDS = {name: column for name, column in SEARCHABLE_FIELDS.items() if name != 'notes'}
+
+DEFAULT_SORT_FIELD = 'invoice_date'
+
+VALUE_OPERATORS = {
+    'is', 'equals', 'not_equals', 'contains', 'starts_with',
+    'gt', 'lt', 'gte', 'lte', 'in', 'not_in', 'between', 'matches',
+}
+NULL_OPERATORS = {'is_null', 'is_not_null'}
+SUPPORTED_OPERATORS = VALUE_OPERATORS | NULL_OPERATORS
+
+# Maximum number of distinct filter shapes whose statements are kept in the plan cache.
+PLAN_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CompiledSearch:
+    """A filtered invoice SELECT with its bound values and the resolved sort order."""
+    statement: Select
+    sort_column: Any
+    descending: bool
+
+    def ordered(self) -> Select:
+        """The statement ordered by (sort key, id), NULL sort keys last."""
+        return pagination.apply_keyset(self.statement, self.sort_column, models.Invoice.id, self.descending)
+
+
+# shape -> (unbound statement, sort column, descending); statements cannot leave the process
+_plan_cache = cache.Cache("search_plans", max_entries=PLAN_CACHE_SIZE, local=True)
+
+
+def plan_cache_info() -> Dict[str, Any]:
+    """Returns hit/miss counters and the current size of the plan cache."""
+    return _plan_cache.info()
+
+
+def coerce_value(field: str, column, value: Any) -> Any:
+    """Converts a JSON filter value to the Python type of the target column."""
+    if value is None:
+        return None
+    column_type = column.type
+    try:
+        if isinstance(column_type, Enum):
+            return models.DocumentStatus(str(value).lower().replace(' ', '_'))
+        if isinstance(column_type, DateTime):
+            if isinstance(value, datetime):
+                return value
+            return datetime.fromisoformat(str(value))
+        if isinstance(column_type, Date):
+            if isinstance(value, date):
+                return value
+            return date.fromisoformat(str(value)[:10])
+        if isinstance(column_type, Float):
+            return float(value)
+        if isinstance(column_type, Integer):
+            return int(value)
+    except (TypeError, ValueError) as e:
+        raise SearchQueryError(f"Invalid value {value!r} for field '{field}'.") from e
+    return str(value)
+
+
+def escape_like(value: str) -> str:
+    """Escapes LIKE wildcards and the backslash so the value matches literally."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _is_date_only(value: Any) -> bool:
+    return isinstance(value, str) and len(value) == 10
+
+
+def _condition_shape(condition: schemas.FilterCondition) -> Tuple[str, str, str]:
+    """
+    The part of a condition that determines the SQL it compiles to. Values are bound
+    separately, so conditions that only differ in their values share a cached plan.
+    """
+    field, operator = condition.field, condition.operator
+    if (field == FULLTEXT_FIELD) != (operator == 'matches'):
+        raise SearchQueryError(f"The 'matches' operator is only supported on the '{FULLTEXT_FIELD}' field, and vice versa.")
+    if field == FULLTEXT_FIELD:
+        if not fulltext.is_available():
+            raise SearchQueryError("Full-text search is not available on this database.")
+        return field, operator, ""
+    if field not in SEARCHABLE_FIELDS:
+        raise SearchQueryError(f"Field '{field}' cannot be searched. Allowed fields: {sorted(SEARCHABLE_FIELDS)}")
+    if operator not in SUPPORTED_OPERATORS:
+        raise SearchQueryError(f"Unsupported operator '{operator}'. Supported operators: {sorted(SUPPORTED_OPERATORS)}")
+
+    kind = ""
+    if operator in ('is', 'equals') and condition.value is None:
+        kind = "null"
+    elif operator in ('is', 'equals') and isinstance(SEARCHABLE_FIELDS[field].type, DateTime) and _is_date_only(condition.value):
+        # Equality on a calendar day becomes a half-open range so the index can be used
+        kind = "day"
+    elif operator in ('in', 'not_in') and not isinstance(condition.value, list):
+        raise SearchQueryError(f"Operator '{operator}' requires a list value for field '{field}'.")
+    elif operator == 'between' and not (isinstance(condition.value, list) and len(condition.value) == 2):
+        raise SearchQueryError(f"Operator 'between' requires a [low, high] value for field '{field}'.")
+    return field, operator, kind
+
+
+def _build_predicate(index: int, shape: Tuple[str, str, str]):
+    """Builds the SQL predicate for one condition shape using named bind parameters."""
+    field, operator, kind = shape
+    name = f"p{index}"
+    if operator == 'matches':
+        return models.Invoice.id.in_(fulltext.invoice_match_subquery(name))
+    column = SEARCHABLE_FIELDS[field]
+
+    if operator == 'is_null' or kind == "null":
+        return column.is_(None)
+    if operator == 'is_not_null':
+        return column.isnot(None)
+    if kind == "day":
+        return and_(column >= bindparam(f"{name}_start"), column < bindparam(f"{name}_end"))
+    if operator in ('is', 'equals'):
+        return column == bindparam(name)
+    if operator == 'not_equals':
+        return column != bindparam(name)
+    if operator == 'contains':
+        return column.ilike(bindparam(name), escape='\\')
+    if operator == 'starts_with':
+        # A prefix LIKE can be answered from a b-tree index, unlike a '%...%' pattern
+        return column.like(bindparam(name), escape='\\')
+    if operator == 'gt':
+        return column > bindparam(name)
+    if operator == 'lt':
+        return column < bindparam(name)
+    if operator == 'gte':
+        return column >= bindparam(name)
+    if operator == 'lte':
+        return column <= bindparam(name)
+    if operator == 'in':
+        return column.in_(bindparam(name, expanding=True))
+    if operator == 'not_in':
+        return column.not_in(bindparam(name, expanding=True))
+    if operator == 'between':
+        return column.between(bindparam(f"{name}_low"), bindparam(f"{name}_high"))
+    raise SearchQueryError(f"Unsupported operator '{operator}'.")
+
+
+def _bind_values(index: int, shape: Tuple[str, str, str], value: Any) -> Dict[str, Any]:
+    """Returns the bind parameter values for one condition."""
+    field, operator, kind = shape
+    name = f"p{index}"
+    if operator == 'matches':
+        try:
+            return {name: fulltext.build_match_query(str(value or ''))}
+        except ValueError as e:
+            raise SearchQueryError(str(e)) from e
+    column = SEARCHABLE_FIELDS[field]
+
+    if operator in NULL_OPERATORS or kind == "null":
+        return {}
+    if kind == "day":
+        start = datetime.combine(coerce_value(field, models.Invoice.invoice_date, value), datetime.min.time())
+        return {f"{name}_start": start, f"{name}_end": start + timedelta(days=1)}
+    if operator == 'contains':
+        return {name: f"%{escape_like(str(value))}%"}
+    if operator == 'starts_with':
+        return {name: f"{escape_like(str(value))}%"}
+    if operator in ('in', 'not_in'):
+        return {name: [coerce_value(field, column, v) for v in value]}
+    if operator == 'between':
+        low, high = value
+        return {f"{name}_low": coerce_value(field, column, low), f"{name}_high": coerce_value(field, column, high)}
+    return {name: coerce_value(field, column, value)}
+
+
+def compile_search(filters: Sequence[schemas.FilterCondition], sort_by: Optional[str] = None,
+                   sort_order: str = 'desc') -> CompiledSearch:
+    """
+    Validates a list of filter conditions and compiles them into an invoice SELECT.
+    Statements are cached by filter shape (fields, operators and sort) so repeated
+    searches with different values skip validation and statement construction.
+    """
+    sort_by = sort_by or DEFAULT_SORT_FIELD
+    if sort_by not in SORTABLE_FIELDS:
+        raise SearchQueryError(f"Cannot sort by '{sort_by}'. Allowed fields: {sorted(SORTABLE_FIELDS)}")
+    descending = sort_order != 'asc'
+
+    shapes = tuple(_condition_shape(condition) for condition in filters)
+    cache_key = (shapes, sort_by, descending)
+
+    def build_plan():
+        stmt = select(models.Invoice)
+        for index, shape in enumerate(shapes):
+            stmt = stmt.where(_build_predicate(index, shape))
+        return stmt, SORTABLE_FIELDS[sort_by], descending
+
+    stmt, sort_column, descending = _plan_cache.get_or_load(cache_key, build_plan)
+    params: Dict[str, Any] = {}
+    for index, (shape, condition) in enumerate(zip(shapes, filters)):
+        params.update(_bind_values(index, shape, condition.value))
+    if params:
+        stmt = stmt.params(**params)
+    return CompiledSearch(statement=stmt, sort_column=sort_column, descending=descending)
+
+
+def compile_search_request(request: schemas.SearchRequest) -> CompiledSearch:
+    return compile_search(request.filters, request.sort_by, request.sort_order)
+
+
+def run_search(db: Session, compiled: CompiledSearch, limit: Optional[int] = None,
+               cursor: Optional[str] = None, options: Sequence[Any] = ()) -> Tuple[List[models.Invoice], Optional[str]]:
+    """Executes a compiled search with keyset pagination. Returns (invoices, next_cursor)."""
+    stmt = compiled.statement.options(*options) if options else compiled.statement
+    return pagination.paginate_statement(db, stmt, compiled.sort_column, compiled.descending, cursor, limit)
@@ -0,0 +1,342 @@
+# src/app/modules/search/fulltext.py
+"""
+Full-text index over invoices, purchase orders and GRNs.
+
+On SQLite the index is an FTS5 virtual table; when DATABASE_URL points at Postgres it
+is a regular table with a generated tsvector column and a GIN index. Either way it
+holds one row per document with three searchable columns:
+  reference - invoice ID / PO number / GRN number
+  vendor    - vendor and buyer names
+  body      - related PO/GRN numbers, notes, line-item descriptions and SKUs
+Rows are written in the caller's transaction, so the index commits (or rolls back)
+together with the document change that triggered it.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Integer, bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, selectinload
+
+from app.db import models
+
+SQLITE_TABLE = "search_index"
+POSTGRES_TABLE = "search_documents"
+
+DOC_TYPE_INVOICE = "invoice"
+DOC_TYPE_PO = "purchase_order"
+DOC_TYPE_GRN = "grn"
+
+# FTS5 rowids are derived from (doc_type, doc_id) so a document can be replaced
+# without first looking up its row.
+_DOC_TYPE_CODES = {DOC_TYPE_INVOICE: 1, DOC_TYPE_PO: 2, DOC_TYPE_GRN: 3}
+
+DEFAULT_RESULT_LIMIT = 20
+_BACKFILL_BATCH_SIZE = 500
+
+# Set by ensure_search_index(); None means the index has not been created (or the
+# SQLite build lacks FTS5), in which case indexing is skipped and searches are refused.
+_dialect: Optional[str] = None
+
+
+class FullTextUnavailable(RuntimeError):
+    pass
+
+
+def is_available() -> bool:
+    return _dialect is not None
+
+
+# Punctuation is blanked out first: the default parser would read 'INV-012' as 'inv'
+# plus the signed number '-012', so searching for the ID would not find it.
+_PG_TSV_EXPRESSION = """
+    setweight(to_tsvector('simple', regexp_replace(coalesce(reference, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') ||
+    setweight(to_tsvector('simple', regexp_replace(coalesce(vendor, ''), '[^[:alnum:]]+', ' ', 'g')), 'B') ||
+    setweight(to_tsvector('simple', regexp_replace(coalesce(body, ''), '[^[:alnum:]]+', ' ', 'g')), 'C')
+"""
+
+
+def _upgrade_tsv_column(conn):
+    """Recreates a tsv column generated without the punctuation blanking (tables created before it)."""
+    expression = conn.execute(text(
+        "SELECT generation_expression FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table AND column_name = 'tsv'"
+    ), {"table": POSTGRES_TABLE}).scalar()
+    if expression is None or "regexp_replace" in expression:
+        return
+    print(f"Rebuilding the tsvector column of '{POSTGRES_TABLE}' with the current tokenisation...")
+    # Dropping the column drops its GIN index too; the caller recreates it
+    conn.exec_driver_sql(f"ALTER TABLE {POSTGRES_TABLE} DROP COLUMN tsv")
+    conn.exec_driver_sql(
+        f"ALTER TABLE {POSTGRES_TABLE} ADD COLUMN tsv TSVECTOR GENERATED ALWAYS AS ({_PG_TSV_EXPRESSION}) STORED"
+    )
+
+
+def ensure_search_index(engine: Engine):
+    """Creates the full-text table for the current database if it does not exist."""
+    global _dialect
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "postgresql":
+                conn.exec_driver_sql(f"""
+                    CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} (
+                        doc_type VARCHAR(20) NOT NULL,
+                        doc_id INTEGER NOT NULL,
+                        reference TEXT,
+                        vendor TEXT,
+                        body TEXT,
+                        tsv TSVECTOR GENERATED ALWAYS AS ({_PG_TSV_EXPRESSION}) STORED,
+                        PRIMARY KEY (doc_type, doc_id)
+                    )
+                """)
+                _upgrade_tsv_column(conn)
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_tsv ON {POSTGRES_TABLE} USING GIN (tsv)"
+                )
+            elif dialect == "sqlite":
+                conn.exec_driver_sql(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5(
+                        doc_type UNINDEXED, doc_id UNINDEXED, reference, vendor, body,
+                        tokenize = 'unicode61 remove_diacritics 2',
+                        prefix = '2 3'
+                    )
+                """)
+            else:
+                print(f"Warning: Full-text search is not supported on '{dialect}'.")
+                return
+        _dialect = dialect
+    except Exception as e:
+        print(f"Warning: Could not create the full-text search index: {e}")
+
+
+# --- Document text ---
+
+def _line_item_text(line_items: Any) -> List[str]:
+    parts = []
+    for item in line_items or []:
+        if isinstance(item, dict):
+            parts.extend(str(item[key]) for key in ("description", "sku", "po_number") if item.get(key))
+    return parts
+
+
+def _invoice_row(invoice: models.Invoice) -> Dict[str, Any]:
+    # Extracted PO references plus the documents actually linked (matching adds the POs of linked GRNs)
+    po_numbers = list(invoice.related_po_numbers or []) + [po.po_number for po in invoice.purchase_orders]
+    body = list(dict.fromkeys(po_numbers))
+    body += [grn.grn_number for grn in invoice.grns]
+    if invoice.notes:
+        body.append(invoice.notes)
+    body += _line_item_text(invoice.line_items)
+    return {
+        "reference": invoice.invoice_id,
+        "vendor": " ".join(filter(None, [invoice.vendor_name, invoice.buyer_name])),
+        "body": "\n".join(str(part) for part in body),
+    }
+
+
+def _po_row(po: models.PurchaseOrder) -> Dict[str, Any]:
+    return {
+        "reference": po.po_number,
+        "vendor": " ".join(filter(None, [po.vendor_name, po.buyer_name])),
+        "body": "\n".join(_line_item_text(po.line_items)),
+    }
+
+
+def _grn_row(grn: models.GoodsReceiptNote) -> Dict[str, Any]:
+    body = [grn.po_number] if grn.po_number else []
+    body += _line_item_text(grn.line_items)
+    return {
+        "reference": grn.grn_number,
+        "vendor": grn.po.vendor_name if grn.po else None,
+        "body": "\n".join(body),
+    }
+
+
+def _document_row(doc: Any) -> Dict[str, Any]:
+    if isinstance(doc, models.Invoice):
+        row = _invoice_row(doc)
+        row["doc_type"] = DOC_TYPE_INVOICE
+    elif isinstance(doc, models.PurchaseOrder):
+        row = _po_row(doc)
+        row["doc_type"] = DOC_TYPE_PO
+    elif isinstance(doc, models.GoodsReceiptNote):
+        row = _grn_row(doc)
+        row["doc_type"] = DOC_TYPE_GRN
+    else:
+        raise TypeError(f"Cannot index object of type {type(doc).__name__}")
+    row["doc_id"] = doc.id
+    row["rowid"] = doc.id * 4 + _DOC_TYPE_CODES[row["doc_type"]]
+    return row
+
+
+# --- Index maintenance ---
+
+def index_documents(db: Session, docs: Iterable[Any]):
+    """
+    Adds or replaces the index rows for the given invoices, POs and GRNs. New objects
+    are flushed first so they have IDs. Runs in the caller's transaction.
+    """
+    if _dialect is None:
+        return
+    docs = [doc for doc in docs if doc is not None]
+    if not docs:
+        return
+    if any(doc.id is None for doc in docs):
+        db.flush()
+
+    rows = [_document_row(doc) for doc in docs]
+    if _dialect == "sqlite":
+        db.execute(text(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = :rowid"), [{"rowid": r["rowid"]} for r in rows])
+        db.execute(
+            text(f"INSERT INTO {SQLITE_TABLE} (rowid, doc_type, doc_id, reference, vendor, body) "
+                 f"VALUES (:rowid, :doc_type, :doc_id, :reference, :vendor, :body)"),
+            rows
+        )
+    else:
+        db.execute(
+            text(f"INSERT INTO {POSTGRES_TABLE} (doc_type, doc_id, reference, vendor, body) "
+                 f"VALUES (:doc_type, :doc_id, :reference, :vendor, :body) "
+                 f"ON CONFLICT (doc_type, doc_id) DO UPDATE SET "
+                 f"reference = EXCLUDED.reference, vendor = EXCLUDED.vendor, body = EXCLUDED.body"),
+            rows
+        )
+
+
+def index_document(db: Session, doc: Any):
+    index_documents(db, [doc])
+
+
+def remove_documents(db: Session, doc_type: str, doc_ids: Iterable[int]):
+    """Drops index rows, e.g. when documents are deleted or archived."""
+    if _dialect is None:
+        return
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return
+    if _dialect == "sqlite":
+        code = _DOC_TYPE_CODES[doc_type]
+        db.execute(text(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = :rowid"),
+                   [{"rowid": doc_id * 4 + code} for doc_id in doc_ids])
+    else:
+        db.execute(
+            text(f"DELETE FROM {POSTGRES_TABLE} WHERE doc_type = :doc_type AND doc_id IN :doc_ids")
+            .bindparams(bindparam("doc_ids", expanding=True)),
+            {"doc_type": doc_type, "doc_ids": doc_ids}
+        )
+
+
+def clear_index(db: Session):
+    """Removes every row from the index (in the caller's transaction)."""
+    if _dialect is None:
+        return
+    table = SQLITE_TABLE if _dialect == "sqlite" else POSTGRES_TABLE
+    db.execute(text(f"DELETE FROM {table}"))
+
+
+def rebuild_index(db: Session) -> int:
+    """Re-indexes every invoice, PO and GRN. Returns the number of documents indexed."""
+    if _dialect is None:
+        return 0
+    clear_index(db)
+    total = 0
+    for model, links in ((models.PurchaseOrder, ()), (models.GoodsReceiptNote, (models.GoodsReceiptNote.po,)),
+                         (models.Invoice, (models.Invoice.purchase_orders, models.Invoice.grns))):
+        batch = []
+        query = db.query(model).options(*[selectinload(link) for link in links])
+        for doc in query.yield_per(_BACKFILL_BATCH_SIZE):
+            batch.append(doc)
+            if len(batch) >= _BACKFILL_BATCH_SIZE:
+                index_documents(db, batch)
+                total += len(batch)
+                batch = []
+        index_documents(db, batch)
+        total += len(batch)
+    db.commit()
+    return total
+
+
+def backfill_if_empty(db: Session):
+    """Builds the index on startup for databases created before full-text search existed."""
+    if _dialect is None:
+        return
+    table = SQLITE_TABLE if _dialect == "sqlite" else POSTGRES_TABLE
+    if db.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first():
+        return
+    if not db.query(models.Invoice.id).first() and not db.query(models.PurchaseOrder.id).first():
+        return
+    count = rebuild_index(db)
+    print(f"Full-text search index built for {count} document(s).")
+
+
+# --- Querying ---
+
+def _query_tokens(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def build_match_query(query: str) -> str:
+    """
+    Converts free text into a safe backend query: every word must match, and the last
+    word is matched as a prefix so partially typed IDs still hit. Raises ValueError if
+    the text contains no searchable words.
+    """
+    tokens = _query_tokens(query)
+    if not tokens:
+        raise ValueError("Search text must contain at least one letter or digit.")
+    if _dialect == "postgresql":
+        terms = [f"{token}:*" if i == len(tokens) - 1 else token for i, token in enumerate(tokens)]
+        return " & ".join(terms)
+    terms = [f'"{token}"*' if i == len(tokens) - 1 else f'"{token}"' for i, token in enumerate(tokens)]
+    return " ".join(terms)
+
+
+def invoice_match_subquery(param_name: str):
+    """
+    A SELECT of invoice IDs matching the bound full-text query `param_name` (a value
+    produced by build_match_query). Used by the search compiler's `matches` operator.
+    """
+    if _dialect is None:
+        raise FullTextUnavailable("Full-text search is not available on this database.")
+    if _dialect == "sqlite":
+        sql = (f"SELECT doc_id FROM {SQLITE_TABLE} "
+               f"WHERE {SQLITE_TABLE} MATCH :{param_name} AND doc_type = '{DOC_TYPE_INVOICE}'")
+    else:
+        sql = (f"SELECT doc_id FROM {POSTGRES_TABLE} "
+               f"WHERE tsv @@ to_tsquery('simple', :{param_name}) AND doc_type = '{DOC_TYPE_INVOICE}'")
+    return text(sql).bindparams(bindparam(param_name)).columns(doc_id=Integer)
+
+
+def search(db: Session, query: str, doc_types: Optional[List[str]] = None,
+           limit: int = DEFAULT_RESULT_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text search. Matches in the reference column outrank vendor matches,
+    which outrank matches in the body. Returns dicts with doc_type, doc_id, reference,
+    vendor, snippet and score (higher is better).
+    """
+    if _dialect is None:
+        raise FullTextUnavailable("Full-text search is not available on this database.")
+    params: Dict[str, Any] = {"q": build_match_query(query), "limit": limit}
+    type_filter = ""
+    if doc_types:
+        type_filter = "AND doc_type IN :doc_types"
+        params["doc_types"] = list(doc_types)
+
+    if _dialect == "sqlite":
+        sql = (f"SELECT doc_type, doc_id, reference, vendor, "
+               f"snippet({SQLITE_TABLE}, 4, '[', ']', '...', 12) AS snippet, "
+               f"-bm25({SQLITE_TABLE}, 0.0, 0.0, 10.0, 5.0, 1.0) AS score "
+               f"FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH :q {type_filter} "
+               f"ORDER BY score DESC LIMIT :limit")
+    else:
+        sql = (f"SELECT doc_type, doc_id, reference, vendor, "
+               f"ts_headline('simple', coalesce(body, ''), to_tsquery('simple', :q), "
+               f"'StartSel=[, StopSel=], MaxWords=12, MinWords=4') AS snippet, "
+               f"ts_rank(tsv, to_tsquery('simple', :q)) AS score "
+               f"FROM {POSTGRES_TABLE} WHERE tsv @@ to_tsquery('simple', :q) {type_filter} "
+               f"ORDER BY score DESC LIMIT :limit")
+
+    stmt = text(sql)
+    if doc_types:
+        stmt = stmt.bindparams(bindparam("doc_types", expanding=True))
+    return [dict(row._mapping) for row in db.execute(stmt, params)]
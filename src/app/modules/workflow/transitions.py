@@ -0,0 +1,187 @@
+# src/app/modules/workflow/transitions.py
+"""
+Set-based invoice status transitions for the bulk endpoints.
+
+Instead of loading each invoice, mutating it and adding an AuditLog per row, a chunk
+of IDs is moved with one guarded statement:
+
+    UPDATE invoices SET status = :new ... WHERE id IN (...) AND status IN (:allowed)
+    RETURNING id, invoice_id, <previous status>, ...
+
+The guard makes the transition safe against concurrent changes: rows whose status
+moved on in the meantime are simply not updated and are reported as such. Audit
+entries go through the buffered audit sink, so they land in one bulk insert at commit;
+status-change events are published once the caller commits.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.core import domain_events, events, outbox
+from app.db import models
+from app.utils.auditing import log_audit_events
+
+# One UPDATE per chunk; keeps the IN list well under driver parameter limits
+CHUNK_SIZE = 5000
+
+UPDATED = "updated"
+NOT_FOUND = "not_found"
+INVALID_STATUS = "invalid_status"
+
+
+@dataclass
+class TransitionResult:
+    """Outcome of a bulk transition. `rows` holds the RETURNING values of updated invoices."""
+    new_status: models.DocumentStatus
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    outcomes: Dict[int, str] = field(default_factory=dict)
+
+    @property
+    def updated_count(self) -> int:
+        return len(self.rows)
+
+    @property
+    def updated_ids(self) -> List[int]:
+        return [row["id"] for row in self.rows]
+
+
+def _chunks(ids: Sequence[int], size: int) -> Iterable[Sequence[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _guarded_update(db: Session, ids: Sequence[int], new_status: models.DocumentStatus,
+                    previous_status: models.DocumentStatus, values: Dict[str, Any],
+                    returning: Sequence[Any]) -> List[Dict[str, Any]]:
+    """UPDATE ... WHERE id IN (...) AND status = :previous RETURNING ..."""
+    Invoice = models.Invoice
+    stmt = (
+        update(Invoice)
+        .where(Invoice.id.in_(bindparam("chunk_ids", expanding=True)), Invoice.status == previous_status)
+        .values(status=new_status, updated_at=datetime.utcnow(), **values)
+        .returning(Invoice.id, Invoice.invoice_id, Invoice.vendor_name, *returning)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt, {"chunk_ids": list(ids)})
+    return [{**row._mapping, "previous_status": previous_status} for row in rows]
+
+
+def _update_from_snapshot(db: Session, chunk: Sequence[int], new_status: models.DocumentStatus,
+                          allowed_from: Optional[Sequence[models.DocumentStatus]],
+                          values: Dict[str, Any], returning: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Postgres: joins a snapshot of the current statuses in via UPDATE ... FROM, so one
+    statement both guards on and returns each row's previous status.
+    """
+    Invoice = models.Invoice
+    previous = select(Invoice.id, Invoice.status.label("previous_status")).where(
+        Invoice.id.in_(bindparam("chunk_ids", expanding=True))
+    )
+    if allowed_from is not None:
+        previous = previous.where(Invoice.status.in_(allowed_from))
+    previous = previous.with_for_update().subquery("previous")
+
+    stmt = (
+        update(Invoice)
+        .where(Invoice.id == previous.c.id, Invoice.status == previous.c.previous_status)
+        .values(status=new_status, updated_at=datetime.utcnow(), **values)
+        .returning(Invoice.id, Invoice.invoice_id, Invoice.vendor_name, previous.c.previous_status, *returning)
+        .execution_options(synchronize_session=False)
+    )
+    return [dict(row._mapping) for row in db.execute(stmt, {"chunk_ids": list(chunk)})]
+
+
+def _update_chunk(db: Session, chunk: Sequence[int], new_status: models.DocumentStatus,
+                  allowed_from: Optional[Sequence[models.DocumentStatus]],
+                  values: Dict[str, Any], returning: Sequence[Any]) -> List[Dict[str, Any]]:
+    if allowed_from is not None and len(allowed_from) == 1:
+        # The previous status is known up front: a single guarded UPDATE
+        return _guarded_update(db, chunk, new_status, allowed_from[0], values, returning)
+    if db.get_bind().dialect.name == "postgresql":
+        return _update_from_snapshot(db, chunk, new_status, allowed_from, values, returning)
+
+    # SQLite's RETURNING cannot see joined tables, so read the current statuses first
+    # and issue one guarded UPDATE per distinct previous status
+    snapshot = select(models.Invoice.id, models.Invoice.status).where(models.Invoice.id.in_(chunk))
+    if allowed_from is not None:
+        snapshot = snapshot.where(models.Invoice.status.in_(allowed_from))
+    by_status: Dict[models.DocumentStatus, List[int]] = {}
+    for invoice_id, status in db.execute(snapshot):
+        by_status.setdefault(status, []).append(invoice_id)
+
+    rows: List[Dict[str, Any]] = []
+    for previous_status, ids in by_status.items():
+        rows.extend(_guarded_update(db, ids, new_status, previous_status, values, returning))
+    return rows
+
+
+def _classify_misses(db: Session, missed: List[int], outcomes: Dict[int, str]):
+    """Tells 'does not exist' apart from 'was not in an allowed status' for skipped IDs."""
+    existing = set()
+    for chunk in _chunks(missed, CHUNK_SIZE):
+        existing.update(db.scalars(select(models.Invoice.id).where(models.Invoice.id.in_(chunk))))
+    for invoice_id in missed:
+        outcomes[invoice_id] = INVALID_STATUS if invoice_id in existing else NOT_FOUND
+
+
+def transition_invoices(
+    db: Session,
+    invoice_ids: Iterable[int],
+    new_status: models.DocumentStatus,
+    *,
+    allowed_from: Optional[Sequence[models.DocumentStatus]] = None,
+    user: str = "System",
+    action: str = "Status Changed (Bulk)",
+    reason: Optional[str] = None,
+    values: Optional[Dict[str, Any]] = None,
+    returning: Sequence[Any] = (),
+    audit_details: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> TransitionResult:
+    """
+    Moves the given invoices to `new_status`, optionally only those currently in one of
+    `allowed_from`. `values` sets extra columns; `returning` adds columns to the rows
+    reported back. Moving to 'paid' stamps paid_date. The recorded status_changed
+    events drive the downstream reactions (learning from approvals, automation). Does
+    not commit.
+
+    `audit_details(row)` builds each audit entry's details; the default records the
+    from/to statuses and the reason.
+    """
+    ids = list(dict.fromkeys(invoice_ids))
+    values = dict(values or {})
+    if new_status == models.DocumentStatus.paid:
+        values.setdefault("paid_date", datetime.utcnow().date())
+
+    result = TransitionResult(new_status=new_status)
+    for chunk in _chunks(ids, CHUNK_SIZE):
+        result.rows.extend(_update_chunk(db, chunk, new_status, allowed_from, values, returning))
+
+    updated = set(result.updated_ids)
+    missed = [invoice_id for invoice_id in ids if invoice_id not in updated]
+    result.outcomes = {invoice_id: UPDATED for invoice_id in updated}
+    if missed:
+        _classify_misses(db, missed, result.outcomes)
+
+    def default_details(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {'from': row["previous_status"].value, 'to': new_status.value, 'reason': reason}
+
+    make_details = audit_details or default_details
+    log_audit_events(db, [
+        {"invoice_db_id": row["id"], "invoice_id_str": row["invoice_id"], "user": user,
+         "action": action, "details": make_details(row)}
+        for row in result.rows
+    ])
+    for row in result.rows:
+        events.publish_after_commit(db, "invoice.status_changed", {
+            "invoice_db_id": row["id"], "invoice_id": row["invoice_id"],
+            "from": row["previous_status"].value, "to": new_status.value,
+        })
+    # Core UPDATEs bypass the ORM flush hook, so record the outbox events here
+    outbox.record_many(db, [
+        domain_events.status_change_row(row["id"], row["invoice_id"], row["vendor_name"], row["previous_status"], new_status, user)
+        for row in result.rows
+    ])
+    return result
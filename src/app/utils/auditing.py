@@ -1,7 +1,24 @@
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
+from sqlalchemy.orm.util import identity_key
+from typing import Optional, Dict, Any, List
 
 from app.db import models
+from app.db import bulk
+
+# Audit entries are buffered on the session and written in one bulk insert when the
+# session commits, instead of one SELECT + INSERT per entry.
+_BUFFER_KEY = "audit_buffer"
+
+
+def _known_invoice_id(db: Session, invoice_db_id: int) -> Optional[str]:
+    """Returns the invoice's string ID if the invoice is already loaded in the session."""
+    instance = db.identity_map.get(identity_key(models.Invoice, invoice_db_id))
+    if instance is not None:
+        # Read from __dict__ so an expired attribute does not trigger a refresh query
+        return instance.__dict__.get("invoice_id")
+    return None
+
 
 def log_audit_event(
     db: Session,
@@ -10,24 +27,72 @@ def log_audit_event(
     action: str,
     summary: Optional[str] = None,
     details: Optional[Dict[str, Any]] = None,
-    commit: bool = False
+    commit: bool = False,
+    invoice_id_str: Optional[str] = None
 ):
-    """Creates and adds an audit log entry to the database session."""
-    invoice_id_str = db.query(models.Invoice.invoice_id).filter(models.Invoice.id == invoice_db_id).scalar()
-    if not invoice_id_str:
-        print(f"Warning: Audit log for non-existent invoice DB ID {invoice_db_id}")
-        return
-
-    audit_log = models.AuditLog(
-        entity_type='Invoice',
-        entity_id=invoice_id_str,
-        invoice_db_id=invoice_db_id,
-        user=user,
-        action=action,
-        summary=summary,
-        details=details or {}
-    )
-    db.add(audit_log)
+    """
+    Buffers an audit log entry on the session; it is written when the session commits.
+    Pass `invoice_id_str` when the caller already knows it. Otherwise it is taken from
+    the session's loaded Invoice, or resolved for all pending entries in one query at flush.
+    """
+    if invoice_id_str is None:
+        invoice_id_str = _known_invoice_id(db, invoice_db_id)
+    db.info.setdefault(_BUFFER_KEY, []).append({
+        "entity_type": 'Invoice',
+        "entity_id": invoice_id_str,
+        "invoice_db_id": invoice_db_id,
+        "user": user,
+        "action": action,
+        "summary": summary,
+        "details": details or {},
+    })
 
     if commit:
-        db.commit() 
\ No newline at end of file
+        db.commit()
+
+
+def log_audit_events(db: Session, entries: List[Dict[str, Any]]):
+    """
+    Buffers many entries at once. Each entry takes the keyword arguments of
+    log_audit_event (invoice_db_id, user, action, summary, details, invoice_id_str).
+    """
+    for entry in entries:
+        log_audit_event(db, **entry)
+
+
+def _resolve_invoice_ids(db: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    missing = {row["invoice_db_id"] for row in rows if row["entity_id"] is None}
+    if not missing:
+        return rows
+    found = dict(db.query(models.Invoice.id, models.Invoice.invoice_id).filter(models.Invoice.id.in_(missing)).all())
+    resolved = []
+    for row in rows:
+        if row["entity_id"] is None:
+            invoice_id_str = found.get(row["invoice_db_id"])
+            if not invoice_id_str:
+                print(f"Warning: Audit log for non-existent invoice DB ID {row['invoice_db_id']}")
+                continue
+            row["entity_id"] = invoice_id_str
+        resolved.append(row)
+    return resolved
+
+
+def flush_audit_buffer(db: Session) -> int:
+    """Writes the session's buffered audit entries now. Returns the number written."""
+    rows = db.info.pop(_BUFFER_KEY, None)
+    if not rows:
+        return 0
+    return bulk.bulk_insert(db, models.AuditLog, _resolve_invoice_ids(db, rows))
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_on_commit(session: Session):
+    flush_audit_buffer(session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_unflushed(session: Session, transaction):
+    # Anything still buffered when the outermost transaction ends (rollback or close
+    # without commit) belonged to that transaction and must not leak into the next one
+    if transaction.parent is None:
+        session.info.pop(_BUFFER_KEY, None)
@@ -0,0 +1,32 @@
+# src/app/utils/condition_keys.py
+"""
+Hashed keys for JSON condition documents (learned heuristic conditions, automation
+rule conditions).
+
+JSON columns cannot be compared with '=' on Postgres and never use an index, so each
+document is also stored as a short hash of its canonical form: keys sorted, no
+whitespace, and whole-number floats written as integers (10.0 and 10 are the same
+tolerance).
+"""
+import hashlib
+import json
+from typing import Any
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(_normalize(value), sort_keys=True, separators=(",", ":"), default=str)
+
+
+def condition_key(value: Any) -> str:
+    """32 hex characters identifying a condition document."""
+    return hashlib.sha256(canonical_json(value).encode("utf-8")).hexdigest()[:32]
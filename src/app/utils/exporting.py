@@ -0,0 +1,214 @@
+# src/app/utils/exporting.py
+import csv
+import io
+from datetime import date
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import Select
+from sqlalchemy.orm import load_only
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.utils.unit_converter import to_float
+
+# pyarrow is optional; it is only needed for the Parquet export format.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Number of invoices fetched per round-trip, and rows written per output chunk.
+EXPORT_CHUNK_SIZE = 1000
+
+INVOICE_EXPORT_COLUMNS = [
+    'invoice_id', 'vendor_name', 'invoice_date', 'due_date', 'status',
+    'subtotal', 'tax', 'grand_total', 'related_po_numbers'
+]
+
+# Extra columns added when each invoice is exploded into one row per line item.
+LINE_ITEM_EXPORT_COLUMNS = [
+    'line_number', 'description', 'sku', 'po_number', 'quantity', 'unit',
+    'unit_price', 'line_total', 'normalized_qty', 'normalized_unit', 'normalized_unit_price'
+]
+
+_LINE_ITEM_NUMERIC_FIELDS = {'quantity', 'unit_price', 'line_total', 'normalized_qty', 'normalized_unit_price'}
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def _iter_records(stmt: Select, explode_line_items: bool) -> Iterator[Dict[str, Any]]:
+    """
+    Yields one flat record per invoice (or per invoice line item), fetching invoices in
+    chunks from a dedicated session so the full result set is never held in memory.
+    """
+    columns = [getattr(models.Invoice, name) for name in INVOICE_EXPORT_COLUMNS]
+    columns.append(models.Invoice.id)
+    if explode_line_items:
+        columns.append(models.Invoice.line_items)
+    stmt = stmt.options(load_only(*columns)).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+    # The response is streamed after the request's own session has been released,
+    # so the export runs on its own session.
+    db = SessionLocal()
+    try:
+        for inv in db.scalars(stmt):
+            record = {
+                'invoice_id': inv.invoice_id,
+                'vendor_name': inv.vendor_name,
+                'invoice_date': inv.invoice_date,
+                'due_date': inv.due_date,
+                'status': inv.status.value,
+                'subtotal': inv.subtotal,
+                'tax': inv.tax,
+                'grand_total': inv.grand_total,
+                'related_po_numbers': list(inv.related_po_numbers or []),
+            }
+            if not explode_line_items:
+                yield record
+                continue
+
+            line_items = [item for item in (inv.line_items or []) if isinstance(item, dict)]
+            if not line_items:
+                # Keep invoices without line items visible in the export
+                yield {**record, **{name: None for name in LINE_ITEM_EXPORT_COLUMNS}}
+                continue
+            for line_number, item in enumerate(line_items, start=1):
+                line_record = {
+                    'line_number': line_number,
+                    'description': item.get('description'),
+                    'sku': item.get('sku'),
+                    'po_number': item.get('po_number'),
+                    'unit': item.get('unit'),
+                    'normalized_unit': item.get('normalized_unit'),
+                }
+                for field in _LINE_ITEM_NUMERIC_FIELDS:
+                    line_record[field] = to_float(item.get(field))
+                yield {**record, **line_record}
+    finally:
+        db.close()
+
+
+def _export_columns(explode_line_items: bool) -> List[str]:
+    return INVOICE_EXPORT_COLUMNS + (LINE_ITEM_EXPORT_COLUMNS if explode_line_items else [])
+
+
+def stream_invoices_csv(stmt: Select, explode_line_items: bool = False) -> Iterator[bytes]:
+    """Streams the invoices selected by `stmt` as UTF-8 encoded CSV, chunk by chunk."""
+    columns = _export_columns(explode_line_items)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    pending = 0
+    for record in _iter_records(stmt, explode_line_items):
+        row = dict(record)
+        row['related_po_numbers'] = ", ".join(row['related_po_numbers'])
+        writer.writerow([row[name] for name in columns])
+        pending += 1
+        if pending >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file object that hands written bytes back to the caller on demand."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(explode_line_items: bool):
+    fields = [
+        pa.field('invoice_id', pa.string()),
+        pa.field('vendor_name', pa.string()),
+        pa.field('invoice_date', pa.date32()),
+        pa.field('due_date', pa.date32()),
+        pa.field('status', pa.string()),
+        pa.field('subtotal', pa.float64()),
+        pa.field('tax', pa.float64()),
+        pa.field('grand_total', pa.float64()),
+        pa.field('related_po_numbers', pa.list_(pa.string())),
+    ]
+    if explode_line_items:
+        fields += [
+            pa.field('line_number', pa.int32()),
+            pa.field('description', pa.string()),
+            pa.field('sku', pa.string()),
+            pa.field('po_number', pa.string()),
+            pa.field('quantity', pa.float64()),
+            pa.field('unit', pa.string()),
+            pa.field('unit_price', pa.float64()),
+            pa.field('line_total', pa.float64()),
+            pa.field('normalized_qty', pa.float64()),
+            pa.field('normalized_unit', pa.string()),
+            pa.field('normalized_unit_price', pa.float64()),
+        ]
+    return pa.schema(fields)
+
+
+def _parquet_safe(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerces values that may not match the declared Arrow types."""
+    for field in ('subtotal', 'tax', 'grand_total'):
+        record[field] = to_float(record[field])
+    for field in ('invoice_date', 'due_date'):
+        if not isinstance(record[field], date):
+            record[field] = None
+    for field in ('description', 'sku', 'po_number', 'unit', 'normalized_unit'):
+        if field in record and record[field] is not None:
+            record[field] = str(record[field])
+    record['related_po_numbers'] = [str(po) for po in record['related_po_numbers']]
+    return record
+
+
+def stream_invoices_parquet(stmt: Select, explode_line_items: bool = False) -> Iterator[bytes]:
+    """
+    Streams the invoices selected by `stmt` as a Parquet file. Each chunk of invoices
+    becomes one row group, so memory use is bounded by EXPORT_CHUNK_SIZE.
+    Requires the optional `pyarrow` package (check with parquet_available()).
+    """
+    if pa is None:
+        raise RuntimeError("Parquet export requires the optional 'pyarrow' package.")
+
+    schema = _parquet_schema(explode_line_items)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        batch: List[Dict[str, Any]] = []
+        for record in _iter_records(stmt, explode_line_items):
+            batch.append(_parquet_safe(record))
+            if len(batch) >= EXPORT_CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,186 @@
+# src/app/utils/pagination.py
+import base64
+import enum
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, and_, case, func, or_, select
+from sqlalchemy.orm import Session, load_only
+
+from app.db import models
+
+# Response headers used by paginated list endpoints. The body stays a plain list
+# so existing clients keep working; clients that page read the cursor from here.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# Columns needed to render schemas.InvoiceSummary. List views only load these, so the
+# large JSON columns (line_items, match_trace, ai_recommendation) are never fetched.
+INVOICE_SUMMARY_COLUMNS = (
+    models.Invoice.id,
+    models.Invoice.invoice_id,
+    models.Invoice.vendor_name,
+    models.Invoice.grand_total,
+    models.Invoice.status,
+    models.Invoice.invoice_date,
+)
+
+# Columns needed to render schemas.Invoice (used by the search endpoint).
+INVOICE_COLUMNS = INVOICE_SUMMARY_COLUMNS + (
+    models.Invoice.related_po_numbers,
+    models.Invoice.line_items,
+)
+
+
+def invoice_summary_options():
+    """Query option that restricts an Invoice query to the InvoiceSummary columns."""
+    return load_only(*INVOICE_SUMMARY_COLUMNS)
+
+
+def invoice_options():
+    """Query option that restricts an Invoice query to the schemas.Invoice columns."""
+    return load_only(*INVOICE_COLUMNS)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        raise ValueError("Unknown cursor value encoding")
+    return value
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Encodes the (sort key, id) position of the last row of a page as an opaque token."""
+    raw = json.dumps([_encode_value(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Decodes a token produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return _decode_value(sort_value), int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid pagination cursor: {cursor}") from e
+
+
+def apply_keyset(stmt, sort_column, id_column, descending: bool = True,
+                 cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Orders a Query or Select by (sort_column, id) and, when a cursor is given, restricts
+    it to the rows after that position. Rows with a NULL sort key always come last so
+    the ordering is identical on SQLite and Postgres. One extra row is fetched so
+    build_page can tell whether another page exists.
+    """
+    nulls_last = case((sort_column.is_(None), 1), else_=0)
+    if descending:
+        stmt = stmt.order_by(nulls_last, sort_column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(nulls_last, sort_column.asc(), id_column.asc())
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        id_after = id_column < last_id if descending else id_column > last_id
+        if last_value is None:
+            stmt = stmt.where(sort_column.is_(None), id_after)
+        else:
+            value_after = sort_column < last_value if descending else sort_column > last_value
+            stmt = stmt.where(or_(
+                value_after,
+                and_(sort_column == last_value, id_after),
+                sort_column.is_(None),
+            ))
+
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def build_page(rows: List[Any], sort_attr: str, limit: Optional[int]) -> Tuple[List[Any], Optional[str]]:
+    """Trims the look-ahead row from a keyset result and returns (rows, next_cursor)."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_attr), last.id)
+
+
+def paginate_query(query, sort_column, descending: bool = True,
+                   cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Any], Optional[str]]:
+    """Runs an ORM Query with keyset pagination on (sort_column, id)."""
+    id_column = sort_column.class_.id
+    rows = apply_keyset(query, sort_column, id_column, descending, cursor, limit).all()
+    return build_page(rows, sort_column.key, limit)
+
+
+def paginate_statement(db: Session, stmt, sort_column, descending: bool = True,
+                       cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Any], Optional[str]]:
+    """Runs a 2.0-style select() of ORM entities with keyset pagination on (sort_column, id)."""
+    id_column = sort_column.class_.id
+    rows = db.scalars(apply_keyset(stmt, sort_column, id_column, descending, cursor, limit)).all()
+    return build_page(list(rows), sort_column.key, limit)
+
+
+def estimate_total(db: Session, query) -> int:
+    """
+    Returns the number of rows a query would produce, ignoring pagination. On Postgres
+    this is the planner's row estimate, which avoids a full count on large tables;
+    other databases fall back to an exact COUNT(*).
+    """
+    stmt = query.statement if hasattr(query, "statement") else query
+    stmt = stmt.order_by(None).limit(None)
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        try:
+            compiled = stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+            plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}").scalar()
+            if isinstance(plan, str):
+                # asyncpg hands json results back undecoded
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except Exception as e:
+            print(f"Warning: Could not estimate row count from the query plan: {e}")
+    return db.execute(select(func.count()).select_from(stmt.subquery())).scalar() or 0
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int] = None):
+    """Exposes pagination state on the response headers of a list endpoint."""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+
+def paginate_response(db: Session, response: Response, query, sort_column, descending: bool = True,
+                      cursor: Optional[str] = None, limit: Optional[int] = None,
+                      include_total: bool = False) -> List[Any]:
+    """
+    Endpoint helper: runs a keyset-paginated Query or select(), sets the paging headers
+    on the response and returns the rows. Malformed cursors are reported as a 400.
+    """
+    total = estimate_total(db, query) if include_total else None
+    try:
+        if isinstance(query, Select):
+            rows, next_cursor = paginate_statement(db, query, sort_column, descending, cursor, limit)
+        else:
+            rows, next_cursor = paginate_query(query, sort_column, descending, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, next_cursor, total)
+    return rows
@@ -1,5 +1,5 @@
 # src/app/utils/unit_converter.py
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Define our standard base units
 BASE_WEIGHT_UNIT = "kg"
@@ -29,6 +29,15 @@ COUNT_SYNONYMS = {
     'set', 'sets', 'pair', 'pairs', 'pack', 'packs'
 }
 
+def to_float(value: Any) -> Optional[float]:
+    """Coerces LLM-extracted numbers (which are occasionally strings) to float."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 def normalize_item(line_item: Dict[str, Any]) -> Dict[str, Any]:
     """
     Analyzes a line item's quantity and unit, adding normalized fields.
@@ -13,8 +13,8 @@ interface RuleConditions {
 const FIELD_OPTIONS = [
     { value: 'grand_total', label: 'Invoice Total', type: 'number' },
     { value: 'vendor_name', label: 'Vendor Name', type: 'text' },
-    { value: 'line_item_count', label: 'Line Item Count', type: 'number' },
-    // Add more fields as needed, e.g., 'subtotal', 'tax'
+    { value: 'subtotal', label: 'Subtotal', type: 'number' },
+    { value: 'tax', label: 'Tax', type: 'number' },
 ];
 
 const OPERATOR_OPTIONS: Record<string, { value: string; label: string }[]> = {
@@ -1,6 +1,6 @@
 "use client";
 import { useState, useRef, useEffect } from 'react';
-import { type CopilotResponse, postToCopilot } from '@/lib/api';
+import { type CopilotResponse, streamCopilot } from '@/lib/api';
 import { useAppContext } from '@/lib/AppContext';
 import { Bot, User, Loader2, Zap } from 'lucide-react';
 import { Button } from '@/components/ui/Button';
@@ -13,6 +13,7 @@ interface Message {
   content: string;
   data?: unknown | null;
   uiAction?: string;
+  status?: string; // e.g. the tool currently running, while the answer streams
 }
 
 const suggestionChips = [
@@ -46,18 +47,46 @@ export default function CopilotChatInterface() {
         setInput('');
         setIsLoading(true);
 
+        // The bot's reply is appended once its first event arrives and then updated in place
+        const updateReply = (update: (msg: Message) => Message) => {
+            setMessages(prev => {
+                const last = prev[prev.length - 1];
+                return last.sender === 'user'
+                    ? [...prev, update({ sender: 'bot', content: '' })]
+                    : [...prev.slice(0, -1), update(last)];
+            });
+        };
+
+        // Several tools can run at once; the status lists those still running
+        const runningTools = new Map<string, string>();
+        const toolStatus = () =>
+            runningTools.size ? `Running ${Array.from(runningTools.values()).join(', ')}...` : undefined;
+
         try {
-            const response: CopilotResponse = await postToCopilot({ 
+            const response: CopilotResponse = await streamCopilot({ 
                 message: textToSend,
                 current_invoice_id: currentInvoiceId,
+            }, (event) => {
+                if (event.type === 'token') {
+                    updateReply(msg => ({ ...msg, content: msg.content + event.text }));
+                } else if (event.type === 'tool_call.started') {
+                    // Text streamed before a tool call is superseded by the answer that follows it
+                    runningTools.set(event.id, event.tool.replace(/_/g, ' '));
+                    const status = toolStatus();
+                    updateReply(msg => ({ ...msg, content: '', status }));
+                } else if (event.type === 'tool_call.finished') {
+                    runningTools.delete(event.id);
+                    const status = toolStatus();
+                    updateReply(msg => ({ ...msg, status }));
+                } else if (event.type === 'final') {
+                    updateReply(() => ({
+                        sender: 'bot',
+                        content: event.responseText,
+                        data: event.data,
+                        uiAction: event.uiAction
+                    }));
+                }
             });
-            const botMessage: Message = { 
-                sender: 'bot', 
-                content: response.responseText,
-                data: response.data,
-                uiAction: response.uiAction
-            };
-            setMessages(prev => [...prev, botMessage]);
             
             if (response.uiAction === 'SHOW_TOAST_SUCCESS') {
                 toast.success(response.responseText);
@@ -67,7 +96,7 @@ export default function CopilotChatInterface() {
                 sender: 'bot', 
                 content: 'Sorry, I encountered an error. Please try again.' 
             };
-            setMessages(prev => [...prev, errorMessage]);
+            updateReply(() => errorMessage);
             toast.error(`Failed to get response: ${error instanceof Error ? error.message : 'Please try again'}`);
         } finally {
             setIsLoading(false);
@@ -88,11 +117,18 @@ export default function CopilotChatInterface() {
                             {msg.sender === 'bot' && <div className="w-8 h-8 rounded-full bg-blue-primary/10 flex items-center justify-center shrink-0"><Bot className="w-5 h-5 text-blue-primary" /></div>}
                             <div className={`p-4 rounded-lg max-w-2xl ${msg.sender === 'user' ? 'bg-blue-primary text-white' : 'bg-gray-bg border'}`}>
                                 {msg.sender === 'bot' ? (
-                                    <BotMessageRenderer 
-                                        content={msg.content}
-                                        uiAction={msg.uiAction}
-                                        data={msg.data}
-                                    />
+                                    <>
+                                        {msg.status && (
+                                            <p className="text-sm text-gray-dark flex items-center gap-2 mb-2">
+                                                <Loader2 className="w-4 h-4 animate-spin"/>{msg.status}
+                                            </p>
+                                        )}
+                                        <BotMessageRenderer 
+                                            content={msg.content}
+                                            uiAction={msg.uiAction}
+                                            data={msg.data}
+                                        />
+                                    </>
                                 ) : (
                                     <p>{msg.content}</p>
                                 )}
@@ -100,7 +136,7 @@ export default function CopilotChatInterface() {
                             {msg.sender === 'user' && <div className="w-8 h-8 rounded-full bg-gray-light flex items-center justify-center shrink-0"><User className="w-5 h-5 text-gray-dark" /></div>}
                         </div>
                     ))}
-                    {isLoading && (
+                    {isLoading && messages[messages.length - 1]?.sender === 'user' && (
                         <div className="flex items-start gap-4">
                             <div className="w-8 h-8 rounded-full bg-blue-primary/10 flex items-center justify-center shrink-0"><Bot className="w-5 h-5 text-blue-primary" /></div>
                             <div className="p-4 rounded-lg bg-gray-bg border text-gray-dark flex items-center">
@@ -1,7 +1,7 @@
 "use client";
 
 import { useState, useEffect } from "react";
-import { type Job, getJobStatus } from "@/lib/api";
+import { type Job, getJobStatus, subscribeToEvents } from "@/lib/api";
 import { Badge } from "../ui/Badge";
 import { Loader2, CheckCircle, AlertTriangle, FileText, Magnet, ShieldCheck } from "lucide-react";
 import { cn } from "@/lib/utils";
@@ -34,25 +34,49 @@ export const JobProgress = ({ initialJob, onComplete }: JobProgressProps) => {
   const [job, setJob] = useState<Job>(initialJob);
 
   useEffect(() => {
-    let interval: NodeJS.Timeout;
-    if (job.status === "processing" || job.status === "matching") {
-      interval = setInterval(async () => {
-        try {
-          const updatedJob = await getJobStatus(job.id);
-          setJob(updatedJob);
-          if (updatedJob.status === "completed" || updatedJob.status === "failed") {
-            clearInterval(interval);
-            onComplete(updatedJob);
-          }
-        } catch (error) {
-          console.error("Failed to poll job status:", error);
+    let interval: NodeJS.Timeout | undefined;
+    let closeStream: (() => void) | undefined;
+
+    const refresh = async () => {
+      try {
+        const updatedJob = await getJobStatus(job.id);
+        setJob(updatedJob);
+        if (updatedJob.status === "completed" || updatedJob.status === "failed") {
           clearInterval(interval);
+          closeStream?.();
+          onComplete(updatedJob);
+        }
+      } catch (error) {
+        console.error("Failed to poll job status:", error);
+        clearInterval(interval);
+      }
+    };
+
+    if (job.status === "processing" || job.status === "matching") {
+      // Progress is pushed by the server; fall back to polling if the stream is unavailable
+      closeStream = subscribeToEvents(["jobs"], (event) => {
+        if (event.type === "stream.resync") {
+          refresh();
+          return;
+        }
+        if (event.data.job_id !== job.id) return;
+        const status = event.data.status as Job["status"];
+        if (status === "completed" || status === "failed") {
+          refresh(); // Fetch the final summary
+        } else {
+          setJob(prev => ({ ...prev, status, processed_files: event.data.processed_files as number }));
         }
-      }, 2000);
+      }, () => {
+        closeStream?.();
+        if (!interval) interval = setInterval(refresh, 2000);
+      }, refresh);
     } else if (job.status === "completed" || job.status === "failed") {
         onComplete(job);
     }
-    return () => clearInterval(interval);
+    return () => {
+      clearInterval(interval);
+      closeStream?.();
+    };
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [job.id, job.status, onComplete]);
 
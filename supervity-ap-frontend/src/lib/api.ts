@@ -99,6 +99,41 @@ export async function getJobStatus(jobId: number): Promise<Job> {
   return JobSchema.parse(data);
 }
 
+export type ServerEvent = {
+  id: number;
+  type: string;
+  topic: string;
+  data: Record<string, unknown>;
+  ts: string;
+};
+
+/**
+ * Subscribes to the server-push event stream (job progress, invoice status changes,
+ * match completions, notifications).
+ * @param topics - The topics to receive ('jobs', 'invoices', 'notifications').
+ * @param onEvent - Called for every event received.
+ * @param onError - Called if the stream cannot be opened or drops; the browser retries on its own.
+ * @param onOpen - Called once the stream is connected (e.g. to fetch state that changed before it was).
+ * @returns A function that closes the stream.
+ */
+export function subscribeToEvents(
+  topics: string[],
+  onEvent: (event: ServerEvent) => void,
+  onError?: () => void,
+  onOpen?: () => void,
+): () => void {
+  const params = new URLSearchParams();
+  topics.forEach(topic => params.append('topics', topic));
+  const source = new EventSource(`${API_BASE_URL}/events/stream?${params.toString()}`);
+  source.onmessage = () => {}; // Named events only
+  const handler = (e: MessageEvent) => onEvent(JSON.parse(e.data) as ServerEvent);
+  ['job.progress', 'invoice.status_changed', 'invoice.match_completed', 'notification.created', 'stream.resync']
+    .forEach(type => source.addEventListener(type, handler));
+  if (onError) source.onerror = onError;
+  if (onOpen) source.onopen = onOpen;
+  return () => source.close();
+}
+
 /**
  * Fetches a list of recent jobs.
  * @returns An array of job objects.
@@ -493,6 +528,66 @@ export async function postToCopilot(payload: ChatPayload): Promise<CopilotRespon
     return CopilotResponseSchema.parse(data);
 }
 
+export type CopilotStreamEvent =
+    | { type: 'token'; text: string }
+    | { type: 'tool_call.started'; id: string; tool: string; args: Record<string, unknown> }
+    | { type: 'tool_call.finished'; id: string; tool: string; ok: boolean }
+    | ({ type: 'final' } & CopilotResponse);
+
+/**
+ * Sends a message to the Copilot and streams the answer as it is produced.
+ * @param payload - The message and optional context.
+ * @param onEvent - Called for every token and tool call event, and for the final event.
+ * @param signal - Aborts the request (the server stops working on the answer).
+ * @returns The final structured response; its responseText replaces the streamed tokens.
+ */
+export async function streamCopilot(
+    payload: ChatPayload,
+    onEvent: (event: CopilotStreamEvent) => void,
+    signal?: AbortSignal,
+): Promise<CopilotResponse> {
+    const response = await fetch(`${API_BASE_URL}/copilot/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+        signal,
+    });
+
+    if (!response.ok || !response.body) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || "Failed to get response from Copilot.");
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let final: CopilotResponse | null = null;
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line; keep any partial event for the next read
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() ?? '';
+        for (const frame of frames) {
+            const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+            if (!dataLine) continue; // keep-alive comments
+            const event = JSON.parse(dataLine.slice(6)) as CopilotStreamEvent;
+            if (event.type === 'final') {
+                final = CopilotResponseSchema.parse(event);
+            }
+            onEvent(event);
+        }
+    }
+
+    if (!final) {
+        throw new Error("The Copilot stream ended without a response.");
+    }
+    return final;
+}
+
 // --- MODIFIED DASHBOARD SCHEMAS ---
 export const KpiSchema = z.object({
   financial_optimization: z.object({
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The engine is created when app.db.session is imported, so point it at a scratch
+# SQLite file before any test imports the app
+_DB_DIR = tempfile.mkdtemp(prefix="ap-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'ap_test.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture
+def db():
+    from app.db.models import Base
+    from app.db.session import SessionLocal, create_db_and_tables, engine
+
+    create_db_and_tables()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
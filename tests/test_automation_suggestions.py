@@ -0,0 +1,77 @@
+import json
+from datetime import date
+
+from app.api.endpoints import configuration
+from app.core import monitoring_service
+from app.db import models, schemas
+from app.modules.automation import executor
+from app.modules.matching import engine
+
+
+def _po(db):
+    po = models.PurchaseOrder(
+        po_number="PO-1", vendor_name="Acme", order_date=date(2024, 1, 1),
+        line_items=[{"description": "Steel Beam", "ordered_qty": 10, "unit_price": 5.0, "unit": "pcs",
+                     "normalized_qty": 10, "normalized_unit": "pcs", "normalized_unit_price": 5.0}],
+    )
+    db.add(po)
+    return po
+
+
+def _matched_invoice(db, po, invoice_id, unit_price):
+    """An invoice against `po` run through the matching engine; off-price lines fail the price check."""
+    invoice = models.Invoice(
+        invoice_id=invoice_id, vendor_name="Acme", invoice_date=date(2024, 2, 1),
+        subtotal=unit_price * 10, tax=0.0, grand_total=unit_price * 10,
+        line_items=[{"description": "Steel Beam", "quantity": 10, "unit_price": unit_price, "line_total": unit_price * 10,
+                     "unit": "pcs", "normalized_qty": 10, "normalized_unit": "pcs", "normalized_unit_price": unit_price}],
+        status=models.DocumentStatus.ingested,
+    )
+    invoice.purchase_orders.append(po)
+    db.add(invoice)
+    db.commit()
+    engine.run_match_for_invoice(db, invoice.id)
+    return invoice
+
+
+def _accept_suggestion(db):
+    """Creates the rule an unread automation suggestion proposes, as accepting it does."""
+    suggestion = db.query(models.Notification).filter_by(type="AutomationSuggestion", is_read=0).one()
+    args = suggestion.proposed_action["args"]
+    rule = configuration.create_new_automation_rule(schemas.AutomationRuleCreate(
+        rule_name=args["rule_name"],
+        vendor_name=args["vendor_name"],
+        conditions=json.loads(args["condition_json"]),
+        action=args["action"],
+        source="suggested",
+        source_heuristic_key=args["source_heuristic_key"],
+    ), db)
+    suggestion.is_read = 1
+    db.commit()
+    return rule
+
+
+def test_accepted_suggestion_approves_invoices_within_the_learned_tolerance(db):
+    po = _po(db)
+    within = _matched_invoice(db, po, "INV-1", 5.4)  # 8% over the PO price
+    beyond = _matched_invoice(db, po, "INV-2", 6.0)  # 20% over
+    assert within.status == beyond.status == models.DocumentStatus.needs_review
+
+    db.add(models.LearnedHeuristic(
+        vendor_name="Acme", exception_type="PriceMismatchException",
+        learned_condition={"max_variance_percent": 10}, resolution_action="matched",
+        trigger_count=10, confidence_score=0.95,
+    ))
+    db.commit()
+    assert monitoring_service.check_for_automation_suggestions(db) == 1
+    db.commit()
+
+    rule = _accept_suggestion(db)
+    assert rule.source_heuristic_key
+
+    executor.run_automation_engine(db)
+    db.expire_all()
+    assert within.status == models.DocumentStatus.matched
+    assert beyond.status == models.DocumentStatus.needs_review
+    # Not suggested again once a rule exists for the heuristic
+    assert monitoring_service.check_for_automation_suggestions(db) == 0
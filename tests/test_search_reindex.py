@@ -0,0 +1,36 @@
+from datetime import date
+
+from app.db import models
+from app.db.session import engine as db_engine
+from app.modules.matching import engine
+from app.modules.search import fulltext
+
+
+def test_matching_reindexes_invoice_under_the_po_of_its_grn(db):
+    fulltext.ensure_search_index(db_engine)
+    po = models.PurchaseOrder(
+        po_number="PO-777", vendor_name="Acme", order_date=date(2024, 1, 1),
+        line_items=[{"description": "Steel Beam", "ordered_qty": 10, "unit_price": 5.0, "unit": "pcs",
+                     "normalized_qty": 10, "normalized_unit_price": 5.0}],
+    )
+    grn = models.GoodsReceiptNote(
+        grn_number="GRN-777", po_number="PO-777", po=po,
+        line_items=[{"description": "Steel Beam", "received_qty": 10, "unit": "pcs", "normalized_qty": 10}],
+    )
+    # The invoice names no PO; matching links it to the GRN's PO
+    invoice = models.Invoice(
+        invoice_id="INV-1", vendor_name="Acme", invoice_date=date(2024, 2, 1),
+        subtotal=50.0, tax=0.0, grand_total=50.0, related_po_numbers=[],
+        line_items=[{"description": "Steel Beam", "quantity": 10, "unit_price": 5.0, "line_total": 50.0,
+                     "unit": "pcs", "normalized_qty": 10, "normalized_unit_price": 5.0}],
+        status=models.DocumentStatus.ingested,
+    )
+    invoice.grns.append(grn)
+    db.add_all([po, grn, invoice])
+    fulltext.index_documents(db, [po, grn, invoice])
+    db.commit()
+    invoice_hits = lambda: [hit["reference"] for hit in fulltext.search(db, "PO-777", [fulltext.DOC_TYPE_INVOICE])]
+    assert invoice_hits() == []
+
+    engine.run_match_for_invoice(db, invoice.id)
+    assert invoice_hits() == ["INV-1"]